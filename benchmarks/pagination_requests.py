@@ -0,0 +1,106 @@
+"""
+Count the Canvas requests needed to list items: without per_page (the Canvas default),
+with the canvasapi default (a PaginatedList of canvasapi 3.x asks for per_page=100)
+and with the pagination policy on top of that.
+
+Simulated (no Canvas needed):
+    python -m benchmarks.pagination_requests --items 5000
+Live, the files of a course (uses the API key of canvasrobot):
+    python -m benchmarks.pagination_requests --course_id 12345
+"""
+import argparse
+from types import SimpleNamespace
+
+from canvasapi.paginated_list import PaginatedList
+
+from canvasrobot.canvasrobot_model import PAGINATION_POLICY
+from canvasrobot.pagination import apply_pagination_policy, read_ahead
+
+CANVAS_DEFAULT_PER_PAGE = 10  # what Canvas returns if per_page is not asked for
+CANVASAPI_DEFAULT_PER_PAGE = 100  # what a canvasapi (3.x) PaginatedList asks for
+
+
+class SimulatedRequester:
+    """serves a listing of n items like Canvas: Link headers, per_page (max 100)"""
+
+    base_url = "https://canvas.example.com/api/v1/"
+    new_quizzes_url = "https://canvas.example.com/api/quiz/v1/"
+
+    def __init__(self, n: int):
+        self.n = n
+        self.requests = 0
+
+    def request(self, method, endpoint=None, _url=None, **params):
+        self.requests += 1
+        if '?' in endpoint:  # a Link url
+            query = dict(part.split('=') for part in endpoint.split('?')[1].split('&'))
+            page, per_page = int(query['page']), int(query['per_page'])
+        else:
+            page = 1
+            per_page = min(params.get('per_page') or CANVAS_DEFAULT_PER_PAGE, 100)
+        start = (page - 1) * per_page
+        items = [dict(id=i) for i in range(start, min(start + per_page, self.n))]
+        path = endpoint.split('?')[0]
+        links = ({'next': {'url': f"{self.base_url}{path}?page={page + 1}&per_page={per_page}"}}
+                 if start + per_page < self.n else {})
+        return SimpleNamespace(json=lambda: items, links=links)
+
+
+def count_simulated(n: int, policy: dict | None, canvasapi_default: bool = True) -> int:
+    """
+    :param policy: applied to the requester if given
+    :param canvasapi_default: if False the listing does not ask for per_page
+    (like requests made without canvasapi or an old canvasapi)
+    """
+    requester = SimulatedRequester(n)
+    if policy:
+        apply_pagination_policy(requester, policy)
+    listing = PaginatedList(lambda _, attributes: SimpleNamespace(**attributes),
+                            requester, 'GET', 'courses/1/files')
+    if not canvasapi_default:
+        # noinspection PyProtectedMember
+        listing._next_params.pop('per_page', None)
+    assert sum(1 for _ in read_ahead(listing)) == n
+    return requester.requests
+
+
+def count_live(course_id: int, per_page: int) -> int:
+    from canvasrobot import CanvasRobot
+    robot = CanvasRobot()
+    # noinspection PyProtectedMember,PyUnresolvedReferences
+    requester = robot.canvas._Canvas__requester
+    count = SimpleNamespace(requests=0)
+    request = requester.request
+
+    def counting_request(*args, **kwargs):
+        count.requests += 1
+        return request(*args, **kwargs)
+
+    requester.request = counting_request
+    items = sum(1 for _ in read_ahead(robot.canvas.get_course(course_id).get_files(per_page=per_page)))
+    print(f"  {items} files")
+    return count.requests - 1  # without get_course
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000, help="size of the simulated listing")
+    parser.add_argument('--course_id', type=int, default=0, help="count the requests for the files of this course")
+    args = parser.parse_args()
+    if args.course_id:
+        for per_page in (CANVAS_DEFAULT_PER_PAGE, CANVASAPI_DEFAULT_PER_PAGE):
+            print(f"per_page={per_page}: {count_live(args.course_id, per_page)} requests")
+        return
+    print(f"Listing {args.items} items:")
+    print(f"  no per_page (Canvas default {CANVAS_DEFAULT_PER_PAGE}): "
+          f"{count_simulated(args.items, policy=None, canvasapi_default=False)} requests")
+    print(f"  canvasapi default (per_page={CANVASAPI_DEFAULT_PER_PAGE}): "
+          f"{count_simulated(args.items, policy=None)} requests")
+    print(f"  canvasapi default and pagination policy (files={PAGINATION_POLICY['files']}): "
+          f"{count_simulated(args.items, policy=PAGINATION_POLICY)} requests")
+    print(f"  no per_page and pagination policy: "
+          f"{count_simulated(args.items, policy=PAGINATION_POLICY, canvasapi_default=False)} requests")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Asyncio client for the Canvas endpoints the robot uses in bulk (courses, pages,
+modules and items, files, folders, enrollments, users and profiles).
+Many requests are in flight at the same time, all share one rate limiter.
+Results are the plain JSON dicts of the Canvas API; wrap them in canvasapi objects,
+like Page(requester, attributes), when their (sync) methods are needed, like edit().
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator
+
+import httpx
+
+from .pagination import policy_per_page
+
+RETRY_STATUS = (403, 429, 502, 503)  # Canvas reports 'Rate Limit Exceeded' as a 403
+MAX_RETRIES = 4
+
+
+class AsyncRateLimiter:
+    """allow at most `rate` requests per second, shared by all tasks"""
+
+    def __init__(self, rate: float = 10.0):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = time.monotonic()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(self.next_slot, now)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncCanvas:
+
+    def __init__(self, url: str, api_key: str,
+                 rate: float = 10.0,
+                 max_in_flight: int = 100,
+                 per_page: int = 100,
+                 policy: dict[str, int] | None = None,
+                 timeout: float = 60,
+                 backoff: float = 1.0,
+                 transport: httpx.AsyncBaseTransport | None = None):
+        """
+        use as async context manager: async with AsyncCanvas(url, key) as canvas: ...
+        :param url: like https://[name].instructure.com
+        :param api_key: Canvas API key
+        :param rate: requests per second (started), shared by all tasks
+        :param max_in_flight: requests waiting for a response at the same time
+        :param per_page: page size of the listings not in the policy
+        :param policy: page size per listing, see PAGINATION_POLICY
+        :param timeout: per request, in seconds
+        :param backoff: seconds before the first retry, doubled for each next one
+        :param transport: httpx transport, like httpx.MockTransport in the tests
+        """
+        self.base_url = url.rstrip('/') + '/api/v1/'
+        self.api_key = api_key
+        self.limiter = AsyncRateLimiter(rate)
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.max_in_flight = max_in_flight
+        self.per_page = per_page
+        self.policy = policy or {}
+        self.timeout = timeout
+        self.backoff = backoff
+        self.transport = transport
+        self.client: httpx.AsyncClient | None = None
+        self.requests = 0  # count, for reports and benchmarks
+
+    async def __aenter__(self) -> 'AsyncCanvas':
+        self.client = httpx.AsyncClient(base_url=self.base_url,
+                                        headers={'Authorization': f"Bearer {self.api_key}"},
+                                        limits=httpx.Limits(max_connections=self.max_in_flight),
+                                        timeout=self.timeout,
+                                        transport=self.transport)
+        return self
+
+    async def __aexit__(self, *args):
+        await self.client.aclose()
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """a Canvas request, retried (with backoff) if Canvas throttles or is unavailable"""
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.wait()
+            async with self.in_flight:
+                self.requests += 1
+                response = await self.client.request(method, path, **kwargs)
+            if response.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                break
+            if response.status_code == 403 and 'Rate Limit Exceeded' not in response.text:
+                break  # a real 'forbidden'
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+        response.raise_for_status()
+        return response
+
+    async def get(self, path: str, **params) -> Any:
+        return (await self.request('GET', path, params=params)).json()
+
+    async def put(self, path: str, data: dict) -> Any:
+        return (await self.request('PUT', path, json=data)).json()
+
+    async def paginate(self, path: str, **params) -> AsyncIterator[dict]:
+        """the items of a listing, following the Link rel="next" headers"""
+        params.setdefault('per_page', policy_per_page(self.policy, path) or self.per_page)
+        response = await self.request('GET', path, params=params)
+        while True:
+            for item in response.json():
+                yield item
+            next_link = response.links.get('next')
+            if not next_link:
+                return
+            response = await self.request('GET', next_link['url'])
+
+    async def get_list(self, path: str, **params) -> list[dict]:
+        return [item async for item in self.paginate(path, **params)]
+
+    # the endpoints ------------------------------------------------
+    def get_courses(self, account_id: int | None = None, **params) -> AsyncIterator[dict]:
+        """courses of the account (sub-admin) or else of the current user"""
+        path = f"accounts/{account_id}/courses" if account_id else "courses"
+        return self.paginate(path, **params)
+
+    async def get_course(self, course_id: int, **params) -> dict:
+        return await self.get(f"courses/{course_id}", **params)
+
+    async def get_pages(self, course_id: int, include_body: bool = False) -> list[dict]:
+        params = {'include[]': ['body']} if include_body else {}
+        return await self.get_list(f"courses/{course_id}/pages", **params)
+
+    async def get_page(self, course_id: int, url: str) -> dict:
+        return await self.get(f"courses/{course_id}/pages/{url}")
+
+    async def update_page(self, course_id: int, url: str, body: str) -> dict:
+        return await self.put(f"courses/{course_id}/pages/{url}", dict(wiki_page=dict(body=body)))
+
+    async def get_modules(self, course_id: int) -> list[dict]:
+        return await self.get_list(f"courses/{course_id}/modules")
+
+    async def get_module_items(self, course_id: int, module_id: int) -> list[dict]:
+        return await self.get_list(f"courses/{course_id}/modules/{module_id}/items")
+
+    async def get_files(self, course_id: int) -> list[dict]:
+        return await self.get_list(f"courses/{course_id}/files")
+
+    async def get_folders(self, course_id: int) -> list[dict]:
+        return await self.get_list(f"courses/{course_id}/folders")
+
+    async def get_enrollments(self, course_id: int, **params) -> list[dict]:
+        return await self.get_list(f"courses/{course_id}/enrollments", **params)
+
+    async def get_users(self, course_id: int, **params) -> list[dict]:
+        return await self.get_list(f"courses/{course_id}/users", **params)
+
+    async def get_profile(self, user_id: int) -> dict:
+        return await self.get(f"users/{user_id}/profile")
+
@@ -1,5 +1,6 @@
-import typing
-import io
+import asyncio
+from contextlib import nullcontext
+from functools import cached_property
 import json
 import mimetypes
 import csv
@@ -7,8 +8,10 @@ from pathlib import Path
 from urllib.parse import unquote_plus
 import os
 import re
-from collections import namedtuple
-from datetime import datetime, timezone
+import threading
+from collections import namedtuple, OrderedDict
+from typing import Callable, Iterator
+from datetime import datetime, timedelta, timezone
 import bs4
 import pytz
 import logging
@@ -22,6 +25,7 @@ from attrs import define, asdict
 from cattrs import structure
 import canvasapi
 import requests
+import httpx
 
 # from functools import lru_cache
 try:  # type: ignore
@@ -47,8 +51,21 @@ from .canvasrobot_model import (CourseId,
                                 Field,  # noqa: F401
                                 AC_YEAR, NEXT_YEAR,  # type: ignore
                                 COMMUNITIES, LocalDAL, CanvasConfig,
-                                EXAMINATION_FOLDER, CommunityManager)  # type: ignore
-from .entities import User, QuestionDTO, CourseMetadata, Grade, ExaminationDTO, Stats  # type: ignore
+                                EXAMINATION_FOLDER, CommunityManager,
+                                MAX_WORKERS, MAX_REQUESTS_PER_SECOND, MAX_IN_FLIGHT,
+                                PAGINATION_POLICY, COURSE_LISTING_INCLUDE,
+                                COURSE_CACHE_TTL, MAX_FOLDER_INDEXES)  # type: ignore
+from .entities import (User, QuestionDTO, CourseMetadata, Grade, ExaminationDTO, Stats,  # type: ignore
+                       EnrollmentDiff, CourseRecord, PageRecord, ModuleRecord, ModuleItemRecord)
+from .throttle import RateLimiter, run_throttled
+from .pagination import read_ahead, apply_pagination_policy
+from .user_cache import UserCache, user_attributes
+from .quiz_builder import QuizBuilder
+from .downloader import Downloader, DOWNLOAD_CHUNK_SIZE
+from .file_store import FileStore, StoreProblem
+from .search import SearchEngine, SearchReport, PageHit
+from .async_client import AsyncCanvas
+from . import course_stats
 
 
 class CustomConsole(Console):
@@ -140,6 +157,13 @@ class Course2Foldername:
     folder_name: str
 
 
+@define
+class FilesTabVisibility:
+    course_id: int
+    course_name: str
+    visibility: str
+
+
 if MEMCACHED:
     try:
         MEMCACHED = base.Client(('localhost', 11211),
@@ -154,26 +178,155 @@ if MEMCACHED:
 
 # noinspection PyCallingNonCallable,GrazieInspection
 
-def course_get_folder(course, folder_name: str):
+class CourseFolderIndex:
+    """all folders of a course, listed once, to be queried by exact name,
+    name variant (postfix) and lock state"""
+
+    def __init__(self, course):
+        self.course_id = course.id
+        self.folders = list(course.get_folders())  # paginated, once
+
+    def by_full_name(self, full_name: str):
+        """:returns folder with this full_name (like 'course files/Tentamens') or None"""
+        for folder in self.folders:
+            if folder.full_name == full_name:
+                return folder
+        return None
+
+    def ending_with(self, folder_name: str):
+        """:returns first folder with a full_name ending with folder_name or None"""
+        for folder in self.folders:
+            if folder.full_name.endswith(folder_name):
+                return folder
+        return None
+
+    def exact(self, foldername: str) -> list:
+        """:returns the top level folder(s) named foldername"""
+        return [folder for folder in self.folders
+                if f"course files/{foldername}" == folder.full_name]
+
+    def variants(self, foldername: str) -> list:
+        """:returns the top level folders named foldername, with possible postfixes like
+        'Tentamens 2020' but not 'Tentamens/inner'"""
+        # noinspection RegExpRedundantEscape
+        pattern = re.compile(fr'^course files\/{foldername}(?!.*\/.*$)')
+        return [folder for folder in self.folders
+                if pattern.match(folder.full_name)]
+
+    def unlocked(self) -> list:
+        return [folder for folder in self.folders if not folder.locked]
+
+
+def course_get_folder(course, folder_name: str, folder_index: CourseFolderIndex = None):
     """"
     :course     Canvas course object
     :foldername Nane of the folder
+    :folder_index if supplied use this listing of the course folders
     :returns    Canvas folder object
 
      """
-    folders = course.get_folders()
-    for folder in list(folders):
-        if folder.full_name.endswith(folder_name):
-            return folder
-    return None
+    folder_index = folder_index or CourseFolderIndex(course)
+    return folder_index.ending_with(folder_name)
+
 
+def walk_folder_tree(folder, max_workers: int = 8, limiter: RateLimiter | None = None):
+    """
+    breadth first walk of a Canvas folder tree. The folders of one level are
+    listed concurrently (subfolders and files)
+    :param folder: Canvas folder object, the top of the tree
+    :param max_workers: size of the thread pool
+    :param limiter: shared rate limiter
+    :returns generator of (folder, list of files in this folder), top folder first
+    """
 
-def course_metadata_memcached(course_id: int, canvas, ignore_assignment_names=None) -> CourseMetadata:
+    def list_folder(folder_):
+        return list(folder_.get_folders()), list(folder_.get_files())
+
+    level = [folder]
+    while level:
+        next_level = []
+        for folder_, listing, error in run_throttled(list_folder, level,
+                                                     max_workers=max_workers,
+                                                     limiter=limiter):
+            if error:
+                logger.error(f"Listing folder '{folder_.full_name}' failed: {error}")
+                continue
+            subfolders, files = listing
+            yield folder_, files
+            next_level.extend(subfolders)
+        level = next_level
+
+
+def iter_course_pages_module_items(course,
+                                   pages: bool = True,
+                                   include_body: bool = True,
+                                   module_items: bool = True,
+                                   max_workers: int = 1,
+                                   limiter: RateLimiter | None = None
+                                   ) -> Iterator[PageRecord | ModuleRecord | ModuleItemRecord]:
+    """
+    stream the pages (without 'UVT' templates) and then the modules of a course, each
+    module followed by its items, as soon as they are received
+    :param course: Canvas course object
+    :param pages: include the pages
+    :param include_body: get the page bodies
+    :param module_items: include the modules and their items
+    :param max_workers: if > 1 the items of that many modules are fetched at the same time
+    :param limiter: shared rate limiter
+    :returns generator of PageRecord, ModuleRecord and ModuleItemRecord
+    """
+    if pages:
+        kwargs = dict(include=['body']) if include_body else {}
+        for page in course.get_pages(**kwargs):
+            if page.title[0:3] == 'UVT':  # skip (some) templates ?
+                continue
+            yield PageRecord(course_id=course.id,
+                             page_id=page.page_id,
+                             title=page.title,
+                             url=page.url,
+                             html_url=page.html_url,
+                             body=getattr(page, 'body', None),
+                             page=page)
+    if not module_items:
+        return
+
+    def list_items(module):
+        return list(module.get_module_items())
+
+    for module, items, error in run_throttled(list_items, course.get_modules(),
+                                              max_workers=max_workers,
+                                              limiter=limiter):
+        if error:
+            raise error
+        yield ModuleRecord(course_id=course.id,
+                           module_id=module.id,
+                           name=module.name,
+                           items_count=module.items_count,
+                           module=module)
+        for item in items:
+            yield ModuleItemRecord(course_id=course.id,
+                                   module_id=module.id,
+                                   item_id=item.id,
+                                   type=item.type,
+                                   title=item.title,
+                                   external_url=getattr(item, 'external_url', None),
+                                   item=item)
+
+
+def course_metadata_memcached(course_id: int, canvas, ignore_assignment_names=None,
+                              max_workers: int = MAX_WORKERS,
+                              limiter: RateLimiter | None = None,
+                              get_folder_index: Callable[[Course], CourseFolderIndex] | None = None
+                              ) -> CourseMetadata:
     """
     for course get the metadata from memcached if available. return CourseMetadata instance
     :param course_id
     :param canvas the canvas api object
     :param ignore_assignment_names a list of assignment_names to ignore in/for the db
+    :param max_workers: size of the thread pool for the module items
+    :param limiter: shared rate limiter
+    :param get_folder_index: returns the (shared) folder index of a course, like
+    CanvasRobot.get_folder_index. If None the folders are listed for this call only
     :returns Course metadata instance
     """
     ignore_assignment_names = ignore_assignment_names or []
@@ -192,18 +345,20 @@ def course_metadata_memcached(course_id: int, canvas, ignore_assignment_names=No
         :returns a course metadata object
         """
         course = canvas.get_course(course_id)
-        modules = course.get_modules()
-        nr_modules = len(list(modules))
+        nr_modules = 0
         nr_module_items = 0
         nr_ext_urls = 0
-        for module in modules:
-            module_items = module.get_module_items()
-            item_count_ext_url = filter(lambda i: i.type == "ExternalUrl", module_items)
-            nr_ext_urls += len(list(item_count_ext_url))
-            nr_module_items += module.items_count
-        pages = course.get_pages()
-        pages = filter(lambda p: p.title[0:3] != 'UVT', pages)
-        nr_pages = len(list(pages))
+        nr_pages = 0
+        # one pass over pages (without bodies) and modules
+        for record in iter_course_pages_module_items(course, include_body=False,
+                                                     max_workers=max_workers, limiter=limiter):
+            if isinstance(record, PageRecord):
+                nr_pages += 1
+            elif isinstance(record, ModuleRecord):
+                nr_modules += 1
+                nr_module_items += record.items_count
+            elif record.type == "ExternalUrl":
+                nr_ext_urls += 1
 
         assignments = course.get_assignments()
         assignments_summary = "Assignments:\n" if list(assignments) \
@@ -262,7 +417,8 @@ def course_metadata_memcached(course_id: int, canvas, ignore_assignment_names=No
 
         # check for uploaded examination files
         examination_files = 0
-        examination_folder = course_get_folder(course, EXAMINATION_FOLDER)
+        examination_folder = course_get_folder(course, EXAMINATION_FOLDER,
+                                               get_folder_index(course) if get_folder_index else None)
         examinations_summary = "" if examination_folder \
             else f"No folder {EXAMINATION_FOLDER}"
         if examination_folder:
@@ -310,11 +466,13 @@ def course_metadata_memcached(course_id: int, canvas, ignore_assignment_names=No
 # noinspection PyTypeChecker,PyCallingNonCallable
 class CanvasRobot(object):
     """" uses caching since """
-    db: typing.Callable
     canvas_login: bool = False
     TOT_WEIGHT: int = 100
     _year: int = AC_YEAR  # the current academic year
     outliner_foldernames: list[Course2Foldername] = []
+    # creation of the lazy db and user cache, which workers of a thread pool can trigger
+    # (cached_property has no lock since Python 3.12). Reentrant: the user cache uses the db
+    _lazy_lock = threading.RLock()
 
     def __init__(self,
                  reset_api_keys: bool = False,
@@ -335,63 +493,135 @@ class CanvasRobot(object):
         self.console = console or CustomConsole()  # for commandline use
         self.gui_root = gui_root  # tkinter root
         self.is_debug = is_debug
+        # shared by all concurrent Canvas requests of this robot
+        self.max_workers = MAX_WORKERS
+        self.rate_limiter = RateLimiter(MAX_REQUESTS_PER_SECOND)
+        self.pagination_policy = dict(PAGINATION_POLICY)  # per_page of each listing
+        self.folder_indexes: OrderedDict[int, CourseFolderIndex] = OrderedDict()  # per course_id, LRU
+        self.folder_indexes_lock = threading.Lock()  # used by concurrent course workers
+        self.course_tabs: dict[int, dict] = {}  # per course_id: tabs by label
         # Create from existing data
         self.community_manager = CommunityManager.from_legacy_communities(COMMUNITIES)
 
         self.db_folder = db_folder if db_folder else Path.cwd() / 'databases'
-        self.db = LocalDAL(is_testing=is_testing,
-                           fake_migrate_all=fake_migrate_all,
-                           folder=self.db_folder)
+        # the local database, the Canvas connection and the admin account are
+        # created on first use (see the lazy properties below), so commands
+        # which need none of them start fast
+        self.reset_api_keys = reset_api_keys
+        self.is_testing = is_testing
+        self.fake_migrate_all = fake_migrate_all
+        self.db_auto_update = db_auto_update
+        self.db_force_update = db_force_update
+        self.last_db_update = None
+
+        if db_force_update:
+            self.update_database_from_canvas()
+
+        self.internal_id = None
+        logger.info("Canvasrobot instance created")
+
+    # LAZY RESOURCES ----------------------------------------
+    @cached_property
+    def db(self) -> LocalDAL:
+        """the local database, migrated on first use. If db_auto_update
+        was requested, check if an update is due right after creation
+        (not if db_force_update: that update is the one using it)"""
+        with self._lazy_lock:
+            if 'db' in self.__dict__:  # created by another thread meanwhile
+                return self.__dict__['db']
+            db = LocalDAL(is_testing=self.is_testing,
+                          fake_migrate_all=self.fake_migrate_all,
+                          folder=self.db_folder)
+            self.define_extra_tables(db)
+            # store first: update_database_from_canvas() uses self.db too
+            self.__dict__['db'] = db
+            if self.db_auto_update and not self.db_force_update:
+                self.auto_update_db(db)
+            return db
+
+    def define_extra_tables(self, db: LocalDAL):
+        """hook for subclasses to define their own tables in a
+        freshly created database"""
+        pass
+
+    def auto_update_db(self, db: LocalDAL):
+        """ update the database from Canvas if the last update is more than 3 days ago"""
+        row = db(db.setting.id == 1).select().first()
+        self.last_db_update = row.last_db_update if row else datetime(1, 1, 1,
+                                                                      tzinfo=timezone.utc)
+        now = datetime.now(timezone.utc)
+        utc_timezone = pytz.timezone('UTC')
+        if getattr(self.last_db_update, 'tzinfo') is None:
+            self.last_db_update = utc_timezone.localize(self.last_db_update).astimezone(utc_timezone)
+        try:
+            delta = now - self.last_db_update
+        except (TypeError, Exception) as _:
+            pass
+        else:
+            if delta.days > 3:
+                self.update_database_from_canvas()
+
+    @cached_property
+    def config(self) -> CanvasConfig:
+        """url, api key and admin_id from the keyring (asks for missing values)"""
+        return CanvasConfig(reset_api_keys=self.reset_api_keys, gui_root=self.gui_root)
+
+    @property
+    def canvas_url(self) -> str:
+        return self.config.url
 
-        config = CanvasConfig(reset_api_keys=reset_api_keys, gui_root=gui_root)
+    @cached_property
+    def canvas(self):
+        """the canvasapi Canvas object, None if login failed"""
+        config = self.config
         try:
-            self.canvas = canvasapi.Canvas(config.url, config.api_key)
-            self.canvas_url = config.url
+            canvas = canvasapi.Canvas(config.url, config.api_key)
         except (canvasapi.exceptions.Forbidden, ConnectionError) as e:
             msg = f"login Canvas failed ({e}) Connection trouble or wrong API key?"
             self.console.log(msg)
             self.errors.append(msg)
             self.canvas_login = False
-        else:
-            if not self.canvas:
-                msg = "login Canvas failed"
-                self.console.log(msg)
-                self.errors.append(msg)
-                self.canvas_login = False
+            return None
+        if not canvas:
+            msg = "login Canvas failed"
+            self.console.log(msg)
+            self.errors.append(msg)
+            self.canvas_login = False
+            return canvas
+        # noinspection PyProtectedMember,PyUnresolvedReferences
+        apply_pagination_policy(canvas._Canvas__requester, self.pagination_policy)
+        return canvas
+
+    @cached_property
+    def admin_id(self) -> int | None:
         try:
-            self.admin_id = int(config.admin_id)
-            self.admin = self.canvas.get_account(config.admin_id) if config.admin_id \
-                else None
-        except (canvasapi.exceptions.Forbidden, ConnectionError, Exception) as e:
-            self.admin_id = None
-            self.admin = None
-            self.console.log(f"Warning {e} no admin account in config or no rights on {config.admin_id}?")
+            return int(self.config.admin_id)
+        except (TypeError, ValueError) as e:
+            self.console.log(f"Warning {e} no (valid) admin_id in config")
+            return None
 
-        db = self.db
+    @cached_property
+    def admin(self):
+        """the Canvas admin account (None if no admin_id or no rights)"""
+        if not self.admin_id:
+            return None
+        try:
+            return self.canvas.get_account(self.admin_id)
+        except (canvasapi.exceptions.Forbidden, ConnectionError, Exception) as e:
+            self.console.log(f"Warning {e} no admin account in config or no rights on {self.admin_id}?")
+            return None
 
-        if db_force_update:
-            self.update_database_from_canvas()
-        elif db_auto_update:
-            # is an update needed?
-            row = db(db.setting.id == 1).select().first()
-            self.last_db_update = row.last_db_update if row else datetime(1, 1, 1,
-                                                                          tzinfo=timezone.utc)
-            now = datetime.now(timezone.utc)
-            utc_timezone = pytz.timezone('UTC')
-            if getattr(self.last_db_update, 'tzinfo') is None:
-                self.last_db_update = utc_timezone.localize(self.last_db_update).astimezone(utc_timezone)
-            try:
-                delta = now - self.last_db_update
-            except (TypeError, Exception) as _:
-                pass
-            else:
-                if db_auto_update and delta.days > 3:
-                    self.update_database_from_canvas()
+    @cached_property
+    def teacher_ids(self) -> list[int]:
+        return self.lookup_teachers_db()
 
-        self.teacher_ids = self.lookup_teachers_db()
-
-        self.internal_id = None
-        logger.info("Canvasrobot instance created")
+    @cached_property
+    def user_cache(self) -> UserCache:
+        """users and profiles, persisted in the db table user_cache"""
+        with self._lazy_lock:
+            if 'user_cache' not in self.__dict__:  # else created by another thread meanwhile
+                self.__dict__['user_cache'] = UserCache(self.db)
+            return self.__dict__['user_cache']
 
     @property
     def year(self):
@@ -457,13 +687,15 @@ class CanvasRobot(object):
     def get_courses_in_account(self,
                                by_teachers: list | None = None,
                                this_year=True,
-                               admin_id: int | None = None):
+                               admin_id: int | None = None,
+                               refresh_course_ids: bool = False):
         """
         get all courses from canvas connected to an account.
 
         :param by_teachers: list of teacher id's
         :param this_year: True=filter courses to include only the current year
         :param admin_id: if given use instead of default admin from config
+        :param refresh_course_ids: without rights on the account: harvest the course ids again
         :returns a list of courses
         """
         console = self.console
@@ -481,11 +713,11 @@ class CanvasRobot(object):
             if admin_id == self.admin.id:  # TST (owner)
                 # admin = self.canvas.get_account(int(admin_id))  # no...
                 courses = self.admin.get_courses(by_subaccounts=[admin_id],
-                                                 include=["term", "teachers"])
+                                                 include=COURSE_LISTING_INCLUDE)
             else:  # includes admin_id = 0, 20, ...
                 courses = self.admin.get_courses(by_subaccounts=[admin_id],
                                                  by_teachers=by_teachers,
-                                                 include=["term", "teachers"])
+                                                 include=COURSE_LISTING_INCLUDE)
                 # no rights note that `course.account_id = 25` for (some of? all of?) the courses
                 # with ids
                 # harvested with admin_id = 20
@@ -494,7 +726,9 @@ class CanvasRobot(object):
                     # use a csv file with course_ids instead
                     console.log(f"No courses found using for admin {admin_id} access through Canvas "
                                 f"(possibly no rights). Using ids from local CSV file instead...")
-                    courses = self.get_courses_admin_csv(admin_id)
+                    courses = self.hydrate_courses([course.id for course in
+                                                     self.get_courses_admin_csv(admin_id,
+                                                                                refresh=refresh_course_ids)])
 
             total = len(list(courses))
             progress.remove_task(task_count)
@@ -508,7 +742,7 @@ class CanvasRobot(object):
                 if not hasattr(course, 'term'):
                     course = self.canvas.get_course(course.id,
                                                     by_teachers=by_teachers,
-                                                    include=["term", "teachers"])
+                                                    include=COURSE_LISTING_INCLUDE)
                 if this_year and (str(course.term["name"])[:4] != str(self.year)
                                   or course.name.endswith('conclude')):
                     continue
@@ -518,13 +752,20 @@ class CanvasRobot(object):
                       )
         return filtered_courses
 
-    def get_courses_admin_csv(self, admin_id):
-        # get ids, create a scarce list (only course.id attribute), needs a local csv file
+    def get_courses_admin_csv(self, admin_id, refresh: bool = False):
+        """
+        get ids, create a scarce list (only course.id attribute), from a local csv file.
+        A missing csv file is created by harvest_course_ids
+        :param refresh: harvest again, new course ids are added to the csv file
+        """
         courses = []
         csv_path = Path(self.db_folder) / f"course_ids_admin{admin_id}.csv"
+        if refresh or not csv_path.exists():
+            self.console.log(f"Harvesting the course_ids for {admin_id=} in {csv_path}...")
+            self.write_course_ids_csv(csv_path, self.harvest_course_ids(admin_id))
         if not csv_path.exists():
             self.console.log(f" Missing csv file {csv_path} with course_ids, "
-                             f"please use scraping tooled to create it using {admin_id=} as admin_id. .")
+                             f"no courses found for {admin_id=}.")
             raise FileNotFoundError(f"Missing for {admin_id=}:{csv_path}")
 
         with open(csv_path, mode='r') as csv_file:
@@ -535,6 +776,95 @@ class CanvasRobot(object):
                 courses.append(course)
         return courses
 
+    def harvest_course_ids(self, admin_id: int) -> list[int]:
+        """
+        the ids of the courses of account admin_id and its sub-accounts our token
+        can reach, using the API:
+        - with rights on the account: the course listings of the account and its
+          sub-accounts, requested concurrently
+        - always: the courses the current user is enrolled in (canvas.get_courses())
+          of the account or one of the listed sub-accounts
+        Without account rights (the reason for the csv) only the enrollments of the
+        user are found, and courses in sub-accounts not at all (their ids are unknown).
+        The csv file keeps the ids collected earlier (see write_course_ids_csv)
+        :returns sorted course ids"""
+        account_ids = {int(admin_id)}
+        try:
+            account = canvasapi.account.Account(self.requester, dict(id=admin_id))
+            account_ids |= {sub_account.id for sub_account in account.get_subaccounts(recursive=True)}
+        except (canvasapi.exceptions.Forbidden, canvasapi.exceptions.ResourceDoesNotExist) as e:
+            logger.info(f"No sub-accounts of {admin_id=}: {e}")
+
+        def list_course_ids(account_id: int) -> list[int]:
+            account_ = canvasapi.account.Account(self.requester, dict(id=account_id))
+            # plain iteration: a read_ahead thread per worker would not be rate limited
+            return [course.id for course in account_.get_courses()]
+
+        course_ids = set()
+        listed = 0
+        for account_id, ids, error in run_throttled(list_course_ids, sorted(account_ids),
+                                                    max_workers=self.max_workers,
+                                                    limiter=self.rate_limiter):
+            if error:
+                logger.info(f"No course listing for account {account_id}: {error}")
+                continue
+            listed += 1
+            course_ids.update(ids)
+        if not listed:
+            logger.warning(f"No rights to list the courses of {admin_id=}: "
+                           f"only the courses of the current user are harvested")
+        course_ids.update(course.id for course in read_ahead(self.canvas.get_courses())
+                          if getattr(course, 'account_id', None) in account_ids)
+        logger.info(f"{len(course_ids)} courses harvested in {len(account_ids)} accounts")
+        return sorted(course_ids)
+
+    @staticmethod
+    def write_course_ids_csv(csv_path: Path, course_ids: list[int]):
+        """write the course ids, merged with the ids already in the csv file (if any)"""
+        known = set()
+        if csv_path.exists():
+            with open(csv_path, mode='r') as csv_file:
+                csv_reader = csv.reader(csv_file)
+                next(csv_reader, None)  # skip header
+                known = {int(row[0]) for row in csv_reader if row}
+        if not (course_ids or known):
+            return
+        with open(csv_path, mode='w', newline='') as csv_file:
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(['course_id'])
+            csv_writer.writerows([course_id] for course_id in sorted(known | set(course_ids)))
+
+    def hydrate_courses(self, course_ids: list[int], max_age: timedelta = COURSE_CACHE_TTL) -> list[Course]:
+        """
+        the courses (with term, teachers and total_students) for a list of ids, like
+        those of get_courses_admin_csv. Courses requested less than max_age ago come
+        from the table course_cache, the others are requested concurrently
+        :returns canvasapi courses, in the order of course_ids (not found: left out)
+        """
+        db = self.db
+        oldest = datetime.now() - max_age
+        cached = {row.course_id: row.attributes
+                  for row in db((db.course_cache.course_id.belongs(course_ids)) &
+                                (db.course_cache.cached_at > oldest)).select()}
+        missing = [course_id for course_id in course_ids if course_id not in cached]
+        for course_id, course, error in run_throttled(lambda c_id: self.canvas.get_course(c_id,
+                                                                                         include=COURSE_LISTING_INCLUDE),
+                                                      missing,
+                                                      max_workers=self.max_workers,
+                                                      limiter=self.rate_limiter):
+            if error:
+                self.errors.append(f"Course {course_id} not found or no access: {error}")
+                continue
+            cached[course_id] = user_attributes(course)
+            # the db is only written here, on the main thread
+            db.course_cache.update_or_insert(db.course_cache.course_id == course_id,
+                                             course_id=course_id,
+                                             attributes=cached[course_id],
+                                             cached_at=datetime.now())
+        db.commit()
+        logger.info(f"{len(course_ids) - len(missing)} courses from the cache, {len(missing)} requested")
+        return [Course(self.requester, cached[course_id]) for course_id in course_ids if course_id in cached]
+
     def course_metadata(self, course_id, ignore_assignment_names=None):
         """
         return dict with metadata of this course
@@ -544,7 +874,10 @@ class CanvasRobot(object):
         :returns md: CourseMetadata"""
         ignore_assignment_names = ignore_assignment_names or []
         md_result = course_metadata_memcached(course_id, self.canvas,
-                                              frozenset(ignore_assignment_names))
+                                              frozenset(ignore_assignment_names),
+                                              max_workers=self.max_workers,
+                                              limiter=self.rate_limiter,
+                                              get_folder_index=self.get_folder_index)
         return md_result
 
     def get_all_active_courses(self, from_db=True):
@@ -609,20 +942,29 @@ class CanvasRobot(object):
             # print("There are {} modules in page".format(len(page)))
         return
 
+    def iter_course_pages_module_items(self, course, **kwargs) -> Iterator[PageRecord | ModuleRecord |
+                                                                           ModuleItemRecord]:
+        """
+        stream the pages and module items of the course, module items are
+        fetched concurrently. See iter_course_pages_module_items()
+        :param course: Canvas course object or course_id
+        """
+        course = course if isinstance(course, Course) else self.canvas.get_course(course)
+        kwargs.setdefault('max_workers', self.max_workers)
+        kwargs.setdefault('limiter', self.rate_limiter)
+        return iter_course_pages_module_items(course, **kwargs)
+
     def get_course_pages_module_items(self, course_id) -> tuple[Course, list[Page], list[ModuleItem]]:
         """
         :param course_id
-        :returns all all pages"""
+        :returns course, all pages, all module items (lists)"""
         course = self.canvas.get_course(course_id, include=["term", "teachers"])
-        pages = course.get_pages(include=['body'])
-        pages = filter(lambda p: p.title[0:3] != 'UVT', pages)  # skip (some) templates ?
-        modules = course.get_modules()
-        module_items = []
-        for module in modules:
-            module_items += module.get_module_items()
-            # nr_ext_urls += len(list(items_count_ext_url))
-            # nr_module_items += module.items_count
-
+        pages, module_items = [], []
+        for record in self.iter_course_pages_module_items(course):
+            if isinstance(record, PageRecord):
+                pages.append(record.page)
+            elif isinstance(record, ModuleItemRecord):
+                module_items.append(record.item)
         return course, pages, module_items
 
     # USER, ROLES and PROFILE ----------------------------------------
@@ -630,9 +972,55 @@ class CanvasRobot(object):
         """
         get user using
         :param user_id:
-        :returns user
+        :returns user, from the user cache if possible (not when kwargs are given)
+        """
+        if kwargs:
+            return self.canvas.get_user(user_id, **kwargs)
+        return self.get_user_cached(user_id)
+
+    def user_from_cache(self, entry):
+        """rebuild a canvasapi user from a cache entry
+        raises ResourceDoesNotExist for a cached 'not found'"""
+        if not entry.found:
+            raise canvasapi.exceptions.ResourceDoesNotExist("User not found (cached)")
+        # noinspection PyProtectedMember,PyUnresolvedReferences
+        return canvasapi.user.User(self.canvas._Canvas__requester, entry.attributes)
+
+    def get_user_cached(self, search, id_type: str | None = None):
+        """
+        :param search: canvas id, or login/email if id_type is 'sis_login_id'/'email'
+        :param id_type: None (canvas id), 'sis_login_id' or 'email'
+        :returns canvas user, using and filling the user cache. A user which is not found
+        is cached too (raises ResourceDoesNotExist)
         """
-        return self.canvas.get_user(user_id, **kwargs)
+        kind = id_type or 'id'
+        entry = self.user_cache.get(kind, search)
+        if entry:
+            return self.user_from_cache(entry)
+        try:
+            user = self.canvas.get_user(search, id_type) if id_type \
+                else self.canvas.get_user(search)
+        except canvasapi.exceptions.ResourceDoesNotExist:
+            self.user_cache.put_missing(kind, search)
+            self.user_cache.flush()
+            raise
+        self.user_cache.put_user(user, keys=((kind, search),))
+        self.user_cache.flush()
+        return user
+
+    def get_profile(self, user) -> dict:
+        """
+        :param user: canvas user (or object with an id)
+        :returns profile as a dict, from the user cache if possible"""
+        entry = self.user_cache.get('id', user.id)
+        if entry and entry.found and entry.profile:
+            return entry.profile
+        if not hasattr(user, 'get_profile'):
+            user = self.get_user_cached(user.id)
+        profile = user.get_profile()
+        self.user_cache.put_user(user, profile=profile)
+        self.user_cache.flush()
+        return profile
 
     @staticmethod
     def create_profile(profile_dict):
@@ -650,7 +1038,7 @@ class CanvasRobot(object):
 
     def get_user_profile_id(self, user_id: int):
         user = self.get_user(user_id)
-        profile = self.create_profile(user.get_profile())
+        profile = self.create_profile(self.get_profile(user))
         return user, profile
 
     def get_user_profile_anr(self, anr):
@@ -660,17 +1048,228 @@ class CanvasRobot(object):
 
     def is_teacher_canvas(self, user):
         """
-        check if a user is a teacher in one of the TST courses by checking
-        the canvas courses.
+        check if a user is a teacher in one of the TST courses (the courses of the
+        admin account) using the enrollment index, or (if not indexed) the course
+        listing of the account filtered on this teacher (one request)
         :param user
         """
-        role_teacher = {'type': 'TeacherEnrollment'}
-        for course in self.admin.get_courses():
-            enrollments = course.get_enrollments()
-            for enrollment in enrollments:
-                if enrollment.role == role_teacher and enrollment.user == user:
-                    return True
-        return False
+        db = self.db
+        # only the courses in the local db are courses of the account
+        if not db((db.enrollment_index.user_id == user.id) &
+                  (db.enrollment_index.role == 'TeacherEnrollment') &
+                  (db.enrollment_index.course_id == db.course.course_id)).isempty():
+            return True
+        return any(True for _ in self.admin.get_courses(by_teachers=[user.id]))
+
+    # ENROLLMENT INDEX user -> courses
+    def update_enrollment_index(self, course) -> int:
+        """
+        record all active and invited enrollments of the course (one listing)
+        in the table enrollment_index
+        :returns number of enrollments or -1 if not authorised"""
+        try:
+            enrollments = list(course.get_enrollments(state=['active', 'invited']))
+        except canvasapi.exceptions.Forbidden:
+            self.errors.append(f"Not authorized to get enrollments in course {course.id}")
+            return -1
+        return self.store_enrollment_index(course.id, enrollments)
+
+    def store_enrollment_index(self, course_id: int, enrollments: list) -> int:
+        """replace the index rows of the course by these (canvasapi) enrollments"""
+        db = self.db
+        db(db.enrollment_index.course_id == course_id).delete()
+        now = datetime.now()
+        for enrollment in enrollments:
+            user = getattr(enrollment, 'user', None) or {}
+            db.enrollment_index.insert(user_id=enrollment.user_id,
+                                       course_id=course_id,
+                                       role=enrollment.type,
+                                       state=enrollment.enrollment_state,
+                                       user_name=user.get('name'),
+                                       login_id=user.get('login_id'),
+                                       updated_at=now)
+        db.commit()
+        return len(enrollments)
+
+    def get_user_enrollments(self, user_id: int, enrollment_type: str | None = None) -> list:
+        """
+        get the enrollments of one user in Canvas (only this user's courses, no
+        scan of the account) and refresh the index rows of this user, for the
+        courses of the account (those in the local db)
+        :param user_id: canvas id
+        :param enrollment_type: like 'ObserverEnrollment', None for all types
+        :returns list of canvas enrollments (these have a working deactivate())"""
+        db = self.db
+        # noinspection PyProtectedMember,PyUnresolvedReferences
+        user = canvasapi.user.User(self.canvas._Canvas__requester, dict(id=user_id))
+        kwargs = dict(type=[enrollment_type]) if enrollment_type else {}
+        enrollments = list(user.get_enrollments(state=['active', 'invited'], **kwargs))
+        qry = db.enrollment_index.user_id == user_id
+        if enrollment_type:
+            qry &= db.enrollment_index.role == enrollment_type
+        db(qry).delete()
+        now = datetime.now()
+        # only index the courses of the account (those in the local db), like update_enrollment_index
+        account_course_ids = {row.course_id for row in
+                              db(db.course.course_id.belongs({enrollment.course_id
+                                                              for enrollment in enrollments})
+                                 ).select(db.course.course_id)}
+        for enrollment in enrollments:
+            if enrollment.course_id not in account_course_ids:
+                continue
+            user = getattr(enrollment, 'user', None) or {}
+            db.enrollment_index.insert(user_id=user_id,
+                                       course_id=enrollment.course_id,
+                                       role=enrollment.type,
+                                       state=enrollment.enrollment_state,
+                                       user_name=user.get('name'),
+                                       login_id=user.get('login_id'),
+                                       updated_at=now)
+        db.commit()
+        return enrollments
+
+    def get_user_course_ids_db(self, user_id: int, enrollment_type: str | None = None) -> list[int]:
+        """:returns course_ids of the user from the enrollment index"""
+        db = self.db
+        qry = db.enrollment_index.user_id == user_id
+        if enrollment_type:
+            qry &= db.enrollment_index.role == enrollment_type
+        rows = db(qry).select(db.enrollment_index.course_id, distinct=True)
+        return [row.course_id for row in rows]
+
+    def get_course_name_db(self, course_id: int) -> str:
+        db = self.db
+        row = db(db.course.course_id == course_id).select(db.course.name).first()
+        return row.name if row else str(course_id)
+
+    # PAGE STORE: page bodies for offline search
+    def update_page_store(self, course) -> int:
+        """
+        refresh the stored page bodies of the course: only pages changed in Canvas
+        since the last sync (updated_at) are fetched, removed pages are deleted
+        :returns number of new or changed pages, -1 if not authorised"""
+        try:
+            pages = list(course.get_pages())  # without bodies
+        except canvasapi.exceptions.Forbidden:
+            self.errors.append(f"Not authorized to get pages in course {course.id}")
+            return -1
+        changed, removed = self.pages_to_refresh(course.id, pages)
+        if len(changed) * 2 > len(pages):  # one listing with bodies
+            changed_ids = {page.page_id for page in changed}
+            changed = [page for page in course.get_pages(include=['body']) if page.page_id in changed_ids]
+        elif changed:  # a few pages: fetch these
+            fetched = []
+            for page, full_page, error in run_throttled(lambda p: course.get_page(p.url), changed,
+                                                        max_workers=self.max_workers,
+                                                        limiter=self.rate_limiter):
+                if error:
+                    self.errors.append(f"Page {page.url} of course {course.id} not stored: {error}")
+                else:
+                    fetched.append(full_page)
+            changed = fetched
+        return self.store_pages(course.id, changed, removed)
+
+    @staticmethod
+    def page_updated_at(page) -> datetime | None:
+        date = getattr(page, 'updated_at_date', None)
+        return date.replace(tzinfo=None) if date else None
+
+    def pages_to_refresh(self, course_id: int, pages: list) -> tuple[list, set[int]]:
+        """
+        :param pages: canvasapi pages of the course (a listing, bodies not needed)
+        :returns the pages which are new or changed since they were stored, page_ids of removed pages
+        """
+        db = self.db
+        stored = {row.page_id: row.updated_at
+                  for row in db(db.course_page.course_id == course_id).select(db.course_page.page_id,
+                                                                               db.course_page.updated_at)}
+        changed = [page for page in pages
+                   if page.page_id not in stored or stored[page.page_id] != self.page_updated_at(page)]
+        removed = set(stored) - {page.page_id for page in pages}
+        return changed, removed
+
+    def store_pages(self, course_id: int, pages: list, removed: set[int] = frozenset()) -> int:
+        """
+        :param pages: canvasapi pages with body
+        :param removed: page_ids to delete from the store
+        :returns number of stored pages"""
+        db = self.db
+        now = datetime.now()
+        for page in pages:
+            db.course_page.update_or_insert((db.course_page.course_id == course_id) &
+                                            (db.course_page.page_id == page.page_id),
+                                            course_id=course_id,
+                                            page_id=page.page_id,
+                                            url=page.url,
+                                            title=page.title,
+                                            body=getattr(page, 'body', None) or "",
+                                            published=getattr(page, 'published', None),
+                                            updated_at=self.page_updated_at(page),
+                                            synced_at=now)
+        if removed:
+            db((db.course_page.course_id == course_id) & db.course_page.page_id.belongs(removed)).delete()
+        db.commit()
+        return len(pages)
+
+    def search_pages_db(self, engine: SearchEngine, course_id: int | None = None):
+        """
+        offline search in the stored page bodies, using the full-text index
+        for the candidates (terms of at least 3 characters)
+        :param engine: the compiled search terms
+        :param course_id: None for all courses
+        :returns generator of course_page rows with a match in the body
+        """
+        db = self.db
+        qry = (db.course_page.course_id == course_id) if course_id else (db.course_page.id > 0)
+        if db.has_page_fts and all(len(term) >= 3 for term in engine.terms):
+            match = " OR ".join('"' + term.replace('"', '""') + '"' for term in engine.terms)
+            rows = db.executesql("SELECT rowid FROM course_page_fts WHERE course_page_fts MATCH ?",
+                                 placeholders=(f"body : ({match})",))
+            qry &= db.course_page.id.belongs([row[0] for row in rows])
+        for row in db(qry).iterselect(orderby=db.course_page.course_id | db.course_page.title):
+            if row.title[0:3] != 'UVT' and engine.matches(row.body):  # the exact (case) test
+                yield row
+
+    def search_replace_pages_db(self,
+                                search_term: str | list[str] = "",
+                                replace_term: str | list[str] = "",
+                                search_only: bool = True,
+                                ignore_case: bool = True,
+                                dryrun: bool = True,
+                                course_id: int | None = None,
+                                engine: SearchEngine | None = None) -> tuple[int, list[tuple], str]:
+        """
+        like course_search_replace_pages, using the page store (run sync first).
+        Canvas is only contacted to replace: the page is read again and updated
+        :param course_id: None for all courses
+        :returns tuple of count, list of page tuples, string of HTML bodies
+        """
+        db = self.db
+        engine = engine or SearchEngine(search_term, ignore_case=ignore_case)
+        total_count, found_pages, marked_bodies = 0, [], ""
+        for row in list(self.search_pages_db(engine, course_id)):
+            if search_only or dryrun:
+                count, new_body = engine.mark(row.body)
+            else:
+                page = self.get_course(row.course_id).get_page(row.url)
+                count, new_body = self.search_replace_in_page(page,
+                                                              search_term=search_term,
+                                                              replace_term=replace_term,
+                                                              search_only=search_only,
+                                                              ignore_case=ignore_case,
+                                                              dryrun=dryrun,
+                                                              engine=engine)
+                if count:  # keep the store fresh
+                    page = self.get_course(row.course_id).get_page(row.url)
+                    row.update_record(body=page.body,
+                                      updated_at=page.updated_at_date.replace(tzinfo=None),
+                                      synced_at=datetime.now())
+            if count:
+                found_pages.append((row.course_id, self.get_course_name_db(row.course_id), row.url, row.title))
+            total_count += count
+            marked_bodies += new_body
+        db.commit()
+        return total_count, found_pages, marked_bodies
 
     # get from DB
     def is_teacher_db(self, user):
@@ -696,7 +1295,7 @@ class CanvasRobot(object):
         first tries to use search_name as a login, then use the email if supplied
         """
         try:
-            user = self.canvas.get_user(search_name, 'sis_login_id')
+            user = self.get_user_cached(search_name, 'sis_login_id')
         except (canvasapi.exceptions.Unauthorized,
                 canvasapi.exceptions.ResourceDoesNotExist) as e:
             if not email:
@@ -705,7 +1304,7 @@ class CanvasRobot(object):
                                    f'using email, parameter not provided')
                 return False
             try:
-                user = self.canvas.get_user(email, 'email')
+                user = self.get_user_cached(email, 'email')
             except canvasapi.exceptions.ResourceDoesNotExist:
                 self.errors.append(f'{search_name} not found, {email} not found.')
                 return False  # give up
@@ -903,43 +1502,166 @@ class CanvasRobot(object):
             self.actions.append(f"{user.name} added to {course.name} in section {section.name} as {role}")
         return
 
-    def enroll_students_in_communities(self, local=False):
+    def enroll_students_in_communities(self, local=False, batch=True, use_sis_import=False):
         """for each community
         retrieve the students from local or central dibsa(ldap)
-        and enroll them"""
-
-        community_edu_ids = self.community_manager.get_community_edu_ids()
-        for c_id in community_edu_ids:
-            # for each community course
-            # if c_id != "bauk":
-            #    continue
-            combi_dict = self.get_students_for_community(c_id,
+        and enroll them
+        :param local: get student data from local Dibsa if True
+        :param batch: if True only the students missing in the community course are
+        enrolled (see enroll_students_in_community_batch), else each student is
+        looked up and enrolled one by one
+        :param use_sis_import: (batch only) submit the missing students as one SIS import
+        :returns dict with per community course_id an EnrollmentDiff (batch only)
+
+        The students are enrolled in the community course itself, not in a section per
+        subcommunity: COMMUNITIES holds (course_id, language) per subcommunity, no section
+        ids, and the former section branch failed on that tuple for every student"""
+        diffs = {}
+        for course_id in self.community_manager.community_course_ids:
+            if batch:
+                diffs[course_id] = self.enroll_students_in_community_batch(course_id,
+                                                                           local=local,
+                                                                           use_sis_import=use_sis_import)
+                continue
+            combi_dict = self.get_students_for_community(course_id,
                                                          local=local)
-            course_id, subcommunities = COMMUNITIES[c_id]
             course = self.get_course(course_id)
             role_student = {'type': 'StudentEnrollment'}
-            # first handle the sis_login_ids
-            for edu, combi in combi_dict.items():
-                _, usernames = combi
-                for username in usernames:  # students
-
-                    if subcommunities and edu in subcommunities:
-                        section = subcommunities[edu]
-                        section.enroll_user(f"sis_login_id:{username}")
-                    else:
-                        course.enroll_user(f"sis_login_id:{username}",
-                                           dict(type="StudentEnrollment"))
+            for edu, (students, usernames) in combi_dict.items():
+                # first handle the sis_login_ids
+                for username in usernames:
+                    course.enroll_user(f"sis_login_id:{username}",
+                                       enrollment=role_student)
+                for student in students:
+                    self.enroll_user_in_course(student, course, role=role_student)
+        return diffs
+
+    def get_roster_dibsa(self, course_id: CourseId, local=False) -> dict[str, dict]:
+        """
+        :param course_id: community course
+        :param local: get student data from local Dibsa if True
+        :returns the Dibsa student records of all edu_labels of the community,
+        keyed by username"""
+        roster = {}
+        for edu_label in self.community_manager.get_edulabels_by_course_id(course_id):
+            try:
+                students = self.get_students_dibsa(edu_label.upper(), local=local)
+            except DibsaRetrieveError as e:
+                logger.error(e)
+                raise DibsaRetrieveError(f"Unable to retrieve students for {edu_label}")
+            for student in students:
+                try:
+                    roster[student['username']] = student
+                except TypeError as e:
+                    logger.error(e)
+                    self.errors.append(e)
+        return roster
 
-                        # self.enroll_user_in_course(student, course, role=role_student)
+    def get_enrolled_logins(self, course, enrollment_type='StudentEnrollment') -> set[str]:
+        """
+        :param course: Canvas course
+        :param enrollment_type:
+        :returns login_ids of the users with an active, invited or pending
+        enrollment of enrollment_type. One paginated listing for the whole course.
+        Canvas only includes the login_id for an admin, without it the login_ids
+        come from the profiles (user cache), requested concurrently"""
+        enrollments = course.get_enrollments(type=[enrollment_type],
+                                             state=['active', 'invited', 'creation_pending'])
+        logins = set()
+        unknown = []
+        for enrollment in enrollments:
+            login_id = enrollment.user.get('login_id')
+            if login_id:
+                logins.add(login_id)
+            else:
+                unknown.append(canvasapi.user.User(self.requester, dict(id=enrollment.user_id,
+                                                                        name=enrollment.user.get('name'))))
+
+        user_cache = self.user_cache  # created (and loaded) here, not in a worker
+        for user, profile, error in run_throttled(self.get_profile, unknown,
+                                                  max_workers=self.max_workers,
+                                                  limiter=self.rate_limiter):
+            if error or not profile.get('login_id'):
+                # counted as missing: enrolling an enrolled student again does no harm
+                msg = f"No login of enrolled user {user.id} {user.name} in {course.name}: {error or 'no login_id'}"
+                logger.error(msg)
+                self.errors.append(msg)
+                continue
+            logins.add(profile['login_id'])
+        user_cache.flush()  # the workers leave that to the main thread
+        return logins
+
+    def enroll_students_in_community_batch(self,
+                                           course_id: CourseId,
+                                           local=False,
+                                           use_sis_import=False) -> EnrollmentDiff:
+        """
+        Compare the Dibsa roster with the current student enrollments of the
+        community course and only enroll the missing students: concurrently (rate limited)
+        or, if use_sis_import, as one SIS import.
+        :param course_id: community course
+        :param local: get student data from local Dibsa if True
+        :param use_sis_import: submit the diff as one enrollments CSV. Needs an admin account,
+        a course with a sis_course_id and students with an anr. The others are enrolled
+        using the API
+        :returns EnrollmentDiff
+        """
+        course = self.get_course(course_id)
+        roster = self.get_roster_dibsa(course_id, local=local)
+        enrolled_logins = self.get_enrolled_logins(course)
+        diff = EnrollmentDiff(course_id=course_id,
+                              roster_size=len(roster),
+                              enrolled_size=len(enrolled_logins),
+                              missing=sorted(set(roster) - enrolled_logins))
+        to_enroll = diff.missing
+        if use_sis_import and diff.missing:
+            sis_course_id = getattr(course, 'sis_course_id', None)
+            sis_students = [roster[username] for username in diff.missing
+                            if roster[username].get('anr')]
+            if self.admin and sis_course_id and sis_students:
+                diff.sis_import_id = self.submit_enrollments_sis_import(course_id,
+                                                                        sis_course_id,
+                                                                        sis_students)
+                diff.enrolled = [student['username'] for student in sis_students]
+                to_enroll = [username for username in diff.missing
+                             if username not in diff.enrolled]
+            else:
+                logger.warning(f"SIS import not possible for {course_id=}, using the API")
+
+        def enroll(username):
+            return course.enroll_user(f"sis_login_id:{username}",
+                                      enrollment=dict(type='StudentEnrollment',
+                                                      enrollment_state='active'))
+
+        for username, _, error in run_throttled(enroll, to_enroll,
+                                                max_workers=self.max_workers,
+                                                limiter=self.rate_limiter):
+            if error:
+                diff.failed.append(username)
+                self.errors.append(f"Enroll of {username} in {course.name} failed:{error}")
+            else:
+                diff.enrolled.append(username)
+                self.actions.append(f"{username} added to {course.name} as student")
+        logger.info(f"{course.name}: {diff.roster_size} in roster, {diff.enrolled_size} enrolled, "
+                    f"{len(diff.missing)} missing, {len(diff.failed)} failed")
+        return diff
 
-            for edu, combi in combi_dict.items():
-                students, _ = combi
-                for student in students:
-                    if subcommunities and edu in subcommunities:
-                        section = subcommunities[edu]
-                        self.enroll_user_in_course_section(student, course, section, role=role_student)
-                    else:
-                        self.enroll_user_in_course(student, course, role=role_student)
+    def submit_enrollments_sis_import(self, course_id: CourseId, sis_course_id: str, students) -> int:
+        """
+        write an enrollments.csv for the students and submit it as a SIS import
+        :param course_id: used in the filename
+        :param sis_course_id: the course in the SIS import
+        :param students: Dibsa student records (with anr)
+        :returns the id of the SIS import"""
+        csv_path = Path(self.db_folder) / f"enrollments_{course_id}.csv"
+        with open(csv_path, mode='w', newline='') as csv_file:
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(['course_id', 'user_id', 'role', 'status'])
+            for student in students:
+                csv_writer.writerow([sis_course_id, student['anr'], 'student', 'active'])
+        sis_import = self.admin.create_sis_import(str(csv_path), extension='csv')
+        self.actions.append(f"SIS import {sis_import.id} for {len(students)} students in {sis_course_id}")
+        return sis_import.id
 
     def add_observer_to_education(self, user, report_only=False):
         """ add user as an observer to all courses of an education"""
@@ -947,40 +1669,41 @@ class CanvasRobot(object):
         # not working just showing
         if not report_only:
             print("Add is not implemented!")
-        print('Showing ALL observers for ALL courses')
+        print('Showing ALL observers for ALL courses (from the enrollment index)')
         print(user)
         # idea: filter course of an education using db
-        for course in self.admin.get_courses():
-            # only insert/update course if current year
-            if str(course.sis_course_id)[:4] != str(self.year):
-                continue
-            observers = course.get_users(enrollment={'type': 'ObserverEnrollment'})
-            for observer in observers:
-                if not hasattr(observer, 'login_id'):
-                    continue
-                print(observer.name)
+        db = self.db
+        # db.user only holds teachers: the name of an observer comes with its enrollment
+        rows = db((db.enrollment_index.role == 'ObserverEnrollment') &
+                  (db.enrollment_index.course_id == db.course.course_id) &
+                  (db.course.ac_year == self.year)).select(db.course.name,
+                                                           db.enrollment_index.user_name,
+                                                           db.enrollment_index.login_id,
+                                                           orderby=db.course.name)
+        for row in rows:
+            print(f"{row.course.name}: {row.enrollment_index.user_name} ({row.enrollment_index.login_id or 'n.a.'})")
 
     def remove_observer_from_all_courses(self, username):
-        """ remove a user with username as an observer from all TST courses"""
+        """ remove a user with username as an observer from all TST courses
+        only the courses of this user are checked"""
         removed = []
         try:
-            user = self.canvas.get_user(username, 'sis_login_id')
+            user = self.get_user_cached(username, 'sis_login_id')
         except canvasapi.exceptions.ResourceDoesNotExist:
             return f"User {username} not found in Canvas"
 
-        for course in self.admin.get_courses():
-            # only get a course if current year
-            if str(course.sis_course_id)[:4] != str(self.year):
+        db = self.db
+        for enrollment in self.get_user_enrollments(user.id, 'ObserverEnrollment'):
+            # only remove if current year
+            if str(getattr(enrollment, 'sis_course_id', ''))[:4] != str(self.year):
                 continue
-            enrollments = course.get_enrollments(type="ObserverEnrollment")
-            # specifying user_id is not allowed
-            for enrollment in enrollments:
-                if enrollment.user_id != user.id:
-                    continue
-                print(enrollment)
-                enrollment.deactivate(task='delete')
-                removed.append(course.name)
-
+            print(enrollment)
+            enrollment.deactivate(task='delete')
+            db((db.enrollment_index.user_id == user.id) &
+               (db.enrollment_index.course_id == enrollment.course_id) &
+               (db.enrollment_index.role == 'ObserverEnrollment')).delete()
+            removed.append(self.get_course_name_db(enrollment.course_id))
+        db.commit()
         return removed
 
     def unenroll_in_course(self,
@@ -1138,27 +1861,32 @@ class CanvasRobot(object):
     #
     #     return count, count_students
 
-    def get_courses_data(self):
+    def get_courses_data(self, all_years: bool = False):
         """
-        for all courses: get a matrix and labels course name
-        and other fields from db
-        :return: features-matrix, labels """
-
+        for all courses: the statistics columns of the table course (modules, pages,
+        assignments, students...) as a pandas DataFrame, selected column-wise
+        :param all_years: if False only the courses of self.year
+        :return: DataFrame, one row per course"""
         db = self.db  # cosmetic reasons
-        qry = db.course.ac_year == self.year
-        courses = db(qry).select(db.course.course_id,
-                                 db.course.nr_modules,
-                                 db.course.nr_module_items,
-                                 db.course.nr_pages,
-                                 db.course.nr_assignments,
-                                 orderby=db.course.id)
-        labels = [c.course_id for c in courses]
-        features = [(c.nr_modules,
-                     c.nr_module_items,
-                     c.nr_pages,
-                     c.nr_assignments) for c in courses]
-        columns = ("nrModules", "nrModuleItems", ",nrPages", "nr_assignments")
-        return features, labels, columns
+        qry = db.course.id > 0 if all_years else db.course.ac_year == self.year
+        fields = [db.course[column] for column in course_stats.ID_COLUMNS + course_stats.STAT_COLUMNS]
+        # plain tuples, no pydal Row per course
+        return course_stats.courses_frame(db.select_as(qry, *fields, orderby=db.course.id, mode='tuples'))
+
+    def course_statistics(self, by: str = 'term', all_years: bool = False):
+        """
+        :param by: 'term', 'account_id' or 'ac_year'
+        :returns DataFrame with the distribution of every statistic per value of by"""
+        return course_stats.distributions(self.get_courses_data(all_years=all_years), by=by)
+
+    def export_courses_data(self, path: Path, by: str | None = None, all_years: bool = False) -> Path:
+        """
+        :param path: .parquet (needs pyarrow) or .csv
+        :param by: export the distributions per 'term', 'account_id' or 'ac_year'
+        instead of the course rows
+        :returns path"""
+        frame = self.course_statistics(by, all_years) if by else self.get_courses_data(all_years)
+        return course_stats.export_frame(frame, path)
 
     # def get_bbcourses(self, single_course: str = ""):
     #     """ for all courses: get coursename and other fields from db
@@ -1263,8 +1991,11 @@ class CanvasRobot(object):
             else:
                 db.commit()
 
-    def get_list_of_documents_db(self, course_id=None):
+    def get_list_of_documents_db(self, course_id=None, fields=None, mode: str = 'rows'):
         """ get documents/attachments from db as a list
+        :param fields: default all document fields, course_id and name of the course
+        :param mode: see LocalDAL.select_as, like 'tuples' (in the order of fields)
+        for a large selection
         """
         db = self.db
         if course_id:
@@ -1276,7 +2007,8 @@ class CanvasRobot(object):
                    (db.document.course == db.course.id))
 
         try:
-            items = db(qry).select(db.document.ALL, db.course.course_id, db.course.name)
+            fields = fields or (db.document.ALL, db.course.course_id, db.course.name)
+            items = db.select_as(qry, *fields, mode=mode)
         except Exception as e:
             logger.error("*{0} error in get_list_of_documents_db() "
                          "while selecting documents*".format(e))
@@ -1284,81 +2016,200 @@ class CanvasRobot(object):
         else:
             return items
 
-    # noinspection PyUnresolvedReferences
-    def download_documents_localfs(self):
-        """ retrieve the real documents from LMS """
+    @property
+    def document_job_fields(self) -> tuple:
+        """the columns the download functions need, as tuples (id, url, filename, sha256, course_id)"""
         db = self.db
-        counters = namedtuple('Counters', ['total', 'ok', 'failed'])
-        items = self.get_list_of_documents_db()
+        return db.document.id, db.document.url, db.document.filename, db.document.sha256, db.course.course_id
+
+    def get_cookies(self) -> dict:
+        """the cookies as fname/value pairs for requests"""
+        return {str(cookie['fname']): cookie['value'] for cookie in self.cookies}
+
+    def get_downloader(self, folder: Path,
+                       chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                       max_workers: int | None = None) -> Downloader:
+        """
+        :param folder: the downloads are written below this folder
+        :param chunk_size: bytes per read from the response stream
+        :param max_workers: number of concurrent downloads, default self.max_workers
+        :returns Downloader using the Canvas API key, the cookies and the rate limiter.
+        Content already in the file store is linked, not kept twice
+        """
+        db = self.db
+        known_hashes = {row.sha256: self.file_store.path_for(row.sha256)
+                        for row in db(db.blob).select(db.blob.sha256)}
+        return Downloader(folder,
+                          chunk_size=chunk_size,
+                          max_workers=max_workers or self.max_workers,
+                          limiter=self.rate_limiter,
+                          headers={'Authorization': f"Bearer {self.config.api_key}"},
+                          cookies=self.get_cookies(),
+                          known_hashes=known_hashes)
+
+    @cached_property
+    def file_store(self) -> FileStore:
+        """content-addressed store of the documents, in db_folder/store"""
+        return FileStore(Path(self.db_folder) / 'store')
+
+    def store_document(self, document_id: int, path: Path, sha256: str | None = None) -> str:
+        """
+        put a downloaded document in the file store (once per content), path becomes a hard link
+        to it (so read-only, see file_store.py)
+        :param document_id: id in the document table
+        :param path: the downloaded file
+        :param sha256: hash of the content, if already known
+        :returns the sha256 of the content
+        """
+        db = self.db
+        sha256 = self.file_store.add(path, sha256)
+        if not db(db.blob.sha256 == sha256).count():
+            db.blob.insert(sha256=sha256,
+                           size=Path(path).stat().st_size,
+                           content_type=mimetypes.guess_type(path.name)[0],
+                           created=datetime.now())
+        db(db.document.id == document_id).update(sha256=sha256)
+        return sha256
+
+    def download_documents_localfs(self, folder: Path | None = None,
+                                   chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                                   max_workers: int | None = None):
+        """ retrieve the real documents from LMS, concurrently, to folder/[course_id]/[filename]
+        Each content is kept once in the file store, the files in folder are hard links to it.
+        Documents already in the store are not downloaded again, an interrupted download
+        is resumed in the next run.
+        :param folder: default db_folder/documents
+        :param chunk_size: bytes per read from the response stream
+        :param max_workers: number of concurrent downloads
+        """
+        db = self.db
+        folder = folder or Path(self.db_folder) / 'documents'
+        store = self.file_store
+        counters = namedtuple('Counters', ['total', 'ok', 'failed', 'deduplicated', 'stored'])
+        items = self.get_list_of_documents_db(fields=self.document_job_fields, mode='tuples')
         counters.total = len(items)
         counters.ok = 0
         counters.failed = 0
-        for item in items:
-            status = self.download_file(fname=item.name, url=item.url)
+        counters.deduplicated = 0
+        counters.stored = 0
+        jobs = []
+        for document_id, url, filename, sha256, course_id in items:
+            fname = f"{course_id}/{filename.strip()}"
+            if sha256 and sha256 in store and store.verify(sha256) is None:
+                store.link(sha256, folder / fname)
+                counters.ok += 1
+                counters.stored += 1
+                continue
+            jobs.append((document_id, url, fname))
+
+        downloader = self.get_downloader(folder, chunk_size=chunk_size, max_workers=max_workers)
+        for document_id, result, error in track(downloader.download_all(jobs),
+                                                description="Downloading documents...",
+                                                total=len(jobs)):
+            if error:
+                logger.error(f"download of document {document_id} failed: {error}")
+                status = 0
+            else:
+                status = result.status
             if status == 200:
+                self.store_document(document_id, result.path, result.sha256)
                 counters.ok += 1
+                counters.deduplicated += result.deduplicated
             else:
                 counters.failed += 1
-            db(db.document.id == item.id).update(http_status=status)
+            db(db.document.id == document_id).update(download_status=status)
         db.commit()
         return counters
 
-    def transfer_file_to_server(self, url=None, fname=None):
-        """download a file to uploads folder from external url using a temporary buffer
+    def transfer_file_to_server(self, url=None, fname=None, document_id=None):
+        """download a file from external url to the file store,
+        through a file in db_folder/transfer (no buffer in memory)
         :param fname: original name of a file
         :param url: remote url to fetch a file from
+        :param document_id: id in the document table, default the document with this url
         """
-        db = self.db
         filename = fname.strip()
-        logger.debug("creating transfer buffer %s for %s" % (filename, url))
-        # convert to fname/value pairs
-        cookies = {}
-        for cookie in self.cookies:
-            cookies[str(cookie['fname'])] = cookie['value']
-        #
-        logger.info("cookies %s for %s" % (cookies, url))
-        with io.BytesIO() as outfile:
-            try:
-                r = requests.get(url, cookies=cookies, stream=True)
-            except requests.exceptions.RequestException as e:
-                logger.error("couldn't get {} from file {} due to {}".format(filename,
-                                                                             url,
-                                                                             e))
-                return None
-
-            if r.status_code == 200:
-                self.receive_file(db, filename, outfile, r, url)
-            else:
-                logger.info("html response {} url is now {}".format(r.status_code,
-                                                                    r.url))
-                # try again with redirected url (we assume redirection)
-                r = requests.get(r.url, cookies=cookies, stream=True)
-                if r.status_code == 200:
-                    self.receive_file(db, filename, outfile, r, url)
-                else:
-                    logger.error('Failed {0}'.format(r))
-
-        return r.status_code
+        downloader = self.get_downloader(Path(self.db_folder) / 'transfer', max_workers=1)
+        try:
+            result = downloader.download(url, filename)
+        except requests.exceptions.RequestException as e:
+            logger.error("couldn't get {} from file {} due to {}".format(filename,
+                                                                         url,
+                                                                         e))
+            return None
+        if result.status == 200:
+            self.receive_file(result.path, url, document_id, result.sha256)
+        else:
+            logger.error('Failed {0} for {1}'.format(result.status, url))
+        return result.status
 
-    # noinspection PyUnresolvedReferences
-    def transfer_files_to_server(self):
-        """transfer all documents in the bbdocument table to the server"""
+    def transfer_files_to_server(self, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                                 max_workers: int | None = None):
+        """transfer all documents in the document table, not in the file store yet, to the store:
+        download concurrently, store on this thread"""
         db = self.db
         counters = namedtuple('Counters', ['total', 'ok', 'failed'])
-        items = self.get_list_of_documents()
+        items = self.get_list_of_documents_db(fields=self.document_job_fields, mode='tuples')
         counters.total = len(items)
         counters.ok = 0
         counters.failed = 0
-        for item in items:
-            status = self.transfer_file_to_server(fname=item.name, url=item.url)
+        jobs = []
+        for document_id, url, filename, sha256, course_id in items:
+            if sha256 and sha256 in self.file_store:
+                counters.ok += 1
+                continue
+            jobs.append((document_id, url, f"{course_id}/{filename.strip()}"))
+        downloader = self.get_downloader(Path(self.db_folder) / 'transfer',
+                                         chunk_size=chunk_size,
+                                         max_workers=max_workers)
+        for document_id, result, error in downloader.download_all(jobs):
+            if error:
+                logger.error(f"transfer of document {document_id} failed: {error}")
+                status = 0
+            else:
+                status = result.status
             if status == 200:
+                # the transfer copy is removed: the workers should link to the stored copy.
+                # A worker which still found the transfer copy keeps its own download
+                if sha256 := self.receive_file(result.path, result.url, document_id, result.sha256):
+                    downloader.remember(sha256, self.file_store.path_for(sha256))
                 counters.ok += 1
             else:
                 counters.failed += 1
-            db(db.document.id == item.id).update(http_status=status)
+            db(db.document.id == document_id).update(download_status=status)
         db.commit()
         return counters
 
+    def verify_store(self, remove_orphans: bool = False) -> list[StoreProblem]:
+        """
+        integrity check of the file store: recompute the hash of every blob
+        :param remove_orphans: delete stored files without a blob row
+        :returns the missing and corrupt blobs. Documents referring to them
+        are reset (sha256 None), so the next download fetches them again
+        """
+        db = self.db
+        store = self.file_store
+        problems = []
+        rows = db(db.blob).select(db.blob.id, db.blob.sha256)
+        for row in track(rows, description="Verifying file store..."):
+            problem = store.verify(row.sha256)
+            if problem:
+                problems.append(problem)
+                self.errors.append(f"blob {row.sha256} is {problem.problem}")
+                db(db.document.sha256 == row.sha256).update(sha256=None)
+                db(db.blob.id == row.id).delete()
+                store.remove(row.sha256)  # a corrupt copy must not be linked to a new download
+            else:
+                row.update_record(verified=datetime.now())
+        if remove_orphans:
+            known = {row.sha256 for row in rows} - {problem.sha256 for problem in problems}
+            for sha256 in list(store.hashes()):
+                if sha256 not in known:
+                    store.path_for(sha256).unlink()
+                    self.actions.append(f"removed orphan {sha256} from the file store")
+        db.commit()
+        return problems
+
     def is_leaf(self, tag: bs4.Tag):
 
         # one child: a string
@@ -1380,86 +2231,36 @@ class CanvasRobot(object):
     # transformation functions
     def search_replace_in_page(self,
                                page: canvasapi.page,
-                               search_term: str = "",
-                               replace_term: str = "",
+                               search_term: str | list[str] = "",
+                               replace_term: str | list[str] = "",
                                search_only: bool = True,
                                ignore_case: bool = True,
                                no_confirm: bool = False,
-                               dryrun: bool = True) -> tuple[int, str]:
+                               dryrun: bool = True,
+                               engine: SearchEngine | None = None) -> tuple[int, str]:
         """
         In page search and mark (search_only) found instances. Or, if not search_only,
         replace and modify the page in Canvas, unless dryrun is True
         :param no_confirm: if True don't ask for confirmation when replacing
         :param ignore_case
         :param page: Canvas page object to be searched or updated
-        :param search_term: text to search
-        :param replace_term: text to replace with
+        :param search_term: text to search, or a list of texts
+        :param replace_term: text to replace with, or a list (one per search term)
         :param search_only: if False Replace
         :param dryrun: no real replacement
+        :param engine: compiled search terms, to be reused for many pages (search_term is ignored)
         :returns: a count (of occurrences), marked_body with found occurrences marked in red
         if search_only else
         if not dryrun and not confirming replace count = 0
 
         """
-        total_count = 0
-
-        def check_leafs(tag: bs4.element.Tag):
-            """if the NavigableString leafs contain the current search_term
-            mark with -> <- and make the leaf a span, styled red
-            :returns count of locations found"""
-            local_count = 0
-            try:
-                for ndx, child in enumerate(tag.children):
-                    if not isinstance(child, bs4.NavigableString):
-                        continue
-                    # is NS...
-                    if search_term_l in str(child).lower():
-                        item_string, count = re.subn(search_term, '->' + search_term + '<-',
-                                                     child.string,
-                                                     flags=flags)
-                        new_string = soup.new_string(item_string)
-                        local_count += count
-                        # item.replace_with(new_string)  # value error if ...
-
-                        new_span = soup.new_tag("span", style='color:red;')
-                        new_span.string = new_string  # child.string
-                        tag.replace_with(new_span)
-
-            except (AttributeError, Exception) as e:
-                Exception(f"check_leafs failed with{e}")
-
-            return local_count
-
-        flags = re.IGNORECASE if ignore_case else 0
-        # if found inside an <a> link or inside an iframe: mark on the outside
-        soup = bs4.BeautifulSoup(page.body, 'lxml')
-
-        search_term_l = search_term.lower()
-        # items = soup.find_all()
-        items = list(soup.descendants)
-
-        lookup_attr = dict(a="href", iframe="src")
-
-        for item in items:
-            # handle tags with links (href/src): wrap with a span
-            if ((item.name == 'a' and search_term_l in str(item['href']).lower()) or
-                    (item.name == 'iframe' and search_term_l in str(item['src']).lower())):
-                # create a span to wrap the string
-                span = soup.new_tag("span", attrs={'style': "color:red;"})
-                msg = f"'{search_term}' in {item.name} ({lookup_attr(item.name)})"
-                span.string = f"{msg}->"
-                item.wrap(span)
-                total_count += 1
-            # allways
-            total_count += check_leafs(item)  # returns a count of found locations
-
-        marked_body = str(soup)  # html
-        # marked_body, count = re.subn(search_term,'<span style="color: red;">' + search_term + '</span>',
-        #                             page.body,
-        #                             flags=flags)
+        engine = engine or SearchEngine(search_term, ignore_case=ignore_case)
+        if not engine.matches(page.body):
+            return 0, ""
+        total_count, marked_body = engine.mark(page.body)
         if not search_only and not dryrun:
             # let's only do this if you're really sure
-            new_body, total_count = re.subn(search_term, replace_term, page.body, flags=flags)
+            total_count, new_body = engine.replace(page.body, engine.replacements_for(replace_term))
             # update page in canvas
             if (no_confirm or
                     rich.prompt.Confirm.ask(f"Are you sure you want to replace '{search_term}' with "
@@ -1474,21 +2275,29 @@ class CanvasRobot(object):
 
     def course_search_replace_pages(self,
                                     course_id: int,
-                                    search_term: str = "",
+                                    search_term: str | list[str] = "",
                                     replace_term: str = "",
                                     search_only: bool = True,
                                     ignore_case: bool = True,
-                                    dryrun: bool = True) -> tuple[int, list[tuple], str]:
+                                    dryrun: bool = True,
+                                    engine: SearchEngine | None = None,
+                                    offline: bool = False) -> tuple[int, list[tuple], str]:
         """
         In a course replace text (or HTML) in all pages
         :param ignore_case:
         :param course_id: canvas course_id
-        :param search_term: text to find
+        :param search_term: text to find, or a list of texts (found in one pass)
         :param replace_term: text to replace with
         :param search_only: False is Replace
         :param dryrun: True: don't update, return marked body
+        :param engine: compiled search terms, to be reused for many courses (search_term is ignored)
+        :param offline: search the page store instead of Canvas, see search_replace_pages_db
         :returns tuple of count, list of page tuples, string of HTML bodies
         """
+        engine = engine or SearchEngine(search_term, ignore_case=ignore_case)
+        if offline:
+            return self.search_replace_pages_db(search_term, replace_term, search_only,
+                                                ignore_case, dryrun, course_id=int(course_id), engine=engine)
         total_count = 0
         marked_bodies = ""
         found_pages = []
@@ -1502,13 +2311,14 @@ class CanvasRobot(object):
         pages = course.get_pages(include=['body'])
         pages = filter(lambda p: p.title[0:3] != 'UVT', pages)  # skip
         for page in pages:
-            if page.body and search_term.lower() in page.body.lower():
+            if engine.matches(page.body):  # raw scan, only matching pages are parsed
                 count, new_body = self.search_replace_in_page(page,
                                                               search_term=search_term,
                                                               replace_term=replace_term,
                                                               search_only=search_only,
                                                               ignore_case=ignore_case,
-                                                              dryrun=dryrun)
+                                                              dryrun=dryrun,
+                                                              engine=engine)
                 if count:
                     found_pages.append((course_id, course.name, page.url, page.title))
                 total_count += count
@@ -1517,11 +2327,41 @@ class CanvasRobot(object):
         return total_count, found_pages, marked_bodies
 
     def course_search_replace_pages_all_courses(self,
-                                                search_term: str,
+                                                search_term: str | list[str],
                                                 replace_term: str,
                                                 search_only: bool = True,
                                                 ignore_case: bool = True,
-                                                dryrun: bool = False):
+                                                dryrun: bool = False,
+                                                offline: bool = False,
+                                                concurrent: bool = True,
+                                                report_path: Path | None = None):
+        """
+        search (and replace) in the pages of all courses
+        :param offline: search the page store, see search_replace_pages_db
+        :param concurrent: search the courses with a pool of workers (not when
+        replacing, that asks for confirmation per page)
+        :param report_path: write the marked pages to this HTML file, instead
+        of returning them as one string
+        :returns tuple of count, list of page tuples, string of HTML bodies ("" if report_path)
+        """
+        engine = SearchEngine(search_term, ignore_case=ignore_case)  # compiled once for all courses
+        if offline:  # the page store, no Canvas requests to search
+            return self.search_replace_pages_db(search_term, replace_term, search_only,
+                                                ignore_case, dryrun, engine=engine)
+        if concurrent and (search_only or dryrun):
+            sum_count, sum_found_pages, sum_marked_bodies = 0, [], ""
+            report = SearchReport(report_path, engine.terms, self.canvas_url) if report_path else nullcontext()
+            with Progress(console=self.console) as progress, report:
+                task_search = progress.add_task("[green]Search courses...", total=None)
+                for hit in self.iter_search_pages_all_courses(engine=engine,
+                                                              on_course_done=lambda: progress.advance(task_search)):
+                    sum_count += hit.count
+                    sum_found_pages.append(hit.as_tuple())
+                    if report_path:
+                        report.add(hit)
+                    else:
+                        sum_marked_bodies += hit.marked_body
+            return sum_count, sum_found_pages, sum_marked_bodies
 
         with Progress(console=self.console) as progress:
             task_count = progress.add_task("[green]Getting all courses...",
@@ -1543,7 +2383,8 @@ class CanvasRobot(object):
                                                                                          replace_term=replace_term,
                                                                                          search_only=search_only,
                                                                                          ignore_case=ignore_case,
-                                                                                         dryrun=dryrun)
+                                                                                         dryrun=dryrun,
+                                                                                         engine=engine)
                 except (NameError, Exception) as e:
                     logger.error("Error {}".format(e))
                     pass
@@ -1555,11 +2396,60 @@ class CanvasRobot(object):
 
         return sum_count, sum_found_pages, sum_marked_bodies
 
+    def iter_search_pages_all_courses(self,
+                                      search_term: str | list[str] = "",
+                                      ignore_case: bool = True,
+                                      engine: SearchEngine | None = None,
+                                      max_workers: int | None = None,
+                                      on_course_done: Callable[[], None] | None = None) -> Iterator[PageHit]:
+        """
+        search the pages of all courses, courses are searched concurrently (and listed lazily),
+        so memory stays bounded: only the hits of the courses in progress are kept
+        :param search_term: text to find, or a list of texts
+        :param engine: compiled search terms (search_term is ignored)
+        :param max_workers: number of courses searched at the same time
+        :param on_course_done: called (on the calling thread) after each course
+        :returns generator of PageHit, with the marked body of each found page
+        """
+        engine = engine or SearchEngine(search_term, ignore_case=ignore_case)
+
+        def search_course(course) -> list[PageHit]:
+            # skip the course if it is selected only because of a studentEnrollment
+            for enrollment in getattr(course, 'enrollments', None) or []:
+                if enrollment['role'] == 'StudentEnrollment':
+                    return []
+            hits = []
+            for page in course.get_pages(include=['body']):
+                if page.title[0:3] == 'UVT' or not engine.matches(page.body):
+                    continue
+                count, marked_body = engine.mark(page.body)
+                if count:
+                    hits.append(PageHit(course_id=course.id,
+                                        course_name=course.name,
+                                        url=page.url,
+                                        title=page.title,
+                                        count=count,
+                                        marked_body=marked_body))
+            return hits
+
+        for course, hits, error in run_throttled(search_course,
+                                                 read_ahead(self.canvas.get_courses()),
+                                                 max_workers=max_workers or self.max_workers,
+                                                 limiter=self.rate_limiter):
+            if on_course_done:
+                on_course_done()
+            if error:
+                logger.error(f"Search in course {course.id} failed: {error}")
+                continue
+            yield from hits
+
     def get_examinations_from_database(self,
                                        single_course: int = None,
                                        orderby=None,
-                                       candidate: bool = False):
+                                       candidate: bool = False,
+                                       mode: str = 'rows'):
         """ get all assignments/examinations in the current year
+        :param mode: see LocalDAL.select_as
         """
         db = self.db
         # include the NULL values
@@ -1578,21 +2468,28 @@ class CanvasRobot(object):
                                                    (db.examination.course ==
                                                     db.course.course_id))
         orderby = orderby or db.course.course_code
-        records = db(qry).select(db.examination.id,
-                                 db.examination.course,
-                                 db.examination.course_name,
-                                 db.examination.name,
-                                 db.examination.ignore,
-                                 db.course.course_code,
-                                 db.course.course_id,
-                                 orderby=orderby)
+        records = db.select_as(qry,
+                               db.examination.id,
+                               db.examination.course,
+                               db.examination.course_name,
+                               db.examination.name,
+                               db.examination.ignore,
+                               db.course.course_code,
+                               db.course.course_id,
+                               orderby=orderby,
+                               mode=mode)
         return records
 
     def get_courses_from_database(self,
                                   skip_courses_without_students=False,
                                   qry=None,
                                   orderby=None,
-                                  fields=None):
+                                  fields=None,
+                                  mode: str = 'rows'):
+        """
+        :param fields: default all fields of course
+        :param mode: see LocalDAL.select_as, like 'cursor' to stream the courses
+        """
         db = self.db
         if skip_courses_without_students:
             cur_qry = (db.course.nr_students > 0) & (db.course.ac_year == self.year)
@@ -1605,8 +2502,9 @@ class CanvasRobot(object):
         fields = fields or db.course.ALL
         orderby = orderby or db.course.course_code
         try:
-            records = db(cur_qry).select(fields,
-                                         orderby=orderby)
+            records = db.select_as(cur_qry, *(fields if isinstance(fields, (list, tuple)) else (fields,)),
+                                   orderby=orderby,
+                                   mode=mode)
         except binascii.Error:
             logger.exception("Wrong content in image field?")
         else:
@@ -1638,16 +2536,23 @@ class CanvasRobot(object):
         db(qry).update(**ud_fields)
         db.commit()
 
-    def update_db_for(self, course, only_course: bool = False) -> int:  # , single_course: int = None):
+    def update_db_for(self, course, only_course: bool = False,
+                      record: CourseRecord | None = None) -> int:  # , single_course: int = None):
         """
         updating the course in the db
         :param only_course: if True, we won't record examinations and documents
         :param course: a course object
+        :param record: the course from prefetch_courses, its teachers and number
+        of students are not requested again
         :return:
         """
 
         def count_students(course: canvasapi.Course) -> int:
             """" return -1 if not authorised"""
+            # listed with include=["total_students"]: counted by Canvas, without the test student
+            total_students = getattr(course, 'total_students', None)
+            if total_students is not None:
+                return total_students
             # students
             try:
                 students = course.get_users(enrollment={'type': 'StudentEnrollment'})
@@ -1668,7 +2573,7 @@ class CanvasRobot(object):
         nr_students = count_students(course)  # -1 if not authorised
 
         # ud teachers
-        result = self.update_db_teachers(course)
+        result = self.update_db_teachers(course, listed_teachers=record.teachers if record else None)
         if is_err(result):
             teacher_logins, teacher_names, teacher_ids = (), (), ()
         else:
@@ -1701,6 +2606,10 @@ class CanvasRobot(object):
                                                 course_name=item.course_name,
                                                 name=item.name
                                                 )
+        if not only_course:
+            self.update_enrollment_index(course)
+            self.update_page_store(course)
+
         for user_id in teacher_ids:
             _ = db.course2user.update_or_insert((db.course2user.course == c_id) &
                                                 (db.course2user.user == user_id),
@@ -1708,7 +2617,16 @@ class CanvasRobot(object):
                                                 user=user_id,
                                                 role='T')
 
-        files = [] if only_course else course.get_files()
+        files = [] if only_course else read_ahead(course.get_files())
+        self.store_documents(c_id, files)  # stored while the next page is received
+
+        db.commit()
+
+        return c_id  # course id in db for new of existing course
+
+    def store_documents(self, c_id: int, files):
+        """record the (canvasapi) files of the course with db id c_id in the table document"""
+        db = self.db
         for file in files:
             _ = db.document.update_or_insert((db.document.course == c_id) &
                                              (db.document.url == file.url),
@@ -1719,10 +2637,6 @@ class CanvasRobot(object):
                                              size=file.size,
                                              content_type=getattr(file, 'content-type'))
 
-        db.commit()
-
-        return c_id  # course id in db for new of existing course
-
     def update_db_course(self, course, creation_date, md, nr_students, teacher_logins, teacher_names):
         """update table course
         :returns new row.id if a new row is inserted, or None if a row is only updated"""
@@ -1760,49 +2674,98 @@ class CanvasRobot(object):
             raise
         return row_id
 
-    def update_db_teachers(self, course) -> Result[tuple[list[str], list[str], list[int]], str]:
-        db = self.db
-        try:
-            teachers = list(course.get_users(enrollment={'type': 'TeacherEnrollment'}))
-            # if self.admin(-id) profile and mail comes along...
-            # list(), to force check permission
-        except canvasapi.exceptions.Forbidden:
-            msg = f"Not authorized to get info about Teachers in {course.name}"
+    def resolve_teacher_logins(self, course, teachers):
+        """
+        set login_id and email of the teachers which lack them (no admin rights to
+        receive them with the users). Profiles come from the user cache (shared by all
+        courses of a sync), the unknown ones are requested concurrently
+        :param course: for the messages
+        :param teachers: canvasapi users, updated in place
+        """
+        unknown = []
+        for teacher in teachers:
+            if hasattr(teacher, 'login_id'):
+                self.user_cache.put_user(teacher)  # next lookups of this teacher are free
+                continue
+            entry = self.user_cache.get('id', teacher.id)
+            if entry and entry.found and entry.profile:
+                self.set_profile_attributes(teacher, entry.profile)
+            elif entry and entry.found and entry.attributes.get('login_id'):
+                # cached from a listing with login_id (put_user without profile)
+                teacher.login_id = entry.attributes['login_id']
+                teacher.email = entry.attributes.get('email', "n.a.")
+                if not hasattr(teacher, 'sortable_name') and entry.attributes.get('sortable_name'):
+                    teacher.sortable_name = entry.attributes['sortable_name']
+            else:
+                unknown.append(teacher)
+
+        for teacher, profile, error in run_throttled(self.get_profile, unknown,
+                                                     max_workers=self.max_workers,
+                                                     limiter=self.rate_limiter):
+            if error is None:
+                self.set_profile_attributes(teacher, profile)
+                continue
+            if isinstance(error, canvasapi.exceptions.ResourceDoesNotExist):
+                msg = f"Teacher {teacher.id=}{teacher.name} in {course.name} not found"
+                logger.error(msg)
+            elif isinstance(error, canvasapi.exceptions.Forbidden):
+                msg = f"Not authorized to get login/mail info about teacher{teacher.name} in {course.name}"
+            else:
+                msg = f"Getting the profile of teacher {teacher.name} in {course.name} failed: {error}"
+                logger.error(msg)
             self.errors.append(msg)
-            return Err(msg)
+            teacher.login_id = "n.a."
+            teacher.email = "n.a."
+        self.user_cache.flush()  # the workers leave that to the main thread
+
+    @staticmethod
+    def set_profile_attributes(user, profile: dict):
+        """login_id and email from the profile; sortable_name too, for a user
+        known only by the teachers included in a course listing"""
+        user.login_id = profile["login_id"]
+        user.email = profile["primary_email"]
+        if not hasattr(user, 'sortable_name') and profile.get("sortable_name"):
+            user.sortable_name = profile["sortable_name"]
+
+    def update_db_teachers(self, course,
+                           listed_teachers: list[dict] | None = None) -> Result[tuple[list[str], list[str], list[int]], str]:
+        """
+        :param listed_teachers: the teachers included in the course listing (id and
+        display_name), if given the teachers of the course are not requested
+        """
+        db = self.db
+        if listed_teachers is not None:
+            teachers = [canvasapi.user.User(self.requester, dict(id=teacher['id'],
+                                                                 name=teacher['display_name']))
+                        for teacher in listed_teachers]
+        else:
+            try:
+                # with admin rights email and login_id come along, saving a profile request per teacher
+                teachers = list(course.get_users(enrollment={'type': 'TeacherEnrollment'},
+                                                 include=['email']))
+                # list(), to force check permission
+            except canvasapi.exceptions.Forbidden:
+                msg = f"Not authorized to get info about Teachers in {course.name}"
+                self.errors.append(msg)
+                return Err(msg)
+        self.resolve_teacher_logins(course, teachers)
         teachers_ids = []
         for teacher in teachers:
-            if not hasattr(teacher, 'login_id'):  # can't use the db.user table ...
-                try:
-                    profile = self.canvas.get_user(teacher.id).get_profile()
-                    teacher.login_id = profile["login_id"]
-                    teacher.email = profile["primary_email"]
-                except canvasapi.exceptions.Forbidden:
-                    msg = f"Not authorized to get login/mail info about teacher{teacher.name} in {course.name}"
-                    self.errors.append(msg)
-                    teacher.login_id = "n.a."
-                    teacher.email = "n.a."
-                except canvasapi.exceptions.ResourceDoesNotExist:
-                    msg = f"Teacher {teacher.id=}{teacher.name} in {course.name} not found"
-                    logger.error(msg)
-                    self.errors.append(msg)
-                    teacher.login_id = "n.a."
-                    teacher.email = "n.a."
             try:
                 first_name, last_name, prefix = self.parse_sortable_name(teacher)
             except (Exception, TypeError, ValueError) as _:
-                first_name, last_name, prefix = "", "", ""
+                name_fields = {}  # keep the stored names
+            else:
+                name_fields = dict(first_name=first_name, prefix=prefix, last_name=last_name)
 
             inserted_id = db.user.update_or_insert(db.user.username ==
                                                    teacher.login_id,
                                                    user_id=teacher.id,
                                                    name=teacher.name,
-                                                   first_name=first_name,
-                                                   prefix=prefix,
-                                                   last_name=last_name,
                                                    username=teacher.login_id,
                                                    email=teacher.email,
-                                                   role='T')
+                                                   role='T',
+                                                   **name_fields)
             inserted_id = inserted_id or db(db.user.username ==
                                             teacher.login_id).select().first().id
             teachers_ids.append(inserted_id)
@@ -1855,43 +2818,40 @@ class CanvasRobot(object):
             courses = [self.get_course_using_osiris_id(single_course_osiris_id)]
             target = f" course {single_course}"
         elif single_course:
-            courses = [self.get_course(single_course)]
+            courses = [self.get_course(single_course, include=COURSE_LISTING_INCLUDE)]
             target = f" course {single_course}"
         else:
-            courses = self.admin.get_courses()
+            courses = None  # listed once, with their term, teachers and number of students
             target = " all courses"
+        records = self.prefetch_courses(courses)
         if max_number:
             target = f" {max_number} courses"
 
         with Progress(console=self.console) as progress:
-            task_count = progress.add_task("[green]Counting courses...", total=None)
-
             num_rows = 0
-            num_courses = len(list(courses))
-            max_number = max_number or num_courses
-            progress.remove_task(task_count)
-
+            # the account listing is processed while it is read: its length is unknown
+            num_courses = len(courses) if courses is not None else None
             task_process = progress.add_task("[green]Process courses...",
                                              total=num_courses)
-            for idx, course in enumerate(courses):
+            for idx, record in enumerate(records):
                 progress.update(task_process,
-                                description=f"[green]Processing course {course.name}...",
+                                description=f"[green]Processing course {record.name}...",
                                 advance=1)  # Update de voortgangsbalk
-                self.add_message("<Progress>", (course.name, idx, num_courses))
+                self.add_message("<Progress>", (record.name, idx, num_courses))
 
                 # only insert/update course if current year unless single_course
-                if (str(course.term)[:4] != str(self.year)
-                    or course.name.endswith('conclude')) \
+                if (record.term[:4] != str(self.year)
+                    or record.name.endswith('conclude')) \
                         and not (single_course or single_course_osiris_id):
                     continue
                 # skip specified courses
-                if stop_list and course.name in stop_list:
+                if stop_list and record.name in stop_list:
                     continue
                 # break prematurely?
-                if idx > max_number:
+                if max_number and idx > max_number:
                     break
 
-                self.update_db_for(course)  # , single_course=single_course)
+                self.update_db_for(record.course, record=record)  # , single_course=single_course)
                 num_rows += 1
 
             msg = f"[green]Updated db from Canvas for {target}. {num_rows} rows changed"
@@ -1903,6 +2863,192 @@ class CanvasRobot(object):
         db.commit()
         return num_rows
 
+    def prefetch_courses(self, courses=None) -> Iterator[CourseRecord]:
+        """
+        the bulk stage of update_database_from_canvas: term, teachers and number of
+        students of all account courses come with the listing itself
+        :param courses: canvasapi courses (requested with include=COURSE_LISTING_INCLUDE),
+        if None all courses of the admin account are listed, the next page is read
+        while the courses of the current one are processed
+        :returns generator of a record per course, for update_db_for
+        """
+        if courses is None:
+            courses = read_ahead(self.admin.get_courses(include=COURSE_LISTING_INCLUDE))
+        return (self.course_record(course) for course in courses)
+
+    @staticmethod
+    def course_record(course) -> CourseRecord:
+        term = getattr(course, 'term', None)
+        return CourseRecord(course_id=course.id,
+                            name=course.name,
+                            term=str(term.get('name') if isinstance(term, dict) else term or ""),
+                            teachers=getattr(course, 'teachers', None),
+                            total_students=getattr(course, 'total_students', None),
+                            updated_at=getattr(course, 'updated_at', None),
+                            course=course)
+
+    # ASYNC variants of the bulk paths ----------------------------------
+    def async_canvas(self, **kwargs) -> AsyncCanvas:
+        """asyncio Canvas client, next to self.canvas. See async_client.py"""
+        kwargs.setdefault('rate', MAX_REQUESTS_PER_SECOND)
+        kwargs.setdefault('max_in_flight', MAX_IN_FLIGHT)
+        kwargs.setdefault('policy', self.pagination_policy)
+        return AsyncCanvas(self.canvas_url, self.config.api_key, **kwargs)
+
+    @property
+    def requester(self):
+        """requester of self.canvas, to wrap JSON from the async client in canvasapi objects"""
+        # noinspection PyProtectedMember,PyUnresolvedReferences
+        return self.canvas._Canvas__requester
+
+    async def update_database_from_canvas_async(self,
+                                                single_course=None,
+                                                max_number=None,
+                                                stop_list=None) -> int:
+        """
+        fast variant of update_database_from_canvas: the courses of the year with their
+        enrollments, files and pages are read with many requests in flight.
+        Updated are the course rows (name, term, teachers, number of students), the
+        enrollment index, the documents and the page store. The metadata about modules,
+        assignments and examinations is only collected by update_database_from_canvas
+        :param single_course
+        :param max_number: stop earlier
+        :param stop_list: courses to ignore
+        :return number of updated courses
+        """
+        db = self.db
+        include = {'include[]': COURSE_LISTING_INCLUDE}
+        async with self.async_canvas() as canvas:
+            if single_course:
+                courses = [await canvas.get_course(single_course, **include)]
+            else:
+                courses = [course async for course in canvas.get_courses(self.admin_id, **include)
+                           if str((course.get('term') or {}).get('name'))[:4] == str(self.year)
+                           and not course['name'].endswith('conclude')
+                           and not (stop_list and course['name'] in stop_list)]
+            courses = courses[:max_number] if max_number else courses
+
+            async def fetch(course: dict):
+                course_id = course['id']
+                enrollments, files, pages = await asyncio.gather(
+                    canvas.get_enrollments(course_id, **{'state[]': ['active', 'invited']}),
+                    canvas.get_files(course_id),
+                    canvas.get_pages(course_id))
+                changed, removed = self.pages_to_refresh(course_id, [self.as_page(page, course_id)
+                                                                     for page in pages])
+                full_pages = await asyncio.gather(*(canvas.get_page(course_id, page.url) for page in changed))
+                return course, enrollments, files, full_pages, removed
+
+            num_rows = 0
+            with Progress(console=self.console) as progress:
+                task_process = progress.add_task(f"[green]Process {len(courses)} courses...", total=len(courses))
+                for next_done in asyncio.as_completed([fetch(course) for course in courses]):
+                    try:
+                        course, enrollments, files, full_pages, removed = await next_done
+                    except httpx.HTTPError as e:
+                        self.errors.append(f"Course not updated: {e}")
+                        continue
+                    finally:
+                        progress.advance(task_process)
+                    # the db is only written here, by the event loop thread
+                    c_id = self.update_db_course_listing(course)
+                    self.store_enrollment_index(course['id'],
+                                                [canvasapi.enrollment.Enrollment(self.requester, enrollment)
+                                                 for enrollment in enrollments])
+                    self.store_documents(c_id, [canvasapi.file.File(self.requester, file) for file in files])
+                    self.store_pages(course['id'],
+                                     [self.as_page(page, course['id']) for page in full_pages],
+                                     removed)
+                    num_rows += 1
+            self.console.print(f"[green]Updated db from Canvas for {num_rows} courses "
+                               f"({canvas.requests} requests)")
+        db.setting.update_or_insert(db.setting.id == 1,
+                                    last_db_update=datetime.now(timezone.utc))
+        db.commit()
+        return num_rows
+
+    def as_page(self, page: dict, course_id: int) -> Page:
+        """canvasapi Page from the JSON of the async client"""
+        return Page(self.requester, {**page, 'course_id': course_id})
+
+    def update_db_course_listing(self, course: dict) -> int:
+        """
+        update the course row with the fields of a course listing (include term,
+        teachers, total_students); the other fields are kept
+        :returns db id of the course"""
+        db = self.db
+        teachers = course.get('teachers') or []
+        row_id = db.course.update_or_insert(db.course.course_id == course['id'],
+                                            course_id=course['id'],
+                                            account_id=course.get('account_id'),
+                                            course_code=course.get('course_code'),
+                                            term=(course.get('term') or {}).get('name'),
+                                            sis_code=course.get('sis_course_id') or "n.a.",
+                                            name=course['name'],
+                                            creation_date=datetime.strptime(course['created_at'],
+                                                                            "%Y-%m-%dT%H:%M:%SZ"),
+                                            ac_year=self.year,
+                                            nr_students=course.get('total_students', -1),
+                                            teachers_names=[teacher['display_name'] for teacher in teachers])
+        if row_id:  # a new course has been inserted in the db: signal this in the status field
+            db(db.course.id == row_id).update(status=2)
+            return row_id
+        return db(db.course.course_id == course['id']).select(db.course.id).first().id
+
+    async def search_pages_all_courses_async(self,
+                                             search_term: str | list[str],
+                                             ignore_case: bool = True,
+                                             report_path: Path | None = None) -> tuple[int, list[tuple], str]:
+        """
+        like course_search_replace_pages_all_courses (search only), the pages of all
+        courses are read with many requests in flight
+        :param search_term: text to find, or a list of texts
+        :param report_path: write the marked pages to this HTML file, instead
+        of returning them as one string
+        :returns tuple of count, list of page tuples, string of HTML bodies ("" if report_path)
+        """
+        engine = SearchEngine(search_term, ignore_case=ignore_case)
+        sum_count, sum_found_pages, sum_marked_bodies = 0, [], ""
+        report = SearchReport(report_path, engine.terms, self.canvas_url) if report_path else nullcontext()
+        async with self.async_canvas() as canvas:
+            # skip the courses selected only because of a studentEnrollment
+            courses = [course async for course in canvas.get_courses()
+                       if not any(enrollment.get('role') == 'StudentEnrollment'
+                                  for enrollment in course.get('enrollments') or [])]
+
+            async def fetch(course: dict):
+                return course, await canvas.get_pages(course['id'], include_body=True)
+
+            with Progress(console=self.console) as progress, report:
+                task_search = progress.add_task(f"[green]Search {len(courses)} courses...", total=len(courses))
+                for next_done in asyncio.as_completed([fetch(course) for course in courses]):
+                    try:
+                        course, pages = await next_done
+                    except httpx.HTTPError as e:
+                        logger.error(f"Search in course failed: {e}")
+                        continue
+                    finally:
+                        progress.advance(task_search)
+                    for page in pages:
+                        if page['title'][0:3] == 'UVT' or not engine.matches(page.get('body')):
+                            continue
+                        count, marked_body = engine.mark(page['body'])
+                        if not count:
+                            continue
+                        hit = PageHit(course_id=course['id'],
+                                      course_name=course['name'],
+                                      url=page['url'],
+                                      title=page['title'],
+                                      count=count,
+                                      marked_body=marked_body)
+                        sum_count += count
+                        sum_found_pages.append(hit.as_tuple())
+                        if report_path:
+                            report.add(hit)
+                        else:
+                            sum_marked_bodies += marked_body
+        return sum_count, sum_found_pages, sum_marked_bodies
+
     def is_user_valid(self, userinfo) -> tuple[bool, str]:
         """"
         :param userinfo (dict, instance, named tuple or Storage instance with
@@ -1916,8 +3062,8 @@ class CanvasRobot(object):
             user = userinfo
 
         try:
-            user = self.canvas.get_user(user.id)
-            profile = user.get_profile()
+            user = self.get_user_cached(user.id)
+            profile = self.get_profile(user)
         except canvasapi.exceptions.ResourceDoesNotExist:
             return False, "User (and profile) not found, assume False"
         except canvasapi.exceptions.Forbidden:
@@ -1983,37 +3129,57 @@ class CanvasRobot(object):
         enrollments = filter(filter_student, enrollments)
         return enrollments
 
-    def cleanup_community(self, c_id, report_only):
+    def cleanup_community(self, c_id, report_only, concurrent=True):
         """
         given an id of a community (course)
         remove invalid enrollments
+        :param c_id: community name or course_id
+        :param report_only: if True only report the invalid enrollments
+        :param concurrent: validate the students using a bounded thread pool (reusing
+        cached profiles) and deactivate the invalid enrollments afterwards in a throttled batch
+        :returns list of removed (name, reason), list of errors, message
         """
-        # result = self.check_c_cid(c_id)
-        # if result != 'ok':
-        #    return result
-
-        course = self.get_course(COMMUNITIES[c_id])
-        enrollments = course.get_enrollments()
+        course_id = self.get_course_id_by_name(c_id) if isinstance(c_id, str) else c_id
+        course = self.get_course(course_id)
+        # validation starts on the first page of enrollments
+        enrollments = (enrollment for enrollment in read_ahead(course.get_enrollments(type=['StudentEnrollment']))
+                       if enrollment.user['name'].lower() != 'test student')
         errors = []
-        removed = []
-        for enrollment in enrollments:
-            if enrollment.user['fname'].lower() == 'test student':
+        invalid = []  # (enrollment, reason)
+
+        def validate(enrollment):
+            return self.is_user_valid(enrollment.user)
+
+        # load the user cache before the workers start using it
+        user_cache = self.user_cache
+        logger.debug(f"{len(user_cache.entries)} cached user entries, "
+                     f"validating the students of course {course_id}")
+        validations = run_throttled(validate, enrollments,
+                                    max_workers=self.max_workers if concurrent else 1,
+                                    limiter=self.rate_limiter)
+        for enrollment, validation, error in validations:
+            if error:
+                errors.append(f"{enrollment.user['name']} not retrieved {error}")
                 continue
-            if enrollment.role == 'StudentEnrollment':
-                try:
-                    valid, reason = self.is_user_valid(enrollment.user)
-                except Exception as e:
-                    errors.append(f"{enrollment.user['fname']} not retrieved {e}")
-                    continue
-                if not valid:
+            valid, reason = validation
+            if not valid:
+                invalid.append((enrollment, reason))
+        self.user_cache.flush()
 
-                    if not report_only:
-                        try:
-                            enrollment.deactivate('delete')
-                        except Exception as e:
-                            errors.append(e)
-                            continue
-                    removed.append((enrollment.user['fname'], reason))
+        removed = []
+        if report_only:
+            removed = [(enrollment.user['name'], reason) for enrollment, reason in invalid]
+        else:
+            reasons = {enrollment.id: reason for enrollment, reason in invalid}
+            deactivations = run_throttled(self.deactivate_enrollment,
+                                          [enrollment for enrollment, _ in invalid],
+                                          max_workers=self.max_workers if concurrent else 1,
+                                          limiter=self.rate_limiter)
+            for enrollment, _, error in deactivations:
+                if error:
+                    errors.append(error)
+                    continue
+                removed.append((enrollment.user['name'], reasons[enrollment.id]))
 
         num_removed = len(removed)
         msg = (f"{num_removed} students would have been removed"
@@ -2043,58 +3209,35 @@ class CanvasRobot(object):
 
         return d['first_name_par'] or d['first_name'], d['prefix'] or '', d['last_name']
 
-    def download_file(self, url=None, fname=None):
+    def download_file(self, url=None, fname=None, chunk_size: int = DOWNLOAD_CHUNK_SIZE):
         """download a remote file to a static folder from url
         :param fname: local file to write to
         :param url: remote url to fetch a file from
+        :param chunk_size: bytes per read from the response stream
         """
-        filename = 'static/' + fname.strip()
-        logger.info("creating file %s for %s" % (filename, url))
-        # convert to fname/value pairs
-        cookies = {}
-        for cookie in self.cookies:
-            cookies[str(cookie['fname'])] = cookie['value']
-        with open(filename, 'wb') as outfile:
-            r = requests.get(url, cookies=cookies, stream=True)
-            if r.status_code == 200:
-                for block in r.iter_content(1024):
-                    if not block:
-                        break
-                    outfile.write(block)
-            else:
-                logger.info("html error %s" % r.status_code)
-        return r.status_code
+        logger.info("creating file static/%s for %s" % (fname.strip(), url))
+        downloader = self.get_downloader(Path('static'), chunk_size=chunk_size, max_workers=1)
+        return downloader.download(url, fname.strip()).status
 
-    @staticmethod
-    def receive_file(db, filename, outfile, r, url):
-        """ receive a downloading file in the database"""
-        logger.debug('Start receiving file in buffer')
-        for block in r.iter_content(1024):
-            if not block:
-                logger.debug('.')
-                break
-            outfile.write(block)
-        outfile.seek(0)  # rewind
-        content_type = r.headers['content-type']
-        full_filename = 'undef'
+    def receive_file(self, path: Path, url, document_id=None, sha256: str | None = None):
+        """ receive a downloaded file in the file store, linked to its document
+        (by id or else by url). The transfer copy is removed"""
+        db = self.db
+        if not document_id:
+            row = db(db.document.url == url).select(db.document.id).first()
+            if row is None:
+                logger.error(f"no document with url {url} for {path.name}")
+                return None
+            document_id = row.id
         try:
-            full_filename = filename + mimetypes.guess_extension(content_type) or ''
-            thisfile = db.bbdocument.bbfile.store(outfile, full_filename)
-        except TypeError as e:
-            msg = "unable to store {} with content-type {} {}".format(filename,
-                                                                      content_type,
-                                                                      e)
-            logger.error(msg)
+            sha256 = self.store_document(document_id, path, sha256)
         except IOError as e:
-            msg = "unable to store {} based on {} and {} {}".format(full_filename,
-                                                                    filename,
-                                                                    content_type,
-                                                                    e)
-            logger.error(msg)
-        else:
-            logger.info("{} should be in uploads folder...".format(full_filename))
-            db(db.bbdocument.url == url).update(bbfile=thisfile)
-            db.commit()
+            logger.error(f"unable to store {path.name}: {e}")
+            return None
+        path.unlink()
+        db.commit()
+        logger.info(f"{path.name} is in the file store as {sha256}")
+        return sha256
 
     def course_grades(self, c_id):
         course = self.get_course(c_id)
@@ -2251,36 +3394,109 @@ class CanvasRobot(object):
         for _, questions in data:
             total_questions += len(questions)
 
+        course = self.get_course(course_id)  # once for all quizzes
+        questions_done = 0
+
         for quiz_name, questions in track(data):  # for non-gui progress
 
-            quiz_id = self.create_quiz(course_id=course_id,
-                                       title=quiz_name,
-                                       quiz_type="practice_quiz")
-            stats.quiz_ids.append(quiz_id)
-            for index, (question_text, answers) in enumerate(questions, start=1):
-                # answers_asdict = [asdict(answer) for answer in answers]
-                question_dto = QuestionDTO(question_name=question_format.format(index),
-                                           question_text=question_text,
-                                           answers=answers)
-                question_id = self.create_question(course_id=course_id,
-                                                   quiz_id=quiz_id,
-                                                   question_dto=question_dto)
-                stats.question_ids.append(question_id)
+            builder = QuizBuilder.create(course,
+                                         title=quiz_name,
+                                         quiz_type="practice_quiz",
+                                         max_workers=self.max_workers,
+                                         limiter=self.rate_limiter)
+            stats.quiz_ids.append(builder.quiz.id)
+            question_dtos = [QuestionDTO(question_name=question_format.format(index),
+                                         question_text=question_text,
+                                         answers=answers)
+                             for index, (question_text, answers) in enumerate(questions, start=1)]
+
+            def report_progress(handled):
                 if gui_root:
-                    gui_queue.put(index / total_questions)
+                    gui_queue.put((questions_done + handled) / total_questions)
                     gui_root.event_generate('<<CreateQuizzes:Progress>>')
 
+            stats.question_ids.extend(builder.add_questions(question_dtos,
+                                                            on_progress=report_progress))
+            questions_done += len(question_dtos)
+            self.errors.extend(builder.errors)
+
         if gui_root:
             gui_root.event_generate('<<CreateQuizzes:Done>>')
 
         return stats
 
+    def get_folder_index(self, course, refresh=False) -> CourseFolderIndex:
+        """
+        :param course: Canvas course
+        :param refresh: if True list the folders again
+        :returns the (cached) folder index of the course, only the
+        MAX_FOLDER_INDEXES most recently used are kept"""
+        with self.folder_indexes_lock:
+            folder_index = None if refresh else self.folder_indexes.get(course.id)
+            if folder_index:
+                self.folder_indexes.move_to_end(course.id)
+                return folder_index
+        folder_index = CourseFolderIndex(course)  # listing the folders, not holding the lock
+        with self.folder_indexes_lock:
+            self.folder_indexes[course.id] = folder_index
+            self.folder_indexes.move_to_end(course.id)
+            if len(self.folder_indexes) > MAX_FOLDER_INDEXES:
+                self.folder_indexes.popitem(last=False)
+        return folder_index
+
+    def get_course_tabs(self, course_id: int, refresh=False) -> dict:
+        """
+        :param course_id:
+        :param refresh: if True list the tabs again
+        :returns the (cached) tabs of the course as a dict with the label as key.
+        One get_tabs call per course"""
+        if refresh or course_id not in self.course_tabs:
+            # a course object with just the id is enough to list its tabs
+            # noinspection PyProtectedMember,PyUnresolvedReferences
+            course = Course(self.canvas._Canvas__requester, dict(id=course_id))
+            self.course_tabs[course_id] = {tab.label: tab for tab in course.get_tabs()}
+        return self.course_tabs[course_id]
+
     def get_course_tab_by_label(self, course_id: int, label: str):
-        course = self.get_course(course_id)
-        for tab in course.get_tabs():
-            if tab.label == label:
-                return tab
-        raise Exception(f"In course with course_id {course_id}, the tab with label '{label}' not found")
+        tab = self.get_course_tabs(course_id).get(label)
+        if tab is None:
+            raise Exception(f"In course with course_id {course_id}, the tab with label '{label}' not found")
+        return tab
+
+    def get_files_tab(self, course_id: int):
+        """:returns the Files tab (label 'Files' or 'Bestanden') or None"""
+        tabs = self.get_course_tabs(course_id)
+        return tabs.get("Files") or tabs.get("Bestanden")
+
+    def audit_files_tab_visibility(self, max_workers: int | None = None) -> list[FilesTabVisibility]:
+        """
+        check the visibility of the Files tab in all active courses, concurrently
+        :param max_workers: defaults to self.max_workers
+        :returns list of FilesTabVisibility for the courses with a public Files tab"""
+        courses = self.get_all_active_courses(from_db=False)
+
+        def files_tab(course):
+            return self.get_files_tab(course.id)
+
+        visible = []
+        for course, tab, error in track(run_throttled(files_tab, courses,
+                                                      max_workers=max_workers or self.max_workers,
+                                                      limiter=self.rate_limiter),
+                                        total=len(courses),
+                                        description="Check Files tab of all current courses...",
+                                        console=self.console):
+            if error:
+                self.errors.append(f"Tabs of {course.name} ({course.id}) not retrieved: {error}")
+                continue
+            if tab is None:
+                logger.warning(f"Files tab of {course.name} {course.id} missing")
+                continue
+            if getattr(tab, 'visibility', None) == "public" and not getattr(tab, 'hidden', False):
+                logger.warning(f"Files folder of {course.name} ({course.id}) is visible")
+                visible.append(FilesTabVisibility(course_id=course.id,
+                                                  course_name=course.name,
+                                                  visibility=tab.visibility))
+        return visible
 
     def create_folder_in_course_files(self, course_id: int, foldername: str,
                                       locked=True, report_only=False):
@@ -2295,16 +3511,9 @@ class CanvasRobot(object):
         course = self.get_course(course_id)
         folder_created = 0
 
-        def name_variant(source, target):
-            # match Tentamens, Tentamens 2020, etc but not tentamens/inner
-            # noinspection RegExpRedundantEscape
-            result = re.match(fr'^course files\/{source}(?!.*\/.*$)', target)
-            return result
-
-        folders_named_exact = [folder for folder in course.get_folders()
-                               if f"course files/{foldername}" == folder.full_name]
-        folders_named_variants = [folder for folder in course.get_folders()
-                                  if name_variant(foldername, folder.full_name)]
+        folder_index = self.get_folder_index(course)
+        folders_named_exact = folder_index.exact(foldername)
+        folders_named_variants = folder_index.variants(foldername)
         for folder in folders_named_variants:
             # find/check folder(s) containing 'file_name' with possible postfixes
             # like f'{file_name} 2025'
@@ -2330,6 +3539,8 @@ class CanvasRobot(object):
                 folder_id = course.create_folder(foldername,
                                                  parent_folder_path='/',
                                                  locked=locked)
+                with self.folder_indexes_lock:
+                    self.folder_indexes.pop(course_id, None)  # listed again on next use
                 logger.info(f"Folder '(course) "
                             f"files/{foldername}' ({folder_id}) is created "
                             f"as {locked=} now in ({course_id=})")
@@ -2357,20 +3568,32 @@ class CanvasRobot(object):
     def unpublish_subfolder_in_all_courses(self,
                                            foldername: str,
                                            files_too: bool = False,
-                                           check_only: bool = False):
-        for course in track(self.get_all_active_courses(from_db=False),
-                            description=(f"Checking all current"
-                                         f" courses "
-                                         f"for folder '{foldername}'..." if check_only
-                            else f"Unpublish all published folder {foldername}..."),
-                            console=self.console):
-            if course.name.endswith("_conclude"):
-                continue
-            # logger.info(course.name)
-            self.unpublish_folderitems_in_course(course.id,
-                                                 foldername,
-                                                 files_too,
-                                                 check_only)
+                                           check_only: bool = False,
+                                           max_courses: int = 4):
+        """
+        :param max_courses: number of courses processed at the same time
+        """
+        courses = [course for course in self.get_all_active_courses(from_db=False)
+                   if not course.name.endswith("_conclude")]
+
+        def unpublish(course):
+            return self.unpublish_folderitems_in_course(course.id,
+                                                        foldername,
+                                                        files_too,
+                                                        check_only)
+
+        for course, _, error in track(run_throttled(unpublish, courses,
+                                                    max_workers=max_courses),
+                                      total=len(courses),
+                                      description=(f"Checking all current"
+                                                   f" courses "
+                                                   f"for folder '{foldername}'..." if check_only
+                                                   else f"Unpublish all published folder {foldername}..."),
+                                      console=self.console):
+            if error:
+                msg = f"Unpublish '{foldername}' in {course.name} ({course.id}) failed: {error}"
+                logger.error(msg)
+                self.errors.append(msg)
 
     def unpublish_folderitems_in_course(self, course_id: int,
                                         foldername: str,
@@ -2386,68 +3609,80 @@ class CanvasRobot(object):
         file_changes = 0
         folder_changes = 0
 
-        def unpublish_items(file_or_folder):
+        def unpublish_items(top_folder):
+            """walk the tree below top_folder (breadth first, concurrently), then
+            lock the published folders and files through a throttled write queue"""
             nonlocal folder_changes
             nonlocal file_changes
-            nonlocal course_id
-            for folder_ in file_or_folder.get_folders():
-                if not folder_.locked:
-                    folder_.update(locked=True)
+            to_lock = []  # folders and files
+            for folder_, files in walk_folder_tree(top_folder,
+                                                   max_workers=self.max_workers,
+                                                   limiter=self.rate_limiter):
+                if folder_ is not top_folder and not folder_.locked:
+                    to_lock.append(folder_)
+                to_lock.extend(file for file in files if not file.locked)
+            if check_only:
+                for item in to_lock:
+                    logger.warning(f"'{getattr(item, 'display_name', None) or item.full_name}' "
+                                   f"in {foldername} is published!")
+                return
+
+            def lock(item):
+                if isinstance(item, canvasapi.folder.Folder):
+                    return item.update(locked=True)
+                return file_update(item, locked=True)
+
+            for item, _, error in run_throttled(lock, to_lock,
+                                                max_workers=self.max_workers,
+                                                limiter=self.rate_limiter):
+                if error:
+                    self.errors.append(f"Unpublish of {item} failed: {error}")
+                elif isinstance(item, canvasapi.folder.Folder):
                     folder_changes += 1
-                    logger.info(f"Corrected: Folder '{folder_.full_name}' "
+                    logger.info(f"Corrected: Folder '{item.full_name}' "
                                 f"is now unpublished!")
-                unpublish_items(folder_)
-            for file in file_or_folder.get_files():
-                if not file.locked:
-                    if not check_only:
-                        file_update(file, locked=True)
-                        logger.info(f"Corrected: File "
-                                    f"'{file.display_name}' in {foldername} "
-                                    f"is now unpublished")
-                        file_changes += 1
-                    else:
-                        logger.warning(f"File '{file.display_name}' "
-                                       f"in {foldername} is published!")
+                else:
+                    file_changes += 1
+                    logger.info(f"Corrected: File "
+                                f"'{item.display_name}' in {foldername} "
+                                f"is now unpublished")
 
         # files_folder = 'course files'
         course_ids_missing_folder = []
         course = self.get_course(course_id)
-        folders = course.get_folders()
-        for folder in folders:  # paginated
-            if folder.full_name == foldername:
-                files_tab = self.get_course_tab_by_label(course_id, "Files") or \
-                            self.get_course_tab_by_label(course_id, "Bestanden")
-                try:
-                    if files_tab.visibility == "public":
-                        logger.warning(f"Files folder of {course.name}"
-                                       f" ({course.id}) is visible")
-                        # files_tab.visibility = "admins"
-                        # ! no change without a teacher's approval!
-                except AttributeError:
-                    logger.warning(f"Files tab visibility of "
-                                   f"{course.name} {course_id} missing")
-
-                # folder_id = folder.id
-                if not folder.locked:
-                    if not check_only:
-                        folder.update(locked=True)
-                        folder_changes += 1
-                        logger.info(
-                            f"Folder '{foldername}' is now unpublished"
-                            f" in course {course.name}")
-                    else:
-                        logger.warning(f"Folder '{foldername}' is published "
-                                       f"in course {course.name}({course.id})!")
+        folder = self.get_folder_index(course).by_full_name(foldername)
+        if folder:
+            files_tab = self.get_files_tab(course_id)
+            try:
+                if files_tab.visibility == "public":
+                    logger.warning(f"Files folder of {course.name}"
+                                   f" ({course.id}) is visible")
+                    # files_tab.visibility = "admins"
+                    # ! no change without a teacher's approval!
+            except AttributeError:
+                logger.warning(f"Files tab visibility of "
+                               f"{course.name} {course_id} missing")
+
+            # folder_id = folder.id
+            if not folder.locked:
+                if not check_only:
+                    folder.update(locked=True)
+                    folder_changes += 1
+                    logger.info(
+                        f"Folder '{foldername}' is now unpublished"
+                        f" in course {course.name}")
                 else:
-                    logger.debug(
-                        f"Folder '{foldername}' was already "
-                        f"unpublished/locked in course {course.name}")
-                if files_too:
-                    unpublish_items(folder)
-                    # for f in folder.get_files():
-                    #    if not f.locked:
-                    #        logger.warning(f"{f.filename} is published!")
-                break
+                    logger.warning(f"Folder '{foldername}' is published "
+                                   f"in course {course.name}({course.id})!")
+            else:
+                logger.debug(
+                    f"Folder '{foldername}' was already "
+                    f"unpublished/locked in course {course.name}")
+            if files_too:
+                unpublish_items(folder)
+                # for f in folder.get_files():
+                #    if not f.locked:
+                #        logger.warning(f"{f.filename} is published!")
         else:
             logger.info(f"Folder '{foldername}' not found in {course.name}")
             course_ids_missing_folder.append(course_id)
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from typing import Optional, NewType
 from pydal import DAL, Field, validators  # type: ignore
@@ -10,6 +10,10 @@ import keyring
 # for UI use rich or tkinter
 from rich.prompt import Prompt
 from tkinter import simpledialog
+try:  # type: ignore
+    import numpy as np  # type: ignore
+except ImportError:
+    np = None
 
 # from entities import Course
 
@@ -375,6 +379,37 @@ NEXT_YEAR = '-{0}-{1}'.format(AC_YEAR + 1, AC_YEAR + 2)
 
 EXAMINATION_FOLDER = "Tentamens"
 
+# concurrent Canvas requests (see throttle.py)
+MAX_WORKERS = 8  # size of the thread pools
+MAX_REQUESTS_PER_SECOND = 10  # shared by all workers of a robot
+MAX_IN_FLIGHT = 100  # requests of the asyncio client waiting for a response
+# page size per Canvas listing (the last segment of the endpoint, module items end with /items),
+# applied to the list requests of the robot without a per_page (canvasapi 3.x listings ask
+# for 100 themselves) and to the asyncio client. Canvas caps per_page at 100
+PAGINATION_POLICY: dict[str, int] = dict(courses=100,
+                                         pages=100,
+                                         modules=100,
+                                         items=100,
+                                         files=100,
+                                         folders=100,
+                                         enrollments=100,
+                                         users=100,
+                                         assignments=100,
+                                         submissions=100,
+                                         quizzes=100,
+                                         questions=100,
+                                         tabs=100)
+# result modes of LocalDAL.select_as: pydal Rows, plain tuples, a NumPy record array,
+# or a generator of tuples (streamed from the cursor)
+RESULT_MODES = ('rows', 'tuples', 'records', 'cursor')
+CURSOR_BATCH_SIZE = 1000  # rows fetched at a time in mode 'cursor'
+# asked for with every course listing, so the per course stages need no extra requests
+COURSE_LISTING_INCLUDE = ["term", "teachers", "total_students"]
+# courses hydrated from a list of ids (the CSV fallback) are requested again after
+COURSE_CACHE_TTL = timedelta(days=1)
+# folder indexes of the most recently used courses kept by a robot
+MAX_FOLDER_INDEXES = 32
+
 
 def load_config(default_path='ca_robot.yaml'):
     """
@@ -526,6 +561,7 @@ class LocalDAL(DAL):
                           Field('memo', 'string'),  # memo
                           # safe upload of files, keeps filenames
                           Field('file', 'upload'),
+                          Field('sha256', 'string'),  # content in the file store, see blob
                           migrate=True)
 
         self.define_table('course_urltransform',
@@ -552,9 +588,148 @@ class LocalDAL(DAL):
                           plural='Course Url transforms',
                           format='%(name)s[%(teacher_names)s]')
 
+        # inverted index user -> course, refreshed during sync (update_db_for)
+        self.define_table('enrollment_index',
+                          Field('user_id', 'integer'),  # canvas ids
+                          Field('course_id', 'integer'),
+                          Field('role', 'string'),  # enrollment type like 'TeacherEnrollment'
+                          Field('state', 'string'),  # enrollment_state like 'active'
+                          Field('user_name', 'string'),  # from the enrollment, to report without db.user
+                          Field('login_id', 'string'),  # only with admin rights
+                          Field('updated_at', 'datetime'),
+                          singular='Enrollment',
+                          plural='Enrollments')
+
+        # cache of Canvas users and profiles, see user_cache.py
+        self.define_table('user_cache',
+                          Field('lookup_key', 'string'),  # like 'sis_login_id:u123456'
+                          Field('user_id', 'integer'),  # None if not found
+                          Field('attributes', 'json'),
+                          Field('profile', 'json'),
+                          Field('found', 'boolean', default=True),
+                          Field('cached_at', 'datetime'),
+                          singular='Cached user',
+                          plural='Cached users')
+
+        # courses requested by id (include COURSE_LISTING_INCLUDE), see hydrate_courses
+        self.define_table('course_cache',
+                          Field('course_id', 'integer', unique=True),
+                          Field('attributes', 'json'),  # the JSON of the course
+                          Field('cached_at', 'datetime'),
+                          singular='Cached course',
+                          plural='Cached courses')
+
+        # unique document contents in the file store (see file_store.py)
+        self.define_table('blob',
+                          Field('sha256', 'string', unique=True),
+                          Field('size', 'integer'),
+                          Field('content_type', 'string'),
+                          Field('created', 'datetime'),
+                          Field('verified', 'datetime'),
+                          singular='Blob',
+                          plural='Blobs')
+
+        # page bodies, kept fresh during sync using updated_at, for offline search
+        self.define_table('course_page',
+                          Field('course_id', 'integer'),
+                          Field('page_id', 'integer'),
+                          Field('url', 'string'),  # page slug
+                          Field('title', 'string'),
+                          Field('body', 'text'),
+                          Field('published', 'boolean'),
+                          Field('updated_at', 'datetime'),  # from lms
+                          Field('synced_at', 'datetime'),
+                          singular='Course page',
+                          plural='Course pages')
+        self.has_page_fts = self.define_page_fts()
+        self.define_indexes()
+
         if is_testing:
             self.truncate_all_tables()
 
+    def define_page_fts(self) -> bool:
+        """full-text index (FTS5, trigram: substring search) on title and body of course_page,
+        kept in sync by triggers
+        :returns False if this SQLite has no FTS5 (search then scans course_page)"""
+        statements = (
+            "CREATE VIRTUAL TABLE IF NOT EXISTS course_page_fts USING fts5("
+            "title, body, content='course_page', content_rowid='id', tokenize='trigram');",
+            "CREATE TRIGGER IF NOT EXISTS course_page_ai AFTER INSERT ON course_page BEGIN "
+            "INSERT INTO course_page_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END;",
+            "CREATE TRIGGER IF NOT EXISTS course_page_ad AFTER DELETE ON course_page BEGIN "
+            "INSERT INTO course_page_fts(course_page_fts, rowid, title, body) "
+            "VALUES ('delete', old.id, old.title, old.body); END;",
+            "CREATE TRIGGER IF NOT EXISTS course_page_au AFTER UPDATE ON course_page BEGIN "
+            "INSERT INTO course_page_fts(course_page_fts, rowid, title, body) "
+            "VALUES ('delete', old.id, old.title, old.body); "
+            "INSERT INTO course_page_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END;")
+        try:
+            for statement in statements:
+                self.executesql(statement)
+        except Exception as e:  # sqlite3.OperationalError: no such module: fts5
+            logging.warning(f"no full-text index on course pages: {e}")
+            self.rollback()
+            return False
+        self.commit()
+        return True
+
+    def define_indexes(self):
+        """indexes for the lookups per user and per course (pydal's create_index
+        has no IF NOT EXISTS, so these are created with plain SQL)"""
+        statements = (
+            "CREATE INDEX IF NOT EXISTS enrollment_index_user_id ON enrollment_index (user_id);",
+            "CREATE INDEX IF NOT EXISTS enrollment_index_course_id ON enrollment_index (course_id);",
+            "CREATE INDEX IF NOT EXISTS user_cache_lookup_key ON user_cache (lookup_key);")
+        for statement in statements:
+            self.executesql(statement)
+        self.commit()
+
+    def select_as(self, query, *fields, mode: str = 'tuples', **attributes):
+        """
+        select, without a pydal Row per record (except in mode 'rows'). The values
+        are as stored in SQLite: booleans 'T'/'F', datetimes and list: fields as strings
+        :param query: like db.document.course == db.course.id
+        :param fields: the columns (table.ALL is expanded), in the order of the tuples
+        :param mode: one of RESULT_MODES
+        :param attributes: like orderby, passed to select
+        :returns Rows, list of tuples, NumPy record array (numpy needed) or generator of tuples
+        """
+        assert mode in RESULT_MODES, f"mode should be one of {RESULT_MODES}"
+        if mode == 'rows':
+            return self(query).select(*fields, **attributes)
+        sql = self(query)._select(*fields, **attributes)
+        if mode == 'tuples':
+            return self.executesql(sql)
+        if mode == 'cursor':
+            return self.iter_sql(sql)
+        if np is None:
+            raise ImportError("mode 'records' needs numpy: pip install numpy")
+        names = self.column_names(fields)
+        records = self.executesql(sql)
+        if not records:
+            return np.rec.array(np.empty(0, dtype=[(name, object) for name in names]))
+        return np.rec.fromrecords(records, names=names)
+
+    @staticmethod
+    def column_names(fields) -> list[str]:
+        """names of the selected columns: the field name, table_field if the name is used twice"""
+        expanded = [field for item in fields
+                    for field in (item._table if hasattr(item, '_table') else (item,))]
+        names = [field.name for field in expanded]
+        return [f"{field.tablename}_{field.name}" if names.count(field.name) > 1 else field.name
+                for field in expanded]
+
+    def iter_sql(self, sql: str, batch_size: int = CURSOR_BATCH_SIZE):
+        """:returns generator of the result tuples, fetched batch_size at a time
+        (on its own cursor: other queries can run while iterating)"""
+        cursor = self._adapter.connection.cursor()
+        try:
+            cursor.execute(sql)
+            while batch := cursor.fetchmany(batch_size):
+                yield from batch
+        finally:
+            cursor.close()
+
     def truncate_all_tables(self):
         self.commit()
         for table_name in self.tables():
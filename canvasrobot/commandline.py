@@ -1,3 +1,6 @@
+import asyncio
+from pathlib import Path
+
 import rich_click as click
 
 from .canvasrobot import CanvasRobot
@@ -46,10 +49,56 @@ def cli(ctx: click.Context, reset_api_keys, db_auto_update, db_force_update):
 
 
 @cli.command()
-def sync():
+@click.option("--use_async",
+              default=False,
+              is_flag=True,
+              help="Read the courses with many requests in flight (asyncio): courses, "
+                   "enrollments, documents and pages only")
+@click.pass_obj
+def sync(robot, use_async: bool = False):
+    """update the local database from Canvas"""
+    if use_async:
+        asyncio.run(robot.update_database_from_canvas_async())
+    else:
+        robot.update_database_from_canvas()
+    robot.report_errors()
     click.echo("syncing ready")
 
 
+@cli.command("verify_store")
+@click.option("--remove_orphans",
+              default=False,
+              is_flag=True,
+              help="Also delete stored files no document refers to")
+@click.pass_obj
+def verify_store(robot, remove_orphans: bool = False):
+    """check the integrity of the local document store"""
+    problems = robot.verify_store(remove_orphans=remove_orphans)
+    for problem in problems:
+        click.echo(f"{problem.sha256}: {problem.problem}")
+    click.echo(f"{len(problems)} problems found in the document store")
+    robot.report_errors()
+
+
+@cli.command("export_course_stats")
+@click.option("--path",
+              default="course_stats.csv",
+              help="Output file, .csv or .parquet")
+@click.option("--by",
+              default=None,
+              type=click.Choice(['term', 'account_id', 'ac_year']),
+              help="Export the distributions per term, account or year instead of the courses")
+@click.option("--all_years",
+              default=False,
+              is_flag=True,
+              help="All courses in the database, not only those of this year")
+@click.pass_obj
+def export_course_stats(robot, path: str, by: str | None = None, all_years: bool = False):
+    """export the number of modules, pages, assignments, students... of the courses in the database"""
+    path = robot.export_courses_data(Path(path), by=by, all_years=all_years)
+    click.echo(f"Course statistics written to {path}")
+
+
 # define multi commands/groups
 @cli.group("enroll")
 def enroll():
@@ -99,10 +148,22 @@ def student(robot, username, shortcoursename: str = None, unenroll: bool = False
 
 
 @click.command("enroll_students_in_communities")
+@click.option("--sis_import",
+              help="submit the missing students as one SIS import",
+              is_flag=True,
+              default=False,)
+@click.option("--per_user",
+              help="look up and enroll each student separately (slow)",
+              is_flag=True,
+              default=False,)
 @click.pass_obj
-def students_in_communities(robot):
+def students_in_communities(robot, sis_import: bool = False, per_user: bool = False):
     """enroll current students in the educational communities"""
-    robot.enroll_students_in_communities
+    diffs = robot.enroll_students_in_communities(batch=not per_user,
+                                                 use_sis_import=sis_import)
+    for course_id, diff in diffs.items():
+        click.echo(f"{course_id}: {len(diff.enrolled)} of {len(diff.missing)} missing students enrolled")
+    robot.report_errors()
 
 
 @click.command()
@@ -110,9 +171,13 @@ def students_in_communities(robot):
               help="Do not change anything",
               is_flag=True,
               default=False,)
+@click.option("--offline",
+              help="Search the pages stored by sync, not Canvas",
+              is_flag=True,
+              default=False,)
 @click.pass_obj
-def in_course(robot, dryrun):
-    count, pages, _ = search_in_course(robot, dryrun=dryrun)
+def in_course(robot, dryrun, offline):
+    count, pages, _ = search_in_course(robot, dryrun=dryrun, offline=offline)
     click.echo(f"{count} locations in {len(pages)} pages")
 
 
@@ -121,9 +186,17 @@ def in_course(robot, dryrun):
               help="Do not change anything",
               is_flag=True,
               default=False,)
+@click.option("--offline",
+              help="Search the pages stored by sync, not Canvas",
+              is_flag=True,
+              default=False,)
+@click.option("--use_async",
+              help="Search with many requests in flight (asyncio), search only",
+              is_flag=True,
+              default=False,)
 @click.pass_obj
-def in_courses(robot, dryrun):
-    count, pages, _ = search_in_courses(robot, dryrun=dryrun)
+def in_courses(robot, dryrun, offline, use_async):
+    count, pages, _ = search_in_courses(robot, dryrun=dryrun, offline=offline, use_async=use_async)
     click.echo(f"{count} locations in {len(pages)} pages")
     # overview_courses(courses, robot.canvas_url)
 
@@ -141,10 +214,25 @@ def courses(robot):
               default=None,
               help="course_id to show documents for")
 def documents(robot, course_id: int = None):
-    documents = robot.get_list_of_documents_db(course_id=course_id)
+    db = robot.db
+    documents = robot.get_list_of_documents_db(course_id=course_id,
+                                               fields=(db.document.id, db.document.filename, db.document.url,
+                                                       db.course.course_id, db.course.name),
+                                               mode='tuples')
     overview_documents(documents, robot.canvas_url)
 
 
+@click.command()
+@click.pass_obj
+def files_tabs(robot):
+    """current courses with a visible Files tab"""
+    visible = robot.audit_files_tab_visibility()
+    for item in visible:
+        click.echo(f"{robot.canvas_url}/courses/{item.course_id} {item.course_name}: {item.visibility}")
+    click.echo(f"{len(visible)} courses with a visible Files tab")
+    robot.report_errors()
+
+
 # connect commands to each subcommand
 enroll.add_command(student)
 enroll.add_command(students_in_communities)
@@ -156,6 +244,7 @@ search.add_command(in_courses)
 
 show.add_command(courses)
 show.add_command(documents)
+show.add_command(files_tabs)
 
 
 if __name__ == '__main__':
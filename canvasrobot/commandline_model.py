@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import sys
 import shutil
@@ -104,7 +105,7 @@ def do_nothing():
 
 
 def show_search_result(count: int = 0,
-                       search_term: str = "",
+                       search_term: str | list[str] = "",
                        found_pages: list = None,
                        marked_or_changed_bodies: str = "",
                        canvas_url: str = None):
@@ -112,6 +113,8 @@ def show_search_result(count: int = 0,
     show
     - count of search locations
     - list of pages with page-links"""
+    if not isinstance(search_term, str):
+        search_term = "; ".join(search_term)
 
     page_links = [(f"<li><a href='{canvas_url}/courses/{course_id}/pages/{url}' "
                    f"target='_blank'>{title} in {course_name}"
@@ -233,7 +236,8 @@ def load_css(window):
 
 
 def overview_documents(rows, canvas_url: str = None):
-    """in webview show list of documents with ids and links"""
+    """in webview show list of documents with ids and links
+    :param rows: tuples (document id, filename, url, course_id, course name)"""
 
     template = """
     <!DOCTYPE html>
@@ -276,12 +280,12 @@ def overview_documents(rows, canvas_url: str = None):
     </html>
     """
     # format: https://tilburguniversity.instructure.com/courses/34/wiki
-    doc_links = [(f"<tr><td class='filename'>{row.document.filename}</td><td class='url'>"
-                  f"<a href='{row.document.url}' "
-                  f"target='_blank'>{row.document.id}</a></td><td class='course'>"
-                  f"<a href='{canvas_url}/courses/{row.course.course_id}' "
-                  f"target='_blank'>{row.course.name}</a></td>"
-                  f"</tr>") for row in rows]
+    doc_links = [(f"<tr><td class='filename'>{filename}</td><td class='url'>"
+                  f"<a href='{url}' "
+                  f"target='_blank'>{document_id}</a></td><td class='course'>"
+                  f"<a href='{canvas_url}/courses/{course_id}' "
+                  f"target='_blank'>{course_name}</a></td>"
+                  f"</tr>") for document_id, filename, url, course_id, course_name in rows]
 
     doc_list = f"<table class='files sortable-theme-bootstrap data-sortable'>{''.join(doc_links)}</table>"
     html = template.format(len(rows), doc_list)
@@ -359,7 +363,34 @@ def enroll_student(robot, username, shortname, unenroll=False,):
                             f"'{username}' is niet toegevoegd aan '{shortname}'")
 
 
-def search_in_course(robot, single_course=0, dryrun=True, ignore_case=True):
+def split_terms(answer: str) -> list[str]:
+    """terms separated by ';' (searched for in a single pass), empty pieces dropped"""
+    return [term for term in answer.split(';') if term]
+
+
+def ask_terms(robot, search_only: bool) -> tuple[list[str], str | list[str]]:
+    """
+    ask for the search terms (each at least 2 characters) and, if not search_only,
+    the replacement: one for all terms or one per term
+    :returns search terms, replace term ("" if search_only) or list of replace terms
+    """
+    while True:
+        search_terms = list(dict.fromkeys(split_terms(Prompt.ask("Voer de zoekterm in (meerdere scheiden met ';')"))))
+        if search_terms and all(len(term) > 1 for term in search_terms):
+            break
+        robot.console.print("Voer een langere zoekterm in")
+    if search_only:
+        return search_terms, ""
+    while True:
+        replace_terms = split_terms(Prompt.ask("Voer vervangterm in (een per zoekterm, scheiden met ';')")) or [""]
+        if len(replace_terms) == 1:
+            return search_terms, replace_terms[0]
+        if len(replace_terms) == len(search_terms):
+            return search_terms, replace_terms
+        robot.console.print(f"Voer een vervangterm in, of {len(search_terms)} (een per zoekterm)")
+
+
+def search_in_course(robot, single_course=0, dryrun=True, ignore_case=True, offline=False):
     """cmdline: ask for search and replace term. Scope: one course, all pages"""
     robot.console.print("Zoek tekstfragment in een cursus")
     search_only = Prompt.ask("Alleen zoeken?",
@@ -367,12 +398,7 @@ def search_in_course(robot, single_course=0, dryrun=True, ignore_case=True):
                              default="zoek",
                              show_default=True)
     search_only = True if search_only == "zoek" else False
-    while True:
-        search_term = Prompt.ask("Voer de zoekterm in")
-        if len(search_term) > 1:
-            break
-        robot.console.print("Voer een langere zoekterm in")
-    replace_term = Prompt.ask("Voer vervangterm in") if not search_only else ""
+    search_term, replace_term = ask_terms(robot, search_only)
     course_id = Prompt.ask("Voer de course_id in") if single_course == 0 else single_course
     robot.console.print('Zoeken..')
     count, found_pages, marked_bodies = robot.course_search_replace_pages(course_id,
@@ -380,7 +406,8 @@ def search_in_course(robot, single_course=0, dryrun=True, ignore_case=True):
                                                                           replace_term=replace_term,
                                                                           search_only=search_only,
                                                                           ignore_case=ignore_case,
-                                                                          dryrun=dryrun)
+                                                                          dryrun=dryrun,
+                                                                          offline=offline)
     show_search_result(count=count,
                        search_term=search_term,
                        found_pages=found_pages,
@@ -389,22 +416,33 @@ def search_in_course(robot, single_course=0, dryrun=True, ignore_case=True):
     return count, found_pages, marked_bodies
 
 
-def search_in_courses(robot, dryrun=True, ignore_case=True):
-    """cmdline: ask for search and replace term. Scope: all courses, all pages"""
+def search_in_courses(robot, dryrun=True, ignore_case=True, offline=False, use_async=False):
+    """cmdline: ask for search and replace term. Scope: all courses, all pages
+    :param use_async: search (only) with the asyncio client, many requests in flight"""
     robot.console.print("Zoek tekstfragment in alle cursussen")
     search_only = Prompt.ask("Alleen zoeken?",
                              choices=["zoek", "vervang"],
                              default="zoek",
                              show_default=True)
     search_only = True if search_only == "zoek" else False
-    search_term = Prompt.ask("Voer de zoekterm in")
-    replace_term = Prompt.ask("Voer vervangterm in") if not search_only else ""
+    search_term, replace_term = ask_terms(robot, search_only)
     robot.console.print('Zoeken..')
-    count, found_pages, marked_bodies = robot.course_search_replace_pages_all_courses(search_term=search_term,
-                                                                                      replace_term=replace_term,
-                                                                                      search_only=search_only,
-                                                                                      ignore_case=ignore_case,
-                                                                                      dryrun=dryrun)
+    report_path = Path(robot.db_folder) / 'search_report.html'
+    report_path.unlink(missing_ok=True)  # from an earlier search
+    if use_async and search_only and not offline:
+        count, found_pages, marked_bodies = asyncio.run(
+            robot.search_pages_all_courses_async(search_term, ignore_case=ignore_case, report_path=report_path))
+    else:
+        count, found_pages, marked_bodies = robot.course_search_replace_pages_all_courses(search_term=search_term,
+                                                                                          replace_term=replace_term,
+                                                                                          search_only=search_only,
+                                                                                          ignore_case=ignore_case,
+                                                                                          dryrun=dryrun,
+                                                                                          offline=offline,
+                                                                                          report_path=report_path)
+    if report_path.exists() and not marked_bodies:
+        robot.console.print(f"De gemarkeerde pagina's staan in {report_path}")
+        marked_bodies = f"<p>De gemarkeerde pagina's staan in {report_path}</p>"
     show_search_result(count=count,
                        search_term=search_term,
                        found_pages=found_pages,
@@ -421,8 +459,7 @@ def search_replace_pages(robot, single_course=0):
                              default="zoek",
                              show_default=True)
     search_only = True if search_only == "zoek" else False
-    search_term = Prompt.ask("Voer de zoekterm in")
-    replace_term = Prompt.ask("Voer vervangterm in") if not search_only else ""
+    search_term, replace_term = ask_terms(robot, search_only)
     course_id = Prompt.ask("Voer de course_id in") if single_course == 0 else single_course
     count, found_pages, html = robot.course_search_replace_pages(course_id,
                                                                  search_term,
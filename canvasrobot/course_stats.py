@@ -0,0 +1,58 @@
+"""
+Statistics of the courses in the db (table course), computed column-wise with
+pandas/NumPy: the selected columns go straight from SQLite into a DataFrame,
+without a pydal Row per course. pandas is optional (pip install pandas,
+and pyarrow for Parquet).
+"""
+from pathlib import Path
+
+try:  # type: ignore
+    import pandas as pd  # type: ignore
+except ImportError:
+    pd = None
+
+ID_COLUMNS = ('course_id', 'account_id', 'term', 'ac_year')
+STAT_COLUMNS = ('nr_students', 'nr_modules', 'nr_module_items', 'nr_pages',
+                'nr_assignments', 'nr_quizzes', 'nr_files')
+AGGREGATIONS = ('count', 'mean', 'median', 'min', 'max', 'sum')
+
+
+def require_pandas():
+    if pd is None:
+        raise ImportError("course statistics need pandas: pip install pandas (and pyarrow for Parquet)")
+
+
+def courses_frame(rows, columns=ID_COLUMNS + STAT_COLUMNS):
+    """
+    :param rows: tuples in the order of columns, like the result of db.executesql
+    :returns DataFrame, the statistics as numbers (-1, not authorised, becomes NaN)
+    """
+    require_pandas()
+    frame = pd.DataFrame.from_records(rows, columns=list(columns))
+    stats = [column for column in STAT_COLUMNS if column in frame.columns]
+    frame[stats] = frame[stats].apply(pd.to_numeric, errors='coerce')
+    frame[stats] = frame[stats].mask(frame[stats] < 0)
+    return frame
+
+
+def distributions(frame, by: str = 'term'):
+    """
+    :param by: 'term', 'account_id' or 'ac_year'
+    :returns per value of by: count, mean, median, min, max and sum of every statistic,
+    flat column names (as Parquet needs)
+    """
+    require_pandas()
+    stats = [column for column in STAT_COLUMNS if column in frame.columns]
+    result = frame.groupby(by, dropna=False)[stats].agg(list(AGGREGATIONS))
+    result.columns = [f"{column}_{aggregation}" for column, aggregation in result.columns]  # like nr_pages_mean
+    return result
+
+
+def export_frame(frame, path: Path) -> Path:
+    """write the frame as Parquet (.parquet, needs pyarrow) or else as CSV"""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        frame.to_parquet(path)
+    else:
+        frame.to_csv(path)
+    return path
@@ -0,0 +1,161 @@
+"""
+Download (Canvas) files straight to disk: large configurable chunks, a pool of
+concurrent workers, resumable range requests and content-hash (SHA-256) dedup,
+so the same file in many courses is only kept once (as hard links).
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import requests
+from attrs import define
+
+from .throttle import RateLimiter, run_throttled
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+
+@define
+class DownloadResult:
+    url: str
+    path: Path | None
+    status: int
+    size: int = 0
+    sha256: str = ""
+    deduplicated: bool = False
+
+
+def file_sha256(path: Path, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        while block := infile.read(chunk_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def link_or_copy(source: Path, target: Path):
+    """hard link target to source, copy if linking is not possible (other device, Windows share)"""
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class Downloader:
+
+    def __init__(self, folder: Path,
+                 chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                 max_workers: int = 4,
+                 limiter: RateLimiter | None = None,
+                 headers: dict | None = None,
+                 cookies: dict | None = None,
+                 known_hashes: dict[str, Path] | None = None,
+                 timeout: float = 60):
+        """
+        :param folder: downloads are written below this folder
+        :param chunk_size: bytes per read from the response stream
+        :param max_workers: number of concurrent downloads
+        :param limiter: shared rate limiter
+        :param headers: extra request headers (like Authorization)
+        :param cookies: cookies for the requests
+        :param known_hashes: sha256 -> path of files downloaded earlier (dedup)
+        :param timeout: of the connection, in seconds
+        """
+        self.folder = Path(folder)
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.limiter = limiter
+        self.headers = headers or {}
+        self.cookies = cookies or {}
+        self.hashes: dict[str, Path] = dict(known_hashes or {})
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+
+    def download(self, url: str, fname: str) -> DownloadResult:
+        """
+        download url to folder/fname. A partial download (fname.part) left by an
+        earlier run is resumed using a range request
+        :returns DownloadResult, status is the http status (200 also for a resumed download)
+        """
+        path = self.folder / fname
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part = path.with_name(path.name + '.part')
+        offset = part.stat().st_size if part.exists() else 0
+        headers = dict(self.headers)
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+        with self.session.get(url, headers=headers, cookies=self.cookies,
+                              stream=True, timeout=self.timeout) as r:
+            if r.status_code == 416 and offset:  # nothing left to get
+                logger.debug(f"{fname} was already complete")
+            elif r.status_code in (200, 206):
+                mode = 'ab' if r.status_code == 206 else 'wb'  # 200: server ignored the range
+                with open(part, mode) as outfile:
+                    for block in r.iter_content(self.chunk_size):
+                        outfile.write(block)
+            else:
+                logger.info(f"html error {r.status_code} for {url}")
+                return DownloadResult(url=url, path=None, status=r.status_code)
+
+        size = part.stat().st_size
+        sha256 = file_sha256(part, self.chunk_size)
+        with self.lock:
+            existing = self.hashes.get(sha256)
+            if existing is None or not existing.exists():
+                self.hashes[sha256] = path
+                existing = None
+        if existing and existing != path:
+            if self.link_known(existing, sha256, path):
+                part.unlink()  # only now: the link is in place
+                logger.debug(f"{fname} has the same content as {existing}")
+                return DownloadResult(url=url, path=path, status=200, size=size,
+                                      sha256=sha256, deduplicated=True)
+            with self.lock:  # the new download takes the place of the bad (or removed) copy
+                self.hashes[sha256] = path
+        part.replace(path)
+        return DownloadResult(url=url, path=path, status=200, size=size, sha256=sha256)
+
+    def remember(self, sha256: str, path: Path):
+        """from now on link the downloads with this sha256 to path (like the copy in a file store)"""
+        with self.lock:
+            self.hashes[sha256] = Path(path)
+
+    def link_known(self, existing: Path, sha256: str, path: Path) -> bool:
+        """
+        link path to the known copy with this sha256, if its content still matches
+        :returns False if the copy has been changed or removed (meanwhile)
+        """
+        try:
+            if file_sha256(existing, self.chunk_size) != sha256:
+                logger.warning(f"{existing} no longer has content {sha256}, not linked")
+                return False
+            link_or_copy(existing, path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def download_all(self, items: Iterable[tuple[object, str, str]]) -> Iterator[tuple[object, DownloadResult | None,
+                                                                                    Exception | None]]:
+        """
+        download concurrently
+        :param items: (key, url, fname) tuples, the key identifies the item for the caller
+        :returns generator of (key, DownloadResult, error) in order of completion
+        """
+
+        def download(item):
+            _, url, fname = item
+            return self.download(url, fname)
+
+        for item, result, error in run_throttled(download, items,
+                                                 max_workers=self.max_workers,
+                                                 limiter=self.limiter):
+            yield item[0], result, error
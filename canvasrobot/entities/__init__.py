@@ -1,12 +1,13 @@
 
-from .course import Course, EnrollDTO, SearchTextInCourseDTO, \
-    CourseMetadata, Grade, ExaminationDTO
+from .course import Course, EnrollDTO, EnrollmentDiff, SearchTextInCourseDTO, \
+    CourseMetadata, Grade, ExaminationDTO, CourseRecord, PageRecord, ModuleRecord, ModuleItemRecord
 from .user import User
 from .guest import Guest
 from .quiz import Answer, QuizDTO, QuestionDTO, Stats
 
-__all__ = ["Course","EnrollDTO","SearchTextInCourseDTO",
-           "CourseMetadata","Grade","ExaminationDTO",
+__all__ = ["Course","EnrollDTO","EnrollmentDiff","SearchTextInCourseDTO",
+           "CourseMetadata","Grade","ExaminationDTO","CourseRecord",
+           "PageRecord","ModuleRecord","ModuleItemRecord",
            "User","Guest",
            "Answer","QuizDTO","QuestionDTO","Stats"]
 
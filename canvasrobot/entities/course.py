@@ -1,6 +1,6 @@
 from typing import List
 from datetime import datetime
-from attrs import define
+from attrs import define, Factory
 # from dataclasses import dataclass, field
 
 
@@ -24,6 +24,18 @@ class EnrollDTO:
     user_id: int = 0
     course_id: int = 0
 
+@define
+class EnrollmentDiff:
+    """result of a batch enrollment: the roster compared to the current enrollments"""
+    course_id: int
+    roster_size: int = 0
+    enrolled_size: int = 0
+    missing: list[str] = Factory(list)
+    enrolled: list[str] = Factory(list)
+    failed: list[str] = Factory(list)
+    sis_import_id: int = 0
+
+
 @define
 class SearchTextInCourseDTO:
     course_id: int = 0
@@ -59,3 +71,48 @@ class Grade:
     final_score: float
     final_grade: float
 
+
+
+@define
+class CourseRecord:
+    """a course of a listing with its includes, course is the canvasapi object"""
+    course_id: int
+    name: str
+    term: str  # name of the term, like '2024-2025'
+    teachers: list[dict] | None  # id and display_name of each teacher, None if not included
+    total_students: int | None
+    updated_at: str | None
+    course: object
+
+
+@define
+class PageRecord:
+    """a page of a course, page is the canvasapi object (to edit it)"""
+    course_id: int
+    page_id: int
+    title: str
+    url: str
+    html_url: str
+    body: str | None
+    page: object
+
+
+@define
+class ModuleRecord:
+    course_id: int
+    module_id: int
+    name: str
+    items_count: int
+    module: object
+
+
+@define
+class ModuleItemRecord:
+    """a module item, item is the canvasapi object (to edit it)"""
+    course_id: int
+    module_id: int
+    item_id: int
+    type: str  # like 'ExternalUrl', 'Page', 'File'
+    title: str
+    external_url: str | None
+    item: object
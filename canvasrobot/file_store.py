@@ -0,0 +1,85 @@
+"""
+Content-addressed store for course documents: each unique content is kept once,
+as store/[sha256[:2]]/[sha256]. Documents refer to their content by sha256 (db.document.sha256),
+copies on disk (like databases/documents/[course_id]/[filename]) are hard links to the store.
+So these copies are read-only: an edit in place changes the stored content too (verify_store
+reports it as corrupt). Copy a document before editing it.
+"""
+import logging
+from pathlib import Path
+
+from attrs import define
+
+from .downloader import file_sha256, link_or_copy
+
+logger = logging.getLogger(__name__)
+
+
+@define
+class StoreProblem:
+    sha256: str
+    problem: str  # 'missing' or 'corrupt'
+
+
+class FileStore:
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path_for(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    def __contains__(self, sha256: str) -> bool:
+        return self.path_for(sha256).exists()
+
+    def add(self, path: Path, sha256: str | None = None) -> str:
+        """
+        put the content of path in the store (if new) and replace path by a hard link to it
+        :param path: downloaded file
+        :param sha256: hash of the content, if already known
+        :returns the sha256 of the content
+        """
+        path = Path(path)
+        sha256 = sha256 or file_sha256(path)
+        target = self.path_for(sha256)
+        if target.exists():
+            if target.samefile(path):
+                actual = file_sha256(path)
+                if actual == sha256:
+                    return sha256
+                # path is linked to a changed copy: keep its content under its real hash
+                logger.warning(f"stored content {sha256} was corrupt, removed")
+                target.unlink()
+                return self.add(path, actual)
+            if file_sha256(target) == sha256:
+                link_or_copy(target, path)
+            else:  # the stored copy has been changed: the new file takes its place
+                logger.warning(f"stored content {sha256} was corrupt, replaced")
+                link_or_copy(path, target)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            link_or_copy(path, target)
+        return sha256
+
+    def link(self, sha256: str, path: Path):
+        """make path a (hard linked) copy of the stored content"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        link_or_copy(self.path_for(sha256), path)
+
+    def remove(self, sha256: str):
+        """delete the stored content (if present)"""
+        self.path_for(sha256).unlink(missing_ok=True)
+
+    def verify(self, sha256: str) -> StoreProblem | None:
+        """:returns None if the stored content still matches its hash"""
+        path = self.path_for(sha256)
+        if not path.exists():
+            return StoreProblem(sha256=sha256, problem='missing')
+        if file_sha256(path) != sha256:
+            return StoreProblem(sha256=sha256, problem='corrupt')
+        return None
+
+    def hashes(self):
+        """:returns generator of the sha256 of all stored files"""
+        return (path.name for path in self.root.glob('??/*') if path.is_file())
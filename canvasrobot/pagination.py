@@ -0,0 +1,67 @@
+"""
+Read-ahead iteration of canvasapi PaginatedLists: the next page (Link rel="next")
+is requested in a background thread while the caller handles the current page,
+so a loop over a listing no longer waits a full round trip per page.
+And the pagination policy: the page size of every listing, set in one place.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, TypeVar
+
+from canvasapi.paginated_list import PaginatedList
+
+T = TypeVar("T")
+
+
+def read_ahead(paginated: PaginatedList[T]) -> Iterator[T]:
+    """
+    iterate the paginated list, prefetching the next page. The pages are not
+    kept in the PaginatedList, so iterate it once. The page size is set by
+    the pagination policy (apply_pagination_policy)
+    :param paginated: like course.get_files()
+    :returns generator of the items
+    """
+    # noinspection PyProtectedMember
+    yield from paginated._elements  # already received
+    # noinspection PyProtectedMember
+    if not paginated._has_next():
+        return
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # noinspection PyProtectedMember
+        future = pool.submit(paginated._get_next_page)
+        while future:
+            page = future.result()
+            # noinspection PyProtectedMember
+            future = pool.submit(paginated._get_next_page) if paginated._has_next() else None
+            yield from page
+
+
+def policy_per_page(policy: dict[str, int], endpoint: str) -> int | None:
+    """
+    :param endpoint: like 'courses/12/files' (a first request, the next pages
+    are requested with the Link url, which already contains per_page)
+    :returns the page size for this listing, None if not in the policy
+    """
+    if '?' in endpoint:
+        return None
+    return policy.get(endpoint.rstrip('/').rsplit('/', 1)[-1])
+
+
+def apply_pagination_policy(requester, policy: dict[str, int]):
+    """
+    let every GET request of the canvasapi requester for a listing in the policy,
+    which does not ask for a page size itself, ask for the page size of the policy
+    (instead of the Canvas default of 10). A PaginatedList of canvasapi 3.x always
+    asks for per_page (default 100), so the policy only fills in the other requests.
+    To change a page size, change the policy dict
+    :param requester: the requester of the Canvas object (shared by all its objects)
+    :param policy: last segment of the endpoint -> per_page
+    """
+    request = requester.request
+
+    def request_with_policy(method, endpoint=None, *args, **kwargs):
+        per_page = policy_per_page(policy, endpoint or '') if method == 'GET' else None
+        if per_page and not any(key == 'per_page' for key, _ in kwargs.get('_kwargs') or ()):
+            kwargs.setdefault('per_page', per_page)
+        return request(method, endpoint, *args, **kwargs)
+
+    requester.request = request_with_policy
@@ -0,0 +1,66 @@
+"""
+Build a (classic) Canvas quiz: the course and the quiz are resolved once and
+the questions are posted concurrently, rate limited. Canvas has no bulk endpoint
+for classic quiz questions, the position of each question keeps the order.
+"""
+from typing import Callable
+
+from attrs import asdict
+
+from .entities import QuestionDTO
+from .throttle import RateLimiter, run_throttled
+
+
+class QuizBuilder:
+
+    def __init__(self, course, quiz, max_workers: int = 8, limiter: RateLimiter | None = None):
+        """
+        :param course: Canvas course
+        :param quiz: Canvas quiz in this course
+        :param max_workers: number of questions posted at the same time
+        :param limiter: shared rate limiter
+        """
+        self.course = course
+        self.quiz = quiz
+        self.max_workers = max_workers
+        self.limiter = limiter
+        self.errors: list[str] = []
+
+    @classmethod
+    def create(cls, course, title: str, quiz_type: str = 'practice_quiz', **kwargs) -> 'QuizBuilder':
+        """create a new quiz in course and return its builder"""
+        quiz = course.create_quiz(dict(title=title, quiz_type=quiz_type))
+        return cls(course, quiz, **kwargs)
+
+    def add_questions(self,
+                      questions: list[QuestionDTO],
+                      on_progress: Callable[[int], None] | None = None) -> list[int]:
+        """
+        post the questions concurrently
+        :param questions: in the order they should appear in the quiz
+        :param on_progress: called with the number of handled questions
+        after each question (on the calling thread)
+        :returns the ids of the created questions, in quiz order
+        """
+
+        def post(numbered_question):
+            position, question_dto = numbered_question
+            question = asdict(question_dto)
+            question['position'] = position
+            return self.quiz.create_question(question=question)
+
+        created = {}
+        handled = 0
+        for (position, question_dto), quiz_question, error in run_throttled(post,
+                                                                           enumerate(questions, start=1),
+                                                                           max_workers=self.max_workers,
+                                                                           limiter=self.limiter):
+            handled += 1
+            if error:
+                self.errors.append(f"Question {position} '{question_dto.question_name}' "
+                                   f"not added to {self.quiz}: {error}")
+            else:
+                created[position] = quiz_question.id
+            if on_progress:
+                on_progress(handled)
+        return [created[position] for position in sorted(created)]
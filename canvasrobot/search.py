@@ -0,0 +1,147 @@
+"""
+Search (and replace) one or more terms in the HTML of Canvas pages.
+The terms are compiled once into a single regex alternation, which scans the raw
+HTML of every page in one pass. Only pages that match are parsed by BeautifulSoup,
+to mark the found locations.
+"""
+import html as html_lib
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+import bs4
+from attrs import define
+
+MARK_STYLE = 'color:red;'
+LINK_ATTRS = dict(a='href', iframe='src')  # if found in a link: mark on the outside
+
+
+class SearchEngine:
+
+    def __init__(self, terms: str | Iterable[str], ignore_case: bool = True):
+        """
+        :param terms: one search term or several, searched for in a single pass
+        :param ignore_case: case-insensitive matching
+        """
+        terms = [terms] if isinstance(terms, str) else terms
+        self.terms = list(dict.fromkeys(term for term in terms if term))
+        assert self.terms, "at least one search term is needed"
+        self.ignore_case = ignore_case
+        # longest first: the alternation prefers 'Canvas page' over 'Canvas'
+        alternation = '|'.join(re.escape(term) for term in sorted(self.terms, key=len, reverse=True))
+        self.pattern = re.compile(alternation, re.IGNORECASE if ignore_case else 0)
+        self.term_for = {self.normalize(term): term for term in self.terms}
+
+    def normalize(self, text: str) -> str:
+        return text.lower() if self.ignore_case else text
+
+    def term_of(self, match: re.Match) -> str:
+        """:returns the search term a match belongs to"""
+        return self.term_for[self.normalize(match.group(0))]
+
+    def matches(self, html: str | None) -> bool:
+        """quick test on the raw HTML"""
+        return bool(html) and self.pattern.search(html) is not None
+
+    def count(self, html: str | None) -> Counter:
+        """:returns number of occurrences per term in the raw HTML (text, tags and attributes)"""
+        if not html:
+            return Counter()
+        return Counter(self.term_of(match) for match in self.pattern.finditer(html))
+
+    def mark(self, html: str) -> tuple[int, str]:
+        """
+        mark the found locations with -> <- in red; in a link (href/src) the link is
+        preceded by a red note
+        :returns count of marked locations, marked HTML
+        """
+        soup = bs4.BeautifulSoup(html, 'lxml')
+        count = 0
+        for text in soup.find_all(string=self.pattern):
+            if isinstance(text, (bs4.Comment, bs4.Doctype)) or text.parent.name in ('script', 'style'):
+                continue
+            marked, found = self.pattern.subn(lambda match: f"->{match.group(0)}<-", str(text))
+            span = soup.new_tag("span", attrs={'style': MARK_STYLE})
+            span.string = marked
+            text.replace_with(span)
+            count += found
+        # after the texts, the notes should not be marked themselves
+        for tag_name, attr in LINK_ATTRS.items():
+            for tag in soup.find_all(tag_name, attrs={attr: self.pattern}):
+                terms = sorted({self.term_of(match) for match in self.pattern.finditer(tag[attr])})
+                span = soup.new_tag("span", attrs={'style': MARK_STYLE})
+                span.string = f"{', '.join(repr(term) for term in terms)} in {tag_name} ({attr})->"
+                tag.insert_before(span)
+                count += 1
+        return count, str(soup)
+
+    def replacements_for(self, replace_term: str | list[str]) -> str | dict[str, str]:
+        """
+        :param replace_term: one replacement for all terms, or a list: one per term
+        :returns the replacements argument of replace
+        :raises ValueError if the list does not match the terms
+        """
+        if isinstance(replace_term, str):
+            return replace_term
+        if len(replace_term) == 1:
+            return replace_term[0]
+        if len(replace_term) != len(self.terms):
+            raise ValueError(f"{len(replace_term)} replacements for {len(self.terms)} search terms")
+        return dict(zip(self.terms, replace_term))
+
+    def replace(self, html: str, replacements: str | dict[str, str]) -> tuple[int, str]:
+        """
+        :param replacements: one replacement for all terms, or per term
+        :returns count of replacements, new HTML
+        """
+        if isinstance(replacements, str):
+            replacements = {term: replacements for term in self.terms}
+        new_html, count = self.pattern.subn(lambda match: replacements[self.term_of(match)], html)
+        return count, new_html
+
+
+@define(slots=True)
+class PageHit:
+    course_id: int
+    course_name: str
+    url: str  # page slug
+    title: str
+    count: int
+    marked_body: str
+
+    def as_tuple(self) -> tuple:
+        """the found_pages tuple of course_search_replace_pages"""
+        return self.course_id, self.course_name, self.url, self.title
+
+
+class SearchReport:
+    """HTML report of found pages, written page by page (nothing kept in memory)"""
+
+    def __init__(self, path: Path, search_terms: list[str], canvas_url: str = ""):
+        self.path = Path(path)
+        self.search_terms = search_terms
+        self.canvas_url = canvas_url
+        self.outfile = None
+        self.count = 0
+        self.pages = 0
+
+    def __enter__(self) -> 'SearchReport':
+        self.outfile = open(self.path, 'w', encoding='utf-8')
+        terms = html_lib.escape('; '.join(self.search_terms))
+        self.outfile.write(f"<!DOCTYPE html>\n<html><head><meta charset='utf-8'>"
+                           f"<title>Zoekresultaat {terms}</title></head><body>\n"
+                           f"<h1>Found and marked: {terms}</h1>\n")
+        return self
+
+    def add(self, hit: PageHit):
+        link = f"{self.canvas_url}/courses/{hit.course_id}/pages/{hit.url}"
+        self.outfile.write(f"<hr/><h2><a href='{link}' target='_blank'>{html_lib.escape(hit.title)} "
+                           f"in {html_lib.escape(hit.course_name)}</a> ({hit.count})</h2>\n"
+                           f"{hit.marked_body}\n")
+        self.count += hit.count
+        self.pages += 1
+
+    def __exit__(self, *args):
+        self.outfile.write(f"<hr/><p>{self.count} locations in {self.pages} pages</p></body></html>\n")
+        self.outfile.close()
@@ -0,0 +1,70 @@
+"""
+Run Canvas requests concurrently without exceeding the Canvas API rate limits.
+canvasapi is synchronous, so we use a thread pool. All workers share a
+RateLimiter, which spaces the start of the requests.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Any
+
+
+class RateLimiter:
+    """allow at most `rate` requests per second, shared by all threads"""
+
+    def __init__(self, rate: float = 10.0):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        """block until the next request is allowed"""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run_throttled(func: Callable[[Any], Any],
+                  items: Iterable,
+                  max_workers: int = 8,
+                  limiter: RateLimiter | None = None,
+                  max_pending: int | None = None) -> Iterator[tuple[Any, Any, Exception | None]]:
+    """
+    call func(item) for each item using a pool of max_workers threads
+    :param func: function with one argument, usually doing a Canvas request
+    :param items: the arguments, consumed lazily
+    :param max_workers: size of the thread pool
+    :param limiter: if given, every call waits for a free slot
+    :param max_pending: at most this many items are submitted but not yet yielded
+    (default 4 * max_workers), this bounds the memory used for results
+    :returns generator of (item, result, error) tuples in order of completion,
+    error is None if the call succeeded
+    """
+
+    def call(item):
+        if limiter:
+            limiter.wait()
+        return func(item)
+
+    max_pending = max_pending or 4 * max_workers
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(call, item): item for item in islice(items, max_pending)}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = futures.pop(future)
+                try:
+                    result, error = future.result(), None
+                except Exception as e:
+                    result, error = None, e
+                for next_item in islice(items, 1):
+                    futures[pool.submit(call, next_item)] = next_item
+                yield item, result, error
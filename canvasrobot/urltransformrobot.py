@@ -1,3 +1,4 @@
+import asyncio
 import re
 import sys
 import typing
@@ -14,7 +15,11 @@ from rich.progress import Progress
 
 from result import Ok, Err, Result, is_ok, is_err  # noqa: F401
 from .canvasrobot import CanvasRobot, Field
+from .entities import PageRecord, ModuleItemRecord
 import canvasapi
+import httpx
+from canvasapi.course import Page
+from canvasapi.module import ModuleItem
 from .commandline import create_db_folder, get_logger
 
 click.rich_click.SHOW_ARGUMENTS = True
@@ -192,15 +197,25 @@ class UrlTransformationRobot(CanvasRobot):
                          is_testing=is_testing,
                          db_auto_update=db_auto_update,
                          db_force_update=db_force_update)
-        self.add_media_ids_table()
-        if self.db(self.db.ids).isempty():
-            self.import_ids()
+        self.ids_checked = False  # the ids table is filled on first lookup
 
     # Begin the database section
-    def add_media_ids_table(self):
-        self.db.define_table('ids',
-                             Field('panopto_id', 'string'),
-                             Field('mediasite_id', 'string'))
+    def define_extra_tables(self, db):
+        self.add_media_ids_table(db)
+
+    @staticmethod
+    def add_media_ids_table(db):
+        db.define_table('ids',
+                        Field('panopto_id', 'string'),
+                        Field('mediasite_id', 'string'))
+
+    def check_ids(self):
+        """import the mediasite-panopto ids if the table is still empty"""
+        if self.ids_checked:
+            return
+        if self.db(self.db.ids).isempty():
+            self.import_ids()
+        self.ids_checked = True
 
     def import_ids(self):
 
@@ -235,6 +250,7 @@ class UrlTransformationRobot(CanvasRobot):
             return Err(msg)
 
     def lookup_panopto_id(self, mediasite_id: str) -> str:
+        self.check_ids()
         db = self.db  # just sugarcoat
         row = db(db.ids.mediasite_id == mediasite_id).select(db.ids.panopto_id).first()
         return row.panopto_id if row else None
@@ -337,7 +353,7 @@ class UrlTransformationRobot(CanvasRobot):
             user = self.get_user(teacher['id'])
             first_name, last_name, prefix = self.parse_sortable_name(user)
             try:
-                profile = user.get_profile()
+                profile = self.get_profile(user)
             except canvasapi.exceptions.Forbidden:
                 logger.warning(f"Can't get profile for user {teacher['id']} in course {course_id} (Forbidden)")
                 profile = dict(login_id="n.a.(due to rights)",
@@ -439,6 +455,57 @@ class UrlTransformationRobot(CanvasRobot):
 
         create_excel(data)
 
+    def transform_page(self, record: PageRecord, dryrun=True):
+        """transform the mediasite urls in the body of a page"""
+        logger.debug(f"Handling '{record.title}'")
+        if not record.body:
+            return
+        transformation = Transformation(title=record.title,
+                                        url=record.html_url,
+                                        ctype="Page",
+                                        dryrun=dryrun, )
+        # builds list of page transform info
+        new_body, updated, count = self.mediasite2panopto(record.body,
+                                                          transformation=transformation,
+                                                          dryrun=dryrun)
+        self.count_replacements += count
+        if updated:
+            transformation.replacements = count
+            transformation.transformed = new_body
+            self.pages_changed += 1
+            if not dryrun:
+                # actual replacement
+                record.page.edit(wiki_page=dict(body=new_body))
+        else:
+            Transformation.pop()
+            # remove from Transformation.list: not an actual transformation
+
+    def transform_external_url(self, record: ModuleItemRecord, dryrun=True):
+        """transform the mediasite url of an ExternalUrl module item"""
+        logger.debug(f"Handling '{record.title}'")
+        if not record.external_url:
+            return
+        transformation = Transformation(title=record.title,
+                                        url=f"{self.canvas_url}/courses/"
+                                            f"{record.course_id}/modules/items/{record.item_id}",
+                                        ctype="ExternalUrl",
+                                        module_item_id=record.item_id,
+                                        dryrun=dryrun)
+        new_url, updated, count = self.mediasite2panopto(record.external_url,
+                                                         transformation=transformation,
+                                                         dryrun=dryrun)
+        if updated:
+            self.count_replacements += count
+            if not dryrun:
+                record.item.edit(module_item=dict(external_url=new_url))
+
+            transformation.transformed = new_url
+            transformation.replacements = count
+            self.external_urls_changed += 1
+        else:
+            Transformation.pop()
+            # not an *actual* transformation
+
     def transform_urls_in_course(self, course_id: int, dryrun=True) -> bool:
         """
         Transform the mediasite urls in all pages and module-items of the course with this course_id
@@ -449,69 +516,102 @@ class UrlTransformationRobot(CanvasRobot):
         """
         # self.transformation_course_report = ""
         logger.debug(f"Getting pages from course {course_id}")
+        course = None
         try:
-            course, pages, module_items = self.get_course_pages_module_items(course_id)  # example
-
+            course = self.canvas.get_course(course_id, include=["term", "teachers"])
+            # start on the first page, the module items follow (fetched concurrently)
+            self.transform_records(course.id, course.name, self.iter_course_pages_module_items(course), dryrun)
         except (Exception, canvasapi.exceptions.Forbidden) as e:
             err = f"Course {course_id} skipped due to {e}"
             logger.warning(err)
             self.errors.append(err)
-            return False
+            result = False
         else:
-            self.transformation_course_report = f"<h2>{course.id}: {course.name}</h2>"
-            Transformation.clear_list()
-            for page in pages:
-                logger.debug(f"Handling '{page.title}'")
-                if page.body:
-                    transformation = Transformation(title=page.title,
-                                                    url=page.html_url,
-                                                    ctype="Page",
-                                                    dryrun=dryrun, )
-                    # builds list of page transform info
-                    new_body, updated, count = self.mediasite2panopto(page.body,
-                                                                      transformation=transformation,
-                                                                      dryrun=dryrun)
-                    self.count_replacements += count
-                    if updated:
-                        transformation.replacements = count
-                        transformation.transformed = new_body
-                        self.pages_changed += 1
-                        if not dryrun:
-                            # actual replacement
-                            page.edit(wiki_page=dict(body=new_body))
-                    else:
-                        Transformation.pop()
-                        # remove from Transformation.list: not an actual transformation
-
-            ext_urls = [item for item in module_items if item.type == 'ExternalUrl']
-            for ext_url in ext_urls:
-                logger.debug(f"Handling '{ext_url}'")
-                if ext_url.external_url:
-                    transformation = Transformation(title=ext_url.title,
-                                                    url=f"{self.canvas_url}/courses/"
-                                                        f"{ext_url.course_id}/modules/items/{ext_url.id}",
-                                                    ctype="ExternalUrl",
-                                                    module_item_id=ext_url.id,
-                                                    dryrun=dryrun)
-                    new_url, updated, count = self.mediasite2panopto(ext_url.external_url,
-                                                                     transformation=transformation,
-                                                                     dryrun=dryrun)
-                    if updated:
-                        self.count_replacements += count
-                        if not dryrun:
-                            ext_url.edit(module_item=dict(external_url=new_url))
-
-                        transformation.transformed = new_url
-                        transformation.replacements = count
-                        self.external_urls_changed += 1
-                    else:
-                        Transformation.pop()
-                        # not an *actual* transformation
             self.transformation_report += ("<hr/>" + self.transformation_course_report)
-            self.save_transform_data_db(course_id)
+            result = True
+        if course is not None:
+            # also after an error: the pages transformed before it are changed in Canvas
             # uses the self.transformation_course_report
             # uses the list in ClassObject Transformation added to above
-        return True
+            self.save_transform_data_db(course_id)
+        return result
+
+    def transform_records(self, course_id: int, course_name: str, records, dryrun=True):
+        """transform the pages and ExternalUrl module items of one course
+        :param records: PageRecord and ModuleItemRecord instances (other records are ignored)"""
+        self.transformation_course_report = f"<h2>{course_id}: {course_name}</h2>"
+        Transformation.clear_list()
+        for record in records:
+            if isinstance(record, PageRecord):
+                self.transform_page(record, dryrun)
+            elif isinstance(record, ModuleItemRecord) and record.type == 'ExternalUrl':
+                self.transform_external_url(record, dryrun)
+
+    async def transform_urls_in_courses_async(self, course_ids: list[int], dryrun=True,
+                                              on_course_done: typing.Callable[[], None] | None = None) -> int:
+        """
+        like transform_urls_in_course for many courses: the pages, modules and module items
+        of all courses are read with the asyncio client, many requests in flight.
+        Each course is transformed (and saved in the db) as soon as its data is complete
+        :param course_ids:
+        :param dryrun: If True, no action.  Just candidates
+        :param on_course_done: called after each course
+        :return: number of courses transformed (others are reported in self.errors)
+        """
+        async with self.async_canvas() as canvas:
+
+            async def fetch(course_id: int):
+                try:
+                    course, pages, modules = await asyncio.gather(canvas.get_course(course_id),
+                                                                  canvas.get_pages(course_id, include_body=True),
+                                                                  canvas.get_modules(course_id))
+                    item_lists = await asyncio.gather(*(canvas.get_module_items(course_id, module['id'])
+                                                        for module in modules))
+                except httpx.HTTPError as e:
+                    return course_id, e
+                return course_id, (course, pages, item_lists)
+
+            done = 0
+            for next_done in asyncio.as_completed([fetch(course_id) for course_id in course_ids]):
+                course_id, result = await next_done
+                if isinstance(result, Exception):
+                    err = f"Course {course_id} skipped due to {result}"
+                    logger.warning(err)
+                    self.errors.append(err)
+                else:
+                    course, pages, item_lists = result
+                    records = [PageRecord(course_id=course_id,
+                                          page_id=page['page_id'],
+                                          title=page['title'],
+                                          url=page['url'],
+                                          html_url=page['html_url'],
+                                          body=page.get('body'),
+                                          page=Page(self.requester, {**page, 'course_id': course_id}))
+                               for page in pages if page['title'][0:3] != 'UVT']
+                    records += [ModuleItemRecord(course_id=course_id,
+                                                 module_id=item['module_id'],
+                                                 item_id=item['id'],
+                                                 type=item['type'],
+                                                 title=item['title'],
+                                                 external_url=item.get('external_url'),
+                                                 item=ModuleItem(self.requester, {**item, 'course_id': course_id}))
+                                for items in item_lists for item in items]
+                    # the page and module item edits (canvasapi, blocking) off the event loop;
+                    # one course at a time, Transformation collects the list of one course
+                    try:
+                        await asyncio.to_thread(self.transform_records, course_id, course['name'], records, dryrun)
+                    except (Exception, canvasapi.exceptions.Forbidden) as e:
+                        err = f"Course {course_id} skipped due to {e}"
+                        logger.warning(err)
+                        self.errors.append(err)
+                    else:
+                        self.transformation_report += ("<hr/>" + self.transformation_course_report)
+                        done += 1
+                    # also after an error: the pages transformed before it are changed in Canvas
+                    self.save_transform_data_db(course_id)
+                if on_course_done:
+                    on_course_done()
+        return done
 
 
 @define
@@ -564,8 +664,14 @@ def cli(ctx: click.Context, db_auto_update, db_force_update):
 @click.option("--just_do_it", default=False,
               is_flag=True,
               help="Scan and [red]REPLACE[/red] the mediasite urls")
+@click.option("--use_async", default=False,
+              is_flag=True,
+              help="Read the courses with many requests in flight (asyncio)")
+@click.option("--refresh_course_ids", default=False,
+              is_flag=True,
+              help="Harvest the course ids of the admin_id again (added to its csv file)")
 @click.version_option()
-def scan(ctx, single_course, all_courses, admin_id, stop_after, just_do_it):
+def scan(ctx, single_course, all_courses, admin_id, stop_after, just_do_it, use_async, refresh_course_ids):
     dryrun = True
     if (just_do_it and
             click.confirm("Continue transforming the Mediasite urls?")):
@@ -578,39 +684,50 @@ def scan(ctx, single_course, all_courses, admin_id, stop_after, just_do_it):
     if all_courses:
         single_course = 0
 
-    scan_replace_urls(robot, single_course, admin_id, stop_after, dryrun)
+    scan_replace_urls(robot, single_course, admin_id, stop_after, dryrun, use_async, refresh_course_ids)
 
 
 def scan_replace_urls(robot=None,
                       single_course: int = 0,
                       admin_id: int = 0,
                       stop_after: int = 0,
-                      dryrun: bool = True):
+                      dryrun: bool = True,
+                      use_async: bool = False,
+                      refresh_course_ids: bool = False):
     """for a single_course (or all courses) scan and optionally replace mediasite urls
     :param robot:
     :param single_course: if 0 do all courses (for admin_id)
     :param admin_id:
     :param stop_after:
     :param dryrun:
+    :param use_async: read the courses with the asyncio client (many requests in flight)
+    :param refresh_course_ids: harvest the course ids of admin_id again (csv fallback)
     """
     if single_course is None:
         click.echo(click.Style(f"DEV error '{single_course=}' should be 0 "
                                f"or a single id (not None)", fg="red"))
         return
 
-    courses = (TestCourse(single_course),) if single_course else robot.get_courses_in_account(admin_id=admin_id)
+    courses = (TestCourse(single_course),) if single_course else \
+        robot.get_courses_in_account(admin_id=admin_id, refresh_course_ids=refresh_course_ids)
     if stop_after:
         courses = courses[:stop_after]
     count_courses = len(courses)
     with Progress(console=robot.console) as progress:
         task_checking = progress.add_task(f"[green]checking {count_courses} courses...",
                                           total=count_courses, )
-        for course in courses:
-            progress.update(task_checking,
-                            advance=1)  # Update progressbar
+        if use_async:
+            asyncio.run(robot.transform_urls_in_courses_async([course.id for course in courses],
+                                                              dryrun=dryrun,
+                                                              on_course_done=lambda: progress.update(task_checking,
+                                                                                                     advance=1)))
+        else:
+            for course in courses:
+                progress.update(task_checking,
+                                advance=1)  # Update progressbar
 
-            robot.transform_urls_in_course(course.id, dryrun=dryrun)
-            # updates tr.transformation_report through Transformation instances
+                robot.transform_urls_in_course(course.id, dryrun=dryrun)
+                # updates tr.transformation_report through Transformation instances
 
     click.echo(f"Transformations completed ({dryrun=})")
     # conclusion
@@ -0,0 +1,146 @@
+"""
+Cache of Canvas users and their profiles, keyed by Canvas id, sis_login_id and email.
+Entries expire after a TTL, users not found are cached too (negative caching, shorter TTL).
+The entries are kept in memory and persisted in the LocalDAL table user_cache,
+so the cache survives across runs.
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+
+from attrs import define
+
+KEY_KINDS = ('id', 'sis_login_id', 'email')
+
+
+@define
+class CachedUser:
+    user_id: int | None
+    attributes: dict
+    profile: dict | None
+    found: bool
+    cached_at: datetime
+
+
+def user_attributes(user) -> dict:
+    """the JSON attributes of a canvasapi user or course (without requester and derived dates)"""
+    return {key: value for key, value in vars(user).items()
+            if not key.startswith('_') and not isinstance(value, datetime)}
+
+
+class UserCache:
+    """thread safe in memory, persisted by flush() (which only writes on the main thread)"""
+
+    def __init__(self, db=None,
+                 ttl: timedelta = timedelta(days=7),
+                 negative_ttl: timedelta = timedelta(hours=12)):
+        self.db = db
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries: dict[str, CachedUser] = {}
+        self.dirty: set[str] = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if db is not None:
+            self.load()
+
+    @staticmethod
+    def key(kind: str, value) -> str:
+        assert kind in KEY_KINDS, f"kind should be one of {KEY_KINDS}"
+        return f"{kind}:{str(value).lower()}"
+
+    def is_expired(self, entry: CachedUser) -> bool:
+        ttl = self.ttl if entry.found else self.negative_ttl
+        return datetime.now(timezone.utc) - entry.cached_at > ttl
+
+    def get(self, kind: str, value) -> CachedUser | None:
+        """:returns the cached entry (found is False for a known missing user)
+        or None if not cached or expired"""
+        with self.lock:
+            entry = self.entries.get(self.key(kind, value))
+            if entry is None or self.is_expired(entry):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def put_user(self, user, profile: dict | None = None, keys: tuple = ()) -> CachedUser:
+        """
+        cache a canvasapi user (and profile), under its id, login_id and email
+        :param user: canvasapi user
+        :param profile: result of user.get_profile() if available
+        :param keys: extra (kind, value) pairs the user was looked up with
+        """
+        attributes = user_attributes(user)
+        with self.lock:
+            old = self.entries.get(self.key('id', user.id))
+            if profile is None and old and old.found:
+                profile = old.profile
+            entry = CachedUser(user_id=user.id,
+                               attributes=attributes,
+                               profile=profile,
+                               found=True,
+                               cached_at=datetime.now(timezone.utc))
+            lookups = {('id', user.id), *keys}
+            login_id = (profile or {}).get('login_id') or attributes.get('login_id')
+            if login_id:
+                lookups.add(('sis_login_id', login_id))
+            email = (profile or {}).get('primary_email') or attributes.get('email')
+            if email:
+                lookups.add(('email', email))
+            for kind, value in lookups:
+                key = self.key(kind, value)
+                self.entries[key] = entry
+                self.dirty.add(key)
+        return entry
+
+    def put_missing(self, kind: str, value):
+        """remember that no user exists for this key"""
+        key = self.key(kind, value)
+        with self.lock:
+            self.entries[key] = CachedUser(user_id=None,
+                                           attributes={},
+                                           profile=None,
+                                           found=False,
+                                           cached_at=datetime.now(timezone.utc))
+            self.dirty.add(key)
+
+    def load(self):
+        """read the entries which have not expired yet from the db"""
+        db = self.db
+        oldest = datetime.now(timezone.utc) - max(self.ttl, self.negative_ttl)
+        rows = db(db.user_cache.cached_at > oldest.replace(tzinfo=None)).select()
+        with self.lock:
+            for row in rows:
+                self.entries[row.lookup_key] = CachedUser(user_id=row.user_id,
+                                                          attributes=row.attributes or {},
+                                                          profile=row.profile,
+                                                          found=row.found,
+                                                          cached_at=row.cached_at.replace(tzinfo=timezone.utc))
+
+    def flush(self):
+        """write the new entries to the db. Only on the main thread: workers
+        of a thread pool leave that to the code that started them"""
+        if self.db is None or threading.current_thread() is not threading.main_thread():
+            return
+        db = self.db
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            entries = [(key, self.entries[key]) for key in dirty]
+        for key, entry in entries:
+            db.user_cache.update_or_insert(db.user_cache.lookup_key == key,
+                                           lookup_key=key,
+                                           user_id=entry.user_id,
+                                           attributes=entry.attributes,
+                                           profile=entry.profile,
+                                           found=entry.found,
+                                           cached_at=entry.cached_at.replace(tzinfo=None))
+        db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.dirty = set()
+        if self.db is not None:
+            self.db(self.db.user_cache).delete()
+            self.db.commit()
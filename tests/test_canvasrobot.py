@@ -1,8 +1,19 @@
 
 import builtins
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from types import SimpleNamespace
 import pytest
 # import webview
-from canvasrobot.canvasrobot import Course2Foldername
+from canvasrobot.canvasrobot import Course2Foldername, CanvasRobot
+from canvasrobot.throttle import RateLimiter, run_throttled
+from canvasrobot.user_cache import UserCache
+from canvasrobot.downloader import Downloader
+from canvasrobot.file_store import FileStore
+from canvasrobot.search import SearchEngine
+from canvasrobot.pagination import read_ahead, apply_pagination_policy
+from canvasapi.paginated_list import PaginatedList
 from attrs import define
 """
 1. note that this is real live testing when interfacing with Canvas
@@ -181,3 +192,497 @@ def test_search_replace(cr):
             assert replace_text in page.body
     else:
         assert False, f"Source string '{search_text}' not found in any page of course {TEST_COURSE}"
+
+
+def test_run_throttled():
+    """all items are handled, errors are reported per item"""
+    def square(value):
+        if value == 3:
+            raise ValueError("three")
+        return value * value
+
+    limiter = RateLimiter(rate=1000)
+    results = {item: (result, error) for item, result, error
+               in run_throttled(square, range(6), max_workers=3, limiter=limiter)}
+    assert sorted(results) == list(range(6))
+    assert results[4] == (16, None)
+    assert isinstance(results[3][1], ValueError)
+
+
+def test_user_cache():
+    """users are found by id, login and email; missing users are cached until the (short) TTL ends"""
+    cache = UserCache(negative_ttl=timedelta(seconds=0))
+    cache.put_user(SimpleNamespace(id=30), profile={'login_id': 'u123', 'primary_email': 'A.B@example.com'})
+    assert cache.get('id', 30).user_id == 30
+    assert cache.get('sis_login_id', 'u123').user_id == 30
+    assert cache.get('email', 'a.b@example.com').user_id == 30
+    cache.put_missing('sis_login_id', 'nobody')
+    assert cache.get('sis_login_id', 'nobody') is None, "negative entry should have expired"
+
+
+def fake_download_session(content: bytes):
+    """requests session like object serving content, range requests included"""
+
+    class FakeResponse(SimpleNamespace):
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def iter_content(self, chunk_size):
+            return (self.body[i:i + chunk_size] for i in range(0, len(self.body), chunk_size))
+
+    def get(url, headers, **kwargs):
+        if 'Range' in headers:
+            offset = int(headers['Range'][len('bytes='):-1])
+            return FakeResponse(status_code=206, body=content[offset:])
+        return FakeResponse(status_code=200, body=content)
+    return SimpleNamespace(get=get)
+
+
+def test_downloader_resume_and_dedup(tmp_path):
+    """a partial download is resumed with a range request, equal content is stored once"""
+    content = b"0123456789" * 100
+    downloader = Downloader(tmp_path, chunk_size=64, max_workers=2)
+    downloader.session = fake_download_session(content)
+    (tmp_path / '1').mkdir()
+    (tmp_path / '1' / 'a.pdf.part').write_bytes(content[:300])
+    first = downloader.download('https://canvas/a', '1/a.pdf')
+    assert first.status == 200 and (tmp_path / '1' / 'a.pdf').read_bytes() == content
+    second = downloader.download('https://canvas/b', '2/a.pdf')
+    assert second.deduplicated and second.sha256 == first.sha256
+    assert (tmp_path / '2' / 'a.pdf').read_bytes() == content
+
+
+def test_file_store(tmp_path):
+    """equal documents share one stored file, damage is detected"""
+    store = FileStore(tmp_path / 'store')
+    first, second = tmp_path / 'a.pdf', tmp_path / 'b.pdf'
+    first.write_bytes(b"syllabus")
+    second.write_bytes(b"syllabus")
+    sha256 = store.add(first)
+    assert store.add(second) == sha256 and sha256 in store
+    assert first.samefile(second)
+    assert store.verify(sha256) is None
+    store.path_for(sha256).unlink()
+    assert store.verify(sha256).problem == 'missing'
+
+
+def test_file_store_corrupt_copy_replaced(tmp_path):
+    """a fresh download replaces a corrupt stored copy, instead of being overwritten by it"""
+    store = FileStore(tmp_path / 'store')
+    first = tmp_path / 'a.pdf'
+    first.write_bytes(b"syllabus")
+    sha256 = store.add(first)
+    first.unlink()
+    store.path_for(sha256).write_bytes(b"BAD!")  # damaged in the store
+    assert store.verify(sha256).problem == 'corrupt'
+    fresh = tmp_path / 'b.pdf'
+    fresh.write_bytes(b"syllabus")
+    assert store.add(fresh) == sha256
+    assert fresh.read_bytes() == b"syllabus" and store.verify(sha256) is None
+    store.remove(sha256)
+    assert sha256 not in store
+
+
+def test_download_not_linked_to_corrupt_copy(tmp_path):
+    """a download with the hash of a damaged stored copy is kept, and repairs the store"""
+    store = FileStore(tmp_path / 'store')
+    original = tmp_path / 'a.pdf'
+    original.write_bytes(b"syllabus")
+    sha256 = store.add(original)
+    original.unlink()
+    store.path_for(sha256).write_bytes(b"BAD!")
+    downloader = Downloader(tmp_path / 'documents', known_hashes={sha256: store.path_for(sha256)})
+    downloader.session = fake_download_session(b"syllabus")
+    result = downloader.download('https://canvas/a', '1/a.pdf')
+    assert not result.deduplicated and result.path.read_bytes() == b"syllabus"
+    assert store.add(result.path, result.sha256) == sha256 and store.verify(sha256) is None
+
+
+def test_search_engine():
+    """several terms in one pass; text and links are marked, replacements per term"""
+    engine = SearchEngine(['Blackboard', 'bb'], ignore_case=True)
+    html = '<p>Zie blackboard</p><a href="https://bb.uvt.nl">link</a><p>niets</p>'
+    assert engine.matches(html) and not engine.matches('<p>Canvas</p>')
+    assert engine.count(html) == {'Blackboard': 1, 'bb': 1}
+    count, marked = engine.mark(html)
+    assert count == 2 and '-&gt;blackboard&lt;-' in marked and "'bb' in a (href)-&gt;" in marked
+    count, replaced = engine.replace(html, {'Blackboard': 'Canvas', 'bb': 'canvas'})
+    assert count == 2 and replaced == '<p>Zie Canvas</p><a href="https://canvas.uvt.nl">link</a><p>niets</p>'
+
+
+def test_read_ahead():
+    """all pages are read (following the Link header), the policy only sets a missing per_page"""
+    calls = []
+
+    def request(method, url, _url=None, **params):
+        calls.append((url, params))
+        page = int(url.rsplit('=', 1)[1]) if '=' in url else 1
+        links = {'next': {'url': f"https://canvas/api/v1/items?page={page + 1}"}} if page < 3 else {}
+        return SimpleNamespace(json=lambda: [{'id': page * 10 + i} for i in range(2)], links=links)
+
+    requester = SimpleNamespace(request=request, base_url="https://canvas/api/v1/", new_quizzes_url="https://nq/")
+    apply_pagination_policy(requester, dict(items=50))
+    paginated = PaginatedList(lambda _, attributes: SimpleNamespace(**attributes), requester, 'GET', 'items')
+    assert [item.id for item in read_ahead(paginated)] == [10, 11, 20, 21, 30, 31]
+    assert calls[0] == ('items', {'per_page': 100}) and len(calls) == 3  # the canvasapi default
+    requester.request('GET', 'items')
+    requester.request('GET', 'items', per_page=20)
+    requester.request('GET', 'items', _kwargs=[('per_page', 30)])
+    assert [params.get('per_page') for _, params in calls[3:]] == [50, 20, None]
+
+
+def test_course_record():
+    """the includes of a course listing end up in the record, missing ones are None"""
+    listed = SimpleNamespace(id=7, name='Recht', term={'name': '2024-2025'},
+                             teachers=[{'id': 3, 'display_name': 'A. Docent'}], total_students=120)
+    record = CanvasRobot.course_record(listed)
+    assert (record.term, record.total_students, record.teachers[0]['id']) == ('2024-2025', 120, 3)
+    record = CanvasRobot.course_record(SimpleNamespace(id=8, name='Fiscaal'))
+    assert record.term == "" and record.teachers is None and record.total_students is None
+
+
+def test_write_course_ids_csv(tmp_path):
+    """harvested ids are merged with the ids already in the csv file"""
+    csv_path = tmp_path / 'course_ids_admin20.csv'
+    CanvasRobot.write_course_ids_csv(csv_path, [5, 3])
+    CanvasRobot.write_course_ids_csv(csv_path, [4, 5])
+    assert csv_path.read_text().split() == ['course_id', '3', '4', '5']
+
+
+def test_course_statistics():
+    """distributions per term, -1 (not authorised) is left out"""
+    pytest.importorskip("pandas")
+    from canvasrobot.course_stats import courses_frame, distributions
+    frame = courses_frame([(1, 20, '2024-2025', '2024', 100, 5, 20, 10, 2, 1, 30),
+                           (2, 20, '2024-2025', '2024', -1, 7, 30, 20, 4, 0, 10),
+                           (3, 25, '2023-2024', '2023', 50, 1, 2, 3, 0, 0, 5)])
+    stats = distributions(frame, by='term')
+    assert stats.loc['2024-2025', 'nr_pages_mean'] == 15
+    assert stats.loc['2024-2025', 'nr_students_count'] == 1
+
+
+def test_select_as(tmp_path):
+    """tuples and a streaming cursor instead of pydal Rows"""
+    from canvasrobot.canvasrobot_model import LocalDAL
+    db = LocalDAL(folder=str(tmp_path))
+    for course_id, name in ((1, 'Recht'), (2, 'Fiscaal')):
+        db.course.insert(course_id=course_id, name=name, ac_year='2024')
+    qry = db.course.ac_year == '2024'
+    assert db.select_as(qry, db.course.course_id, db.course.name, orderby=db.course.id) == [(1, 'Recht'), (2, 'Fiscaal')]
+    assert list(db.select_as(qry, db.course.course_id, orderby=db.course.id, mode='cursor')) == [(1,), (2,)]
+    assert db.select_as(qry, db.course.name, mode='rows').first().name == 'Recht'
+    db.close()
+
+
+class FakeSearchRobot:
+    """records the terms search_in_course passes on"""
+    console = SimpleNamespace(print=lambda *args, **kwargs: None)
+    canvas_url = "https://canvas"
+
+    def __init__(self):
+        self.calls = []
+
+    def course_search_replace_pages(self, course_id, **kwargs):
+        self.calls.append(kwargs)
+        return 0, [], ""
+
+
+@pytest.mark.parametrize("answers, search_term, replace_term", [
+    (['zoek', 'a', 'Blackboard;'], ['Blackboard'], ""),  # 'a' is too short: asked again
+    (['vervang', 'Blackboard;bb', 'x;y;z', 'Canvas;cv'], ['Blackboard', 'bb'], ['Canvas', 'cv']),
+    (['vervang', 'Blackboard;bb', 'Canvas'], ['Blackboard', 'bb'], 'Canvas'),
+])
+def test_search_in_course_terms(monkeypatch, answers, search_term, replace_term):
+    """one or several search terms end the prompt loop, the replacements match the terms"""
+    from canvasrobot import commandline_model
+    answers = iter(answers)
+    monkeypatch.setattr(commandline_model.Prompt, 'ask', lambda *args, **kwargs: next(answers))
+    monkeypatch.setattr(commandline_model, 'show_search_result', lambda **kwargs: None)
+    robot = FakeSearchRobot()
+    commandline_model.search_in_course(robot, single_course=5)
+    assert robot.calls[0]['search_term'] == search_term and robot.calls[0]['replace_term'] == replace_term
+    engine = SearchEngine(search_term)
+    assert engine.replace('Blackboard bb', engine.replacements_for(replace_term or "-"))[0] == len(search_term)
+
+
+def test_add_observer_to_education_report(tmp_path, capsys):
+    """observers are reported from the enrollment index, with their name"""
+    from canvasrobot.canvasrobot_model import LocalDAL
+    db = LocalDAL(folder=str(tmp_path))
+    db.course.insert(course_id=1, name='Recht', ac_year='2024')
+    db.enrollment_index.insert(user_id=9, course_id=1, role='ObserverEnrollment', user_name='O. Bserver')
+    db.enrollment_index.insert(user_id=8, course_id=1, role='StudentEnrollment', user_name='S. Tudent')
+    CanvasRobot.add_observer_to_education(SimpleNamespace(db=db, year=2024), 'u1', report_only=True)
+    out = capsys.readouterr().out
+    assert 'Recht: O. Bserver (n.a.)' in out and 'S. Tudent' not in out
+    db.close()
+
+
+def fake_canvas_transport(routes: dict, log: list):
+    """httpx transport serving Canvas like responses; a route value is a list:
+    the responses (status, json, headers) in turn, the last one repeated"""
+    import httpx
+
+    def handler(request):
+        key = request.url.path.removeprefix('/api/v1/') + ('?' + request.url.query.decode() if request.url.query else '')
+        log.append(key)
+        responses = routes[key.split('?')[0]] if key not in routes else routes[key]
+        status, body, headers = responses.pop(0) if len(responses) > 1 else responses[0]
+        return httpx.Response(status, json=body, headers=headers)
+    return httpx.MockTransport(handler)
+
+
+def test_async_canvas_paginate_and_retry():
+    """the Link next pages are followed; 429, 503 and a rate limit 403 are retried, a real 403 is not"""
+    import asyncio
+    import httpx
+    from canvasrobot.async_client import AsyncCanvas
+    log = []
+    next_link = {'Link': '<https://canvas/api/v1/courses/1/files?page=2&per_page=100>; rel="next"'}
+    routes = {'courses/1/files?per_page=100': [(429, {}, {}), (200, [{'id': 1}, {'id': 2}], next_link)],
+              'courses/1/files?page=2&per_page=100': [(503, {}, {}), (200, [{'id': 3}], {})],
+              'courses/1': [(403, 'Rate Limit Exceeded', {}), (200, {'id': 1}, {})],
+              'courses/2': [(403, {'errors': 'unauthorized'}, {})]}
+
+    async def run():
+        async with AsyncCanvas("https://canvas", "key", rate=0, backoff=0,
+                               policy=dict(files=100), transport=fake_canvas_transport(routes, log)) as canvas:
+            files = await canvas.get_files(1)
+            course = await canvas.get_course(1)
+            with pytest.raises(httpx.HTTPStatusError):
+                await canvas.get_course(2)
+            return files, course, canvas.requests
+
+    files, course, requests_count = asyncio.run(run())
+    assert [file['id'] for file in files] == [1, 2, 3] and course == {'id': 1}
+    assert requests_count == 7 and log.count('courses/2') == 1
+
+
+def test_search_pages_all_courses_async(tmp_path):
+    """the pages of all courses are searched, the hits written to the report"""
+    import asyncio
+    from rich.console import Console
+    from canvasrobot.async_client import AsyncCanvas
+    routes = {'courses': [(200, [{'id': 1, 'name': 'Recht'},
+                                 {'id': 2, 'name': 'Student', 'enrollments': [{'role': 'StudentEnrollment'}]}], {})],
+              'courses/1/pages': [(200, [{'url': 'p', 'title': 'Intro', 'body': '<p>Zie Blackboard</p>'},
+                                         {'url': 'q', 'title': 'Rest', 'body': '<p>niets</p>'}], {})]}
+    robot = SimpleNamespace(canvas_url="https://canvas", console=Console(file=open(tmp_path / 'log', 'w')),
+                            async_canvas=lambda: AsyncCanvas("https://canvas", "key", rate=0,
+                                                             transport=fake_canvas_transport(routes, [])))
+    report_path = tmp_path / 'report.html'
+    count, pages, bodies = asyncio.run(CanvasRobot.search_pages_all_courses_async(robot, 'blackboard',
+                                                                                  report_path=report_path))
+    assert (count, pages, bodies) == (1, [(1, 'Recht', 'p', 'Intro')], "")
+    assert '-&gt;Blackboard&lt;-' in report_path.read_text()
+
+
+def test_resolve_teacher_logins_from_cache():
+    """a teacher cached without profile is resolved by its login_id; a failed profile is reported"""
+    cache = UserCache()
+    cache.put_user(SimpleNamespace(id=1, name='T. Eacher', login_id='u1', email='t@example.com',
+                                   sortable_name='Eacher, T.'))
+
+    def get_profile(teacher):
+        raise ValueError("timeout")
+
+    robot = SimpleNamespace(user_cache=cache, get_profile=get_profile, max_workers=2,
+                            rate_limiter=None, errors=[],
+                            set_profile_attributes=CanvasRobot.set_profile_attributes)
+    teachers = [SimpleNamespace(id=1, name='T. Eacher'), SimpleNamespace(id=2, name='N. Ew')]
+    CanvasRobot.resolve_teacher_logins(robot, SimpleNamespace(name='Recht'), teachers)
+    assert (teachers[0].login_id, teachers[0].email) == ('u1', 't@example.com')
+    assert teachers[0].sortable_name == 'Eacher, T.'
+    assert teachers[1].login_id == "n.a."
+    assert 'Recht' in robot.errors[0] and 'timeout' in robot.errors[0]
+
+
+def test_update_db_teachers_keeps_names(tmp_path):
+    """a teacher without a parsable sortable_name does not blank the stored names"""
+    from canvasrobot.canvasrobot_model import LocalDAL
+    db = LocalDAL(folder=str(tmp_path))
+    db.user.insert(username='u1', first_name='Wim', last_name='Klein', prefix='', role='T')
+
+    def resolve_teacher_logins(course, teachers):
+        for teacher in teachers:
+            teacher.login_id, teacher.email = 'u1', 'w@example.com'
+
+    robot = SimpleNamespace(db=db, requester=None, resolve_teacher_logins=resolve_teacher_logins,
+                            parse_sortable_name=CanvasRobot.parse_sortable_name)
+    result = CanvasRobot.update_db_teachers(robot, SimpleNamespace(name='Recht', id=1),
+                                            listed_teachers=[dict(id=5, display_name='Wim Klein')])
+    assert result.ok_value[0] == ['u1']
+    row = db(db.user.username == 'u1').select().first()
+    assert (row.first_name, row.last_name, row.email) == ('Wim', 'Klein', 'w@example.com')
+    db.close()
+
+
+def test_get_enrolled_logins_without_login_id():
+    """without admin rights the login_ids of the enrolled students come from their profiles"""
+    profiles = {2: {'login_id': 'u2'}, 3: {}}
+
+    def enrollment(user_id, **user):
+        return SimpleNamespace(user_id=user_id, user=dict(id=user_id, name=f"S{user_id}", **user))
+
+    course = SimpleNamespace(name='Community',
+                             get_enrollments=lambda **kwargs: [enrollment(1, login_id='u1'),
+                                                               enrollment(2), enrollment(3)])
+    robot = SimpleNamespace(requester=None, get_profile=lambda user: profiles[user.id],
+                            max_workers=2, rate_limiter=None, errors=[], user_cache=UserCache())
+    assert CanvasRobot.get_enrolled_logins(robot, course) == {'u1', 'u2'}
+    assert len(robot.errors) == 1 and 'S3' in robot.errors[0]
+
+
+@pytest.mark.parametrize("force_update, checked", [(False, True), (True, False)])
+def test_db_auto_update_skipped_when_forced(tmp_path, force_update, checked):
+    """the first use of the db checks for an update, unless a forced update is the one using it"""
+    robot = CanvasRobot.__new__(CanvasRobot)
+    robot.is_testing, robot.fake_migrate_all, robot.db_folder = False, False, str(tmp_path)
+    robot.db_auto_update, robot.db_force_update = True, force_update
+    calls = []
+    robot.auto_update_db = calls.append
+    assert robot.db is not None
+    assert bool(calls) == checked
+    robot.db.close()
+
+
+def test_folder_index_cache_bounded(monkeypatch):
+    """the folder indexes of the least recently used courses are dropped"""
+    monkeypatch.setattr('canvasrobot.canvasrobot.MAX_FOLDER_INDEXES', 2)
+    robot = CanvasRobot.__new__(CanvasRobot)
+    robot.folder_indexes = OrderedDict()
+    robot.folder_indexes_lock = threading.Lock()
+    courses = [SimpleNamespace(id=course_id, get_folders=list) for course_id in (1, 2, 3)]
+    robot.get_folder_index(courses[0])
+    robot.get_folder_index(courses[1])
+    robot.get_folder_index(courses[0])  # most recently used
+    robot.get_folder_index(courses[2])
+    assert list(robot.folder_indexes) == [1, 3]
+    results = list(run_throttled(robot.get_folder_index, courses * 20, max_workers=4))
+    assert all(error is None for _, _, error in results) and len(robot.folder_indexes) == 2
+
+
+@pytest.mark.parametrize("concurrent", [True, False])
+def test_cleanup_community_continues_after_error(concurrent):
+    """a student that can't be validated is reported, the others are still handled"""
+    def request(method, url, _url=None, **params):
+        return SimpleNamespace(json=lambda: [dict(id=user_id, user=dict(id=user_id, name=name))
+                                             for user_id, name in ((1, 'A'), (2, 'B'), (3, 'C'))],
+                               links={})
+
+    requester = SimpleNamespace(request=request, base_url="https://canvas/api/v1/", new_quizzes_url="https://nq/")
+
+    def is_user_valid(user):
+        if user['id'] == 1:
+            raise ValueError("profile not retrieved")
+        return user['id'] != 3, "no longer a student"
+
+    course = SimpleNamespace(get_enrollments=lambda **kwargs: PaginatedList(
+        lambda _, attributes: SimpleNamespace(**attributes), requester, 'GET', 'enrollments'))
+    robot = SimpleNamespace(get_course=lambda course_id: course, is_user_valid=is_user_valid,
+                            user_cache=UserCache(), max_workers=2, rate_limiter=None)
+    removed, errors, msg = CanvasRobot.cleanup_community(robot, 5, report_only=True, concurrent=concurrent)
+    assert removed == [('C', "no longer a student")]
+    assert len(errors) == 1 and 'A not retrieved' in errors[0]
+
+
+def test_is_teacher_canvas_account_courses_only(tmp_path):
+    """only a teacher enrollment in a course of the account counts, the account listing is the fallback"""
+    from canvasrobot.canvasrobot_model import LocalDAL
+    db = LocalDAL(folder=str(tmp_path))
+    db.course.insert(course_id=1, name='Recht', ac_year='2024')
+    db.enrollment_index.insert(user_id=7, course_id=1, role='TeacherEnrollment')
+    db.enrollment_index.insert(user_id=8, course_id=99, role='TeacherEnrollment')  # other account
+    listed = []
+    admin = SimpleNamespace(get_courses=lambda by_teachers: listed.append(by_teachers) or [])
+    robot = SimpleNamespace(db=db, admin=admin)
+    assert CanvasRobot.is_teacher_canvas(robot, SimpleNamespace(id=7)) and listed == []
+    assert not CanvasRobot.is_teacher_canvas(robot, SimpleNamespace(id=8)) and listed == [[8]]
+    db.close()
+
+
+def test_local_db_indexes(tmp_path):
+    """the lookup columns are indexed, opening the db again keeps them"""
+    from canvasrobot.canvasrobot_model import LocalDAL
+    LocalDAL(folder=str(tmp_path)).close()
+    db = LocalDAL(folder=str(tmp_path))
+    names = {row[0] for row in db.executesql("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert {'enrollment_index_user_id', 'enrollment_index_course_id', 'user_cache_lookup_key'} <= names
+    plan = db.executesql("EXPLAIN QUERY PLAN SELECT * FROM user_cache WHERE lookup_key = 'id:1'")
+    assert 'user_cache_lookup_key' in str(plan)
+    db.close()
+
+
+def test_lazy_user_cache_created_once(tmp_path):
+    """workers which all use the user cache first share one instance"""
+    robot = CanvasRobot.__new__(CanvasRobot)
+    robot.is_testing, robot.fake_migrate_all, robot.db_folder = False, False, str(tmp_path)
+    robot.db_auto_update, robot.db_force_update = False, False
+    caches = [cache for _, cache, _ in run_throttled(lambda _: robot.user_cache, range(16), max_workers=8)]
+    assert len({id(cache) for cache in caches}) == 1 and caches[0] is robot.user_cache
+
+
+def test_download_known_copy_removed(tmp_path):
+    """a known copy removed meanwhile (like a received transfer file) does not lose the download"""
+    downloader = Downloader(tmp_path / 'transfer')
+    downloader.session = fake_download_session(b"syllabus")
+    first = downloader.download('https://canvas/a', '1/a.pdf')
+    store = FileStore(tmp_path / 'store')
+    store.add(first.path, first.sha256)
+    downloader.remember(first.sha256, store.path_for(first.sha256))
+    first.path.unlink()
+    second = downloader.download('https://canvas/b', '2/a.pdf')
+    assert second.deduplicated and second.path.samefile(store.path_for(first.sha256))
+    store.remove(first.sha256)  # gone, not remembered
+    third = downloader.download('https://canvas/c', '3/a.pdf')
+    assert not third.deduplicated and third.path.read_bytes() == b"syllabus"
+    # removed between the exists() check and the link
+    assert not downloader.link_known(tmp_path / 'gone.pdf', first.sha256, tmp_path / 'x.pdf')
+
+
+def test_harvest_course_ids_without_rights():
+    """without account rights only the user's own courses in the account are harvested"""
+    import canvasapi
+
+    def request(method, url, _url=None, **params):
+        if url.startswith('accounts/'):
+            raise canvasapi.exceptions.Forbidden("user not authorized")
+        courses = [dict(id=1, account_id=20), dict(id=2, account_id=25), dict(id=3, account_id=20)]
+        return SimpleNamespace(json=lambda: courses, links={})
+
+    requester = SimpleNamespace(request=request, base_url="https://canvas/api/v1/", new_quizzes_url="https://nq/")
+    canvas = SimpleNamespace(get_courses=lambda: PaginatedList(
+        lambda _, attributes: SimpleNamespace(**attributes), requester, 'GET', 'courses'))
+    robot = SimpleNamespace(requester=requester, canvas=canvas, max_workers=2, rate_limiter=None)
+    assert CanvasRobot.harvest_course_ids(robot, 20) == [1, 3]
+
+
+def test_hydrate_courses_cache(tmp_path):
+    """courses are requested concurrently once, repeated runs use the cache until it expires"""
+    from canvasrobot.canvasrobot_model import LocalDAL
+    db = LocalDAL(folder=str(tmp_path))
+    requested = []
+    barrier = threading.Barrier(3, timeout=5)  # breaks if the three courses are requested one by one
+
+    def get_course(course_id, include):
+        requested.append(course_id)
+        if course_id == 4:
+            raise ValueError("not found")
+        if barrier:
+            barrier.wait()
+        return SimpleNamespace(id=course_id, name=f"Course {course_id}", term={'name': '2024-2025'})
+
+    robot = SimpleNamespace(db=db, canvas=SimpleNamespace(get_course=get_course), max_workers=4,
+                            rate_limiter=None, errors=[], requester=None)
+    courses = CanvasRobot.hydrate_courses(robot, [3, 1, 4, 2])
+    assert [course.id for course in courses] == [3, 1, 2] and sorted(requested) == [1, 2, 3, 4]
+    assert len(robot.errors) == 1 and 'Course 4' in robot.errors[0]
+    barrier, requested[:] = None, []
+    courses = CanvasRobot.hydrate_courses(robot, [1, 2, 3])
+    assert requested == [] and courses[0].name == 'Course 1' and courses[0].term['name'] == '2024-2025'
+    CanvasRobot.hydrate_courses(robot, [1, 2], max_age=timedelta(0))  # expired
+    assert sorted(requested) == [1, 2]
+    db.close()